@@ -0,0 +1,95 @@
+import asyncio
+import collections
+import contextlib
+
+
+class AffinityPool:
+    """
+    Connection pool that hands out connections already on the database of the query.
+
+    Idle connections are kept per current database. A query gets an idle
+    connection of its database, else a new connection while the pool is not
+    full, else the idle connection of another database unused for the longest
+    time, which is then switched with select_db. The database of a connection
+    only changes when no connection of the right database is free.
+
+    A connection closed while it was in use is dropped from the pool.
+    """
+
+    def __init__(self, connect, maxsize):
+        """
+        Args:
+          connect: Coroutine function opening a new connection.
+          maxsize: Maximum number of open connections.
+        """
+        self.maxsize = maxsize
+        self.size = 0
+        self.switch_count = 0
+        self.closed = False
+        self._connect = connect
+        self._slots = asyncio.Semaphore(maxsize)
+        # Idle connections in the order they were released, by current database
+        self._idle = collections.OrderedDict()
+
+    @property
+    def freesize(self):
+        """Number of idle connections."""
+        return len(self._idle)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, database=None):
+        """
+        Get a connection on a database for the time of the block.
+
+        Args:
+          database: Database the connection must be on, None for any database.
+        """
+        async with self._slots:
+            connection, current = await self._take(database)
+            try:
+                if database is not None and current != database:
+                    await connection.select_db(database)
+                    self.switch_count = self.switch_count + 1
+                    current = database
+                yield connection
+            finally:
+                self._release(connection, current)
+
+    async def _take(self, database):
+        for connection, current in self._idle.items():
+            if database is None or current == database:
+                del self._idle[connection]
+                return connection, current
+        if self.size < self.maxsize:
+            self.size = self.size + 1
+            try:
+                return await self._connect(), None
+            except BaseException:
+                self.size = self.size - 1
+                raise
+        # The pool is full and a slot is free, so another database has an idle connection
+        connection, current = self._idle.popitem(last=False)
+        return connection, current
+
+    def _release(self, connection, database):
+        if self.closed:
+            connection.close()
+        if connection.closed:
+            self.size = self.size - 1
+            return
+        self._idle[connection] = database
+
+    async def clear(self):
+        """Close the idle connections."""
+        while self._idle:
+            connection, _ = self._idle.popitem(last=False)
+            self.size = self.size - 1
+            await connection.ensure_closed()
+
+    def close(self):
+        """Close the idle connections, connections in use are closed when they are released."""
+        self.closed = True
+        while self._idle:
+            connection, _ = self._idle.popitem(last=False)
+            self.size = self.size - 1
+            connection.close()
@@ -1,21 +1,44 @@
 import boto3
 import configparser
 import json
-import gzip
 import csv
-import os
 from botocore.exceptions import ClientError
-import ast
 from datetime import datetime
-from hashlib import blake2b
-import re
 import uvloop
 import aiomysql
+from pymysql.constants import CLIENT
 import traceback
 import io
+import os
+import collections
+import contextlib
+import itertools
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import asyncio
 
+from affinity_pool import AffinityPool
+from audit_log import parse_chunk, read_chunks, record_time, select_logs
+from concurrency import AdaptiveConcurrency
+from endpoint_router import EndpointRouter, RoutedPool
+from latency import LatencyReport
+from pacing import ReplaySchedule
+from query_runner import (CODE_ERROR, CODE_SUCCESS, CODE_TIMEOUT, CODE_UNAVAILABLE, CODE_WARNING, QueryRunner,
+                          is_transient_error)
+from rate_limiter import TokenBucket
+from read_ahead import ReadAhead
+from replay_policy import ReplayPolicy
+from resources import ResourceManager
+from s3_stream import open_gzip_object
+from sql_sample import FINDINGS_REPORTER, OWNER, claim_sql_sample, write_sql_sample
+from sqs_heartbeat import VisibilityHeartbeat
+from static_analyzer import ERROR, WARNING
+from validation import (COMPARE, EXECUTE, EXECUTE_PREPARED, EXECUTING_MODES, EXPLAIN, PREPARE, group_by_database,
+                        replayable_statements, session_init_statements)
+from verdict_store import PASS, VerdictStore
+
 def read_config(path):
     """
     Initialize the global configuration file.
@@ -33,116 +56,334 @@ queue_url = config.get('DEFAULT', 'queue_url')
 subtask_dynamodb_name = config.get('DEFAULT', 'subtask_dynamodb_name')
 sql_sample_dynamodb_name = config.get('DEFAULT', 'sql_sample_dynamodb_name')
 secrets_name = config.get('DEFAULT', 'secret_name')
+verdict_dynamodb_name = config.get('DEFAULT', 'verdict_dynamodb_name', fallback='')
 
+# Default ceiling of the queries in flight against the target, a task may set its own
 max_concurrency = 20
 
-total_count = 0
-error_query = []
-warning_query = []
-sample_query = []
+# MySQL error code of refused credentials, the secret is read again in case it was rotated
+ACCESS_DENIED_ERROR = 1045
+
+# Seconds a replayed query may run on the target, the agent gives up on the connection after a grace period
+query_timeout = config.getint('DEFAULT', 'query_timeout', fallback=60)
+
+# Number of queries of the same database checked in one round trip by the explain and prepare modes
+validation_batch_size = config.getint('DEFAULT', 'validation_batch_size', fallback=20)
+
+# Number of statements kept prepared on each connection by the execute_prepared mode
+prepared_statement_cache_size = config.getint('DEFAULT', 'prepared_statement_cache_size', fallback=64)
+
+# Seconds between two updates of the share of a task's max_qps taken by a subtask
+qps_refresh_interval = config.getint('DEFAULT', 'qps_refresh_interval', fallback=10)
+
+# Number of processes parsing the audit log, one per vCPU by default
+parse_workers = config.getint('DEFAULT', 'parse_workers', fallback=os.cpu_count())
+parse_chunk_size = 4 * 1024 * 1024
+parse_pool = None
+
+# Number of subtasks a worker processes at the same time
+max_inflight_subtasks = config.getint('DEFAULT', 'max_inflight_subtasks', fallback=2)
+
+# Number of subtasks received ahead, their object is downloaded and parsed while the others replay
+prefetch_subtasks = config.getint('DEFAULT', 'prefetch_subtasks', fallback=1)
+
+# Number of parsed chunks of a file kept ahead of the replay
+read_ahead_chunks = config.getint('DEFAULT', 'read_ahead_chunks', fallback=8)
+
+# Number of threads writing the fingerprint samples of the subtasks to DynamoDB
+sample_write_workers = config.getint('DEFAULT', 'sample_write_workers', fallback=8)
+
+# Number of threads of the event loop running the blocking calls (S3, DynamoDB, parsing) of the replays
+io_workers = config.getint('DEFAULT', 'io_workers', fallback=16)
+
+# Seconds a received message stays invisible, extended by a heartbeat while its subtask is processed
+visibility_timeout = config.getint('DEFAULT', 'visibility_timeout', fallback=300)
+
+# Number of times a failing subtask is attempted before it is marked Failed
+max_receive_count = config.getint('DEFAULT', 'max_receive_count', fallback=3)
+
+# Seconds the credentials of the validate cluster are cached
+secret_ttl = config.getint('DEFAULT', 'secret_ttl', fallback=300)
+
+# Seconds the connections of an endpoint are kept open while no subtask uses them
+pool_idle_timeout = config.getint('DEFAULT', 'pool_idle_timeout', fallback=600)
 
 # Initialize a session using Amazon SQS
 sqs = boto3.client('sqs', region_name=region)
 
-# Initialize a session using Amazon DynamoDB
-dynamodb = boto3.resource('dynamodb', region_name=region)
-subtask_table = dynamodb.Table(subtask_dynamodb_name)
-sql_sample_table = dynamodb.Table(sql_sample_dynamodb_name)
+# Event loop, connection pools, clients and credentials shared by the subtasks for the life of the agent
+resources = ResourceManager(load_secret=lambda: get_secret_from_secret_manager(secrets_name),
+                            make_client=lambda name: boto3.session.Session().client(name, region_name=region),
+                            secret_ttl=secret_ttl,
+                            pool_idle_timeout=pool_idle_timeout,
+                            io_workers=io_workers)
+
+# Runs the replayed queries, the statements it prepares on a connection are kept from one subtask to the next
+runner = QueryRunner(query_timeout=query_timeout, prepared_statement_cache_size=prepared_statement_cache_size)
+
+# DynamoDB resources are not thread safe, each worker thread gets its own
+thread_local = threading.local()
+
+# Serialize the read-modify-write of the reports shared by the subtasks of a task
+report_lock = threading.Lock()
+
+# Replays in flight, a prefetched subtask waits for a free slot once its object is being parsed
+replay_slots = threading.Semaphore(max_inflight_subtasks)
+
+# Threads writing the samples of the subtasks, shared by the worker threads, they start at the first write
+sample_writers = ThreadPoolExecutor(max_workers=sample_write_workers, thread_name_prefix='sample-write')
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 def log(message, key=''):
     time_string = datetime.now().strftime("%H:%M:%S")
-    print(f'--- {time_string} --- {key}: {message}')
+    print(f'--- {time_string} --- [{threading.current_thread().name}] {key}: {message}')
+
+# get the DynamoDB table of the current thread
+def get_table(table_name):
+    tables = getattr(thread_local, 'tables', None)
+    if tables is None:
+        # Initialize a session using Amazon DynamoDB
+        thread_local.dynamodb = boto3.session.Session().resource('dynamodb', region_name=region)
+        tables = thread_local.tables = {}
+    if table_name not in tables:
+        tables[table_name] = thread_local.dynamodb.Table(table_name)
+    return tables[table_name]
+
+# get the S3 client, clients are thread safe and shared by the worker threads
+def get_s3_client():
+    return resources.client('s3')
+
+class SubtaskState:
+    """
+    Results collected while one subtask is processed.
 
-# process each message (a subtask)
-def process_message(message):
-    # global db_connection
-    global total_count, error_query, warning_query, sample_query
+    Each subtask in flight has its own state so several subtasks can be
+    processed at the same time by the worker threads.
+    """
+
+    def __init__(self):
+        self.total_count = 0
+        self.error_query = []
+        self.warning_query = []
+        self.timeout_query = []
+        self.diff_query = []
+        self.pace = None
+        self.sample_query = []
+        self.sql_count = {}
+        # Claims of the subtask by fingerprint, as the owner replaying it and as the reporter of its findings
+        self.owned = {}
+        self.findings_owned = {}
+        self.static_errors = set()
+        self.replay_count = 0
+        self.unavailable_count = 0
+        self.replay_policy = ReplayPolicy()
+        self.verdicts = None
+        self.latency = None
+        # Set once the counters and the report rows of the subtask start being added, they would be added twice by a retry
+        self.writes_started = False
 
+# process each message (a subtask)
+def process_message(message, final_attempt=False):
     # parse message
     sub_task = json.loads(message)
     task_id = sub_task['task_id']
     log(message=f'****{task_id}', key='task_id')
+    s3_object_key = sub_task['s3_object_key']
+
+    # update subtask status to In-progress
+    update_result = update_subtask_status(task_id, s3_object_key, status='In-progress', condition_status='Created')
+
+    if update_result == False:
+        return
+    
+    log('done', key='update_subtask_status')
+
+    state = SubtaskState()
+    try:
+        check_subtask(sub_task, state)
+    except Exception:
+        if not final_attempt and not state.writes_started:
+            # Hand the subtask back so the released message is processed again
+            update_subtask_status(task_id, s3_object_key, 'Created', 'In-progress')
+            raise
+        # Out of attempts, or a retry would add the counters and report rows written so far a second time,
+        # the message is deleted
+        update_subtask_status(task_id, s3_object_key, 'Failed', 'In-progress')
+        print(f"Subtask {s3_object_key} failed")
+        traceback.print_exc()
+
+# check the queries of a subtask that is In-progress
+def check_subtask(sub_task, state):
+    task_id = sub_task['task_id']
     cluster_identifier = sub_task['cluster_identifier']
     validate_cluster_endpoint = sub_task.get('validate_cluster_endpoint','')
     s3_bucket_name = sub_task['s3_bucket']
     s3_object_key = sub_task['s3_object_key']
     check_percent = sub_task['check_percent'] # int from 1 to 10
     rerun = sub_task.get('rerun', False)
+    validate_mode = sub_task.get('validate_mode', EXECUTE)
+    replay_statements = replayable_statements(validate_mode) if rerun else ()
+    normalizer_version = sub_task.get('normalizer_version', 1)
+    state.replay_policy = ReplayPolicy(max_variants=sub_task.get('max_replay_variants', 0),
+                                       stop_after_successes=sub_task.get('stop_after_successes', 0))
+    if rerun and verdict_dynamodb_name:
+        # Fingerprints that passed on the same target in an earlier task are not replayed again
+        state.verdicts = VerdictStore(get_verdict, validate_cluster_endpoint, validate_mode,
+                                      revalidate=sub_task.get('revalidate', False))
+    if rerun and validate_mode in EXECUTING_MODES:
+        state.latency = LatencyReport(regression_percent=sub_task.get('latency_regression_percent', 50))
+
+    # The fingerprints are claimed by the threads pulling the logs, each thread has its own DynamoDB table
+    def claim(log, attribute=OWNER):
+        return claim_sql_sample(get_table(sql_sample_dynamodb_name), task_id, s3_object_key, log, attribute)
+
+    # The object is downloaded and parsed ahead from now on, while the subtask waits for a replay slot
+    chunks = ReadAhead(lambda: parse_s3_file(s3_bucket_name, s3_object_key, replay_statements, normalizer_version),
+                       size=read_ahead_chunks, name=f'{threading.current_thread().name}-read-ahead').start()
+    try:
+        with replay_slots:
+            # Replay candidates are produced while the file is parsed
+            logs = select_logs(state, chunks, check_percent, claim=claim,
+                               report_findings=lambda state, log, findings: report_findings(
+                                   state, log, findings, claim=lambda log: claim(log, FINDINGS_REPORTER)))
+            replay_subtask(sub_task, state, logs)
+    finally:
+        chunks.close()
 
-    total_count = 0
-    error_query = []
-    warning_query = []
-    sample_query = []
+    log('done', key='select_logs')
 
-    # update subtask status to In-progress
-    update_result = update_subtask_status(task_id, s3_object_key, status='In-progress', condition_status='Created')
+    log(sum(state.replay_policy.skipped.values()), key='skipped replay count')
+
+    # The claims and verdicts written so far are the same when the subtask is retried, the writes from now on are not
+    state.writes_started = True
+    insert_sql_sample(task_id, state)
+
+    log('done', key='insert_samples')
+
+    report_key = f'report/{task_id}_{cluster_identifier}/'
+    if len(state.error_query) > 0:
+        export_report(bucket_name=s3_bucket_name, report_type='error', prefix=report_key, data=state.error_query)
+    if len(state.warning_query) > 0:
+        export_report(bucket_name=s3_bucket_name, report_type='warning', prefix=report_key, data=state.warning_query)
+    if len(state.timeout_query) > 0:
+        export_report(bucket_name=s3_bucket_name, report_type='timeout', prefix=report_key, data=state.timeout_query)
+    if state.latency is not None:
+        latency_rows = state.latency.rows({sample['sql_hash']: sample['sql_mask'] for sample in state.sample_query})
+        if len(latency_rows) > 0:
+            export_report(bucket_name=s3_bucket_name, report_type='latency', prefix=report_key, data=latency_rows)
+    if len(state.diff_query) > 0:
+        export_report(bucket_name=s3_bucket_name, report_type='diff', prefix=report_key, data=state.diff_query)
+    if state.pace is not None:
+        export_report(bucket_name=s3_bucket_name, report_type='pace', prefix=report_key, data=[state.pace])
 
+    log('done', key='export_report')
+
+    # update subtask status to Completed
+    update_result = update_subtask_status(task_id, s3_object_key, 'Completed', 'In-progress', total_count=state.total_count, error_count=len(state.error_query), warning_count=len(state.warning_query), timeout_count=len(state.timeout_query))
     if update_result == False:
         return
-    
-    log('done', key='update_subtask_status')
 
-    logs = load_and_unzip_s3_file(s3_bucket_name, s3_object_key, check_percent, rerun)
+    log('done', key='update_subtask_status')
 
-    log('done', key='load_and_unzip_s3_file')
-    log(len(logs), key='logs size')
+# replay the logs of a subtask on the validate cluster, or only run through them when nothing is replayed
+def replay_subtask(sub_task, state, logs):
+    task_id = sub_task['task_id']
+    validate_cluster_endpoint = sub_task.get('validate_cluster_endpoint','')
+    s3_object_key = sub_task['s3_object_key']
+    rerun = sub_task.get('rerun', False)
+    validate_mode = sub_task.get('validate_mode', EXECUTE)
+    baseline_cluster_endpoint = sub_task.get('baseline_cluster_endpoint', '')
 
     if rerun:
-        crednetials = get_secret_from_secret_manager(secrets_name)
+        # Fail the subtask rather than its queries when the secret cannot be read, it is cached for the connections
+        resources.secret()
         log('done', key='get_secret_from_secret_manager')
 
+        # The credentials are added when a connection is opened, see connect
         db_config = {
             'host': validate_cluster_endpoint,
-            'user': crednetials['username'],
-            'password': crednetials['password'],
             'charset': 'utf8mb4',
-            'cursorclass': aiomysql.DictCursor
+            # Rows are streamed and dropped unread when the cursor is closed, a result set is never held in memory
+            'cursorclass': aiomysql.SSCursor,
+            'init_statements': session_init_statements(validate_mode, query_timeout)
         }
-
-        results = asyncio.run(run_tasks_with_semaphore(logs=logs, 
-                                                    max_concurrency=max_concurrency, 
-                                                    task_id=task_id, 
-                                                    check_percent=check_percent,
-                                                    db_config=db_config))
-        
-        log('done', key='run_tasks_with_semaphore')
-        log(len(results), key='result count')
+        if validate_mode in (EXPLAIN, PREPARE, EXECUTE_PREPARED):
+            # The queries checked without being run are sent in batches of statements, the literals
+            # of a prepared statement are set in the same round trip as its execution. The raw query
+            # text is run alone in the other modes, nothing after a ';' in it may run.
+            db_config['client_flag'] = CLIENT.MULTI_STATEMENTS
+        baseline_db_config = None
+        if baseline_cluster_endpoint and state.latency is not None:
+            # The source cluster runs the same queries with the same credentials to compare the latencies
+            baseline_db_config = dict(db_config, host=baseline_cluster_endpoint)
+        compare_db_configs = {}
+        if validate_mode == COMPARE:
+            # The result rows of each query are compared with the ones of these clusters, with the same credentials
+            compare_db_configs = {endpoint: dict(db_config, host=endpoint)
+                                  for endpoint in sub_task.get('compare_cluster_endpoints', [])}
+
+        qps_share = None
+        if sub_task.get('max_qps', 0) > 0:
+            # The subtasks In-progress share the queries per second of the task
+            qps_share = lambda: get_qps_share(task_id, sub_task['max_qps'])
+
+        schedule = None
+        if sub_task.get('replay_speed', 0) > 0 and validate_mode in EXECUTING_MODES:
+            # The queries are sent at the pace they were recorded, on one replay session per recorded connection
+            schedule = ReplaySchedule(speed=sub_task['replay_speed'])
+
+        # Equivalent endpoints (readers, clones) share the replay of the subtask
+        endpoints = [validate_cluster_endpoint]
+        for endpoint in sub_task.get('validate_cluster_endpoints', []):
+            if endpoint not in endpoints:
+                endpoints.append(endpoint)
+
+        # The replay runs on the agent's event loop, so the connections it opens are reused by the next subtasks
+        results = resources.run(run_replay_workers(state=state,
+                                                   logs=logs,
+                                                   endpoints=endpoints,
+                                                   max_concurrency=sub_task.get('max_concurrency', max_concurrency),
+                                                   validate_mode=validate_mode,
+                                                   db_config=db_config,
+                                                   baseline_db_config=baseline_db_config,
+                                                   compare_db_configs=compare_db_configs,
+                                                   schedule=schedule,
+                                                   qps_share=qps_share))
+        if schedule is not None:
+            state.pace = dict(s3_object_key=s3_object_key, **schedule.summary())
+            log(state.pace, key='replay pace')
+
+        log('done', key='run_replay_workers')
+        log(state.replay_count, key='replay count')
+        log(len(results), key='failed result count')
 
         for result in results:
             if result is not None:
                 code = result.get('code', 0)
-                if code == 2:
-                    error_query.append(result)
+                if code == CODE_ERROR:
+                    state.error_query.append(result)
+                elif code == CODE_WARNING:
+                    state.warning_query.append(result)
+                elif code == CODE_TIMEOUT:
+                    state.timeout_query.append(result)
+                elif code == CODE_UNAVAILABLE:
+                    state.unavailable_count = state.unavailable_count + 1
+        log(state.unavailable_count, key='unavailable count')
+
+        if state.verdicts is not None:
+            save_verdicts(task_id, state.verdicts)
+            log('done', key='save_verdicts')
         log('done', key='loop_results')
-
-    insert_sql_sample(task_id)
-
-    log('done', key='insert_samples')
-
-    report_key = f'report/{task_id}_{cluster_identifier}/'
-    if len(error_query) > 0:
-        export_report(bucket_name=s3_bucket_name, report_type='error', prefix=report_key, data=error_query)
-
-    log('done', key='export_report')
-
-    # update subtask status to Completed
-    update_result = update_subtask_status(task_id, s3_object_key, 'Completed', 'In-progress', total_count=total_count, error_count=len(error_query), warning_count=len(warning_query))
-    if update_result == False:
-        return
-
-    log('done', key='update_subtask_status')
+    else:
+        # Only the samples are needed, run through the file
+        collections.deque(logs, maxlen=0)
 
 # get secret (mysql credentials) from secret manager
 def get_secret_from_secret_manager(validate_cluster_secret_key):
 
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region
-    )
+    # Get the Secrets Manager client
+    client = resources.client('secretsmanager')
 
     try:
         get_secret_value_response = client.get_secret_value(
@@ -157,127 +398,261 @@ def get_secret_from_secret_manager(validate_cluster_secret_key):
     credentials = json.loads(secret)
     return credentials
 
-# load and unzip s3 file get each lines of log
-def load_and_unzip_s3_file(bucket_name, file_key, check_percent, rerun):
-  """Loads a .gz file from S3, unzips it locally, and reads each line.
-
-  Args:
-    bucket_name: The name of the S3 bucket.
-    file_key: The key of the file within the bucket.
-  """
-  global sample_query, total_count
-
-  logs = []
-
-  s3 = boto3.client('s3')
+# stream a .gz file from S3, unzip it on the fly and parse its chunks, it runs in the read ahead thread of the subtask
+def parse_s3_file(bucket_name, file_key, replay_statements, normalizer_version=1):
+  s3 = get_s3_client()
+
+  # Stream the .gz object from S3, unzip it while it downloads and parse the
+  # chunks in the worker processes
+  with open_gzip_object(s3, bucket_name, file_key) as gz_file:
+        yield from parse_chunks(read_chunks(gz_file, parse_chunk_size), replay_statements, normalizer_version)
+
+# report the findings of the static analyzer on a fingerprint, once per task by the subtask claiming to report them
+def report_findings(state, log, findings, claim):
+    errors = [message for severity, _, message in findings if severity == ERROR]
+    warnings = [message for severity, _, message in findings if severity == WARNING]
+    if errors:
+        state.static_errors.add(log['sql_hash'])
+
+    # Apart from the owner, which is only claimed by the subtask replaying the fingerprint
+    if log['sql_hash'] not in state.findings_owned:
+        state.findings_owned[log['sql_hash']] = claim(log)
+    if not state.findings_owned[log['sql_hash']]:
+        return
 
-  # Download the .gz file to a temporary file
-  temp_file_path = '/home/ec2-user/temp.gz'
-  response = s3.download_file(bucket_name, file_key, temp_file_path)
+    if errors:
+        state.error_query.append(dict(log, message='; '.join(errors), code=CODE_ERROR))
+    if warnings:
+        state.warning_query.append(dict(log, message='; '.join(warnings), code=CODE_WARNING))
 
-  task_count = {}
+# parse chunks of the audit log, in the worker processes when there are any, results are yielded in order
+def parse_chunks(chunks, replay_statements, normalizer_version):
+    if parse_pool is None:
+        for chunk in chunks:
+            yield parse_chunk(chunk, replay_statements, normalizer_version)
+        return
 
-  # Unzip the file
-  # Open the gzipped file
-  with gzip.open(temp_file_path, 'rt') as gz_file:
-        # Create a CSV reader object
-        csv_reader = csv.reader(gz_file)
-        # Read and process each line of the CSV file
-        for line in csv_reader:
+    # Keep a bounded number of chunks in flight so memory does not grow with the file size
+    pending = collections.deque()
+    for chunk in chunks:
+        pending.append(parse_pool.apply_async(parse_chunk, (chunk, replay_statements, normalizer_version)))
+        if len(pending) >= parse_workers * 2:
+            yield pending.popleft().get()
+
+    while pending:
+        yield pending.popleft().get()
+
+# start the parse worker processes, it must be called before any other thread is started
+def start_parse_pool():
+    global parse_pool
+
+    if parse_workers > 1:
+        parse_pool = multiprocessing.get_context('fork').Pool(processes=parse_workers)
+
+# take the next logs from an iterator, it may block while the file is parsed
+def next_logs(iterator, count):
+    return list(itertools.islice(iterator, count))
+
+# replay logs with a pool of workers, a worker takes the next batch of logs as soon as its queries finish
+async def run_replay_workers(state, logs, max_concurrency, db_config, validate_mode=EXECUTE, baseline_db_config=None,
+                             compare_db_configs=None, schedule=None, qps_share=None, endpoints=None):
+    loop = asyncio.get_running_loop()
+    # Executed queries are replayed one by one, the others are checked in batches of the same database
+    batch_size = 1 if validate_mode in EXECUTING_MODES else validation_batch_size
+    queue = asyncio.Queue(maxsize=max_concurrency * 2)
+    failed_results = []
+
+    # The number of queries in flight adapts to the target, max_concurrency is only the ceiling
+    controller = AdaptiveConcurrency(max_limit=max_concurrency)
+
+    # Queries per second allowed to this subtask, None without limit
+    limiter = None
+    if qps_share is not None:
+        limiter = TokenBucket(await loop.run_in_executor(None, qps_share))
+
+    async def refresh_rate():
+        while True:
+            await asyncio.sleep(qps_refresh_interval)
             try:
-                total_count = total_count + 1
-                # Process the line as needed
-
-                time = line[0]
-                user = line[2]
-                src_ip = line[3]
-                operation = line[6]
-                database = line[7]
-                if user != "rdsadmin" and operation == "QUERY":
-                    query_line = line[8:len(line)-1]
-                    query = ', '.join(query_line)
-                    query = ast.literal_eval(query)
-
-                    log = {
-                        'time': time,
-                        'database': database,
-                        'query': query,
-                        'user': user,
-                        'src_ip': src_ip
-                    }
-                    log['sql_mask'] = mask_sql(log['query'])
-                    log['sql_hash'] = blake2b(log['sql_mask'].encode('utf-8')).hexdigest()
-
-                    if log['sql_hash'] in task_count:
-                        task_count[log['sql_hash']] = task_count[log['sql_hash']] + 1
-                    else:
-                        task_count[log['sql_hash']] = 1
-                        sample_query.append(log)
-
-                    if rerun:
-                        if task_count[log['sql_hash']] % 10 < check_percent and log['sql_mask'].strip().lower().startswith('select'):
-                            logs.append(log)
-            except Exception as e:
-                print(line)
-                print(f"An error occurred in load_and_unzip_s3_file for above line : {e}")
-                traceback.print_exc()
-
-                
-  # remove the temp file from disc
-  os.remove(temp_file_path)
-
-  return logs
-
-# create async tasks and all results
-async def run_tasks_with_semaphore(logs, max_concurrency, task_id, check_percent, db_config):
-
-    pool = await aiomysql.create_pool(**db_config, minsize=1, maxsize=max_concurrency)
-
-    semaphore = asyncio.Semaphore(max_concurrency)
-    
-    tasks = []
-    async_results = []
-
-    async def wrapped_task(log):
-        async with semaphore:
-            result = await process_log(log=log, pool=pool)
-            return result
-
-    batch_count = 0
-
-    for log in logs:
-        task = asyncio.create_task(wrapped_task(log))
-        tasks.append(task)
-
-        if len(tasks) >= max_concurrency * 2:
-            batch_count = batch_count + 1
-            if batch_count%1000==0:
-                print('1000 batches')
-                print(len(async_results))
-            batch_result = await asyncio.gather(*tasks)
-            async_results.extend(batch_result)
-            tasks = []
-    
-    if tasks:
-        batch_result = await asyncio.gather(*tasks)
-        async_results.extend(batch_result)
-
-    
-    pool.close()
-    await pool.wait_closed()
-
-
-    return async_results
-
-# process each line of logs
-async def process_log(log, pool):
-
-    result = await execute_query(database=log['database'], query=log['query'], pool=pool)
-    log['message']=result['message']
-    log['code']=result['code']
-
-    return log
-
+                limiter.set_rate(await loop.run_in_executor(None, qps_share))
+            except ClientError as e:
+                # Keep the last share until the subtasks can be counted again
+                log(e, key='refresh qps share')
+
+    async def feed():
+        iterator = iter(logs)
+        while True:
+            # Pull from the iterator in a thread, parsing must not block the queries in flight
+            pulled = await loop.run_in_executor(None, next_logs, iterator, max_concurrency * batch_size)
+            if not pulled:
+                break
+            # Logs of the same database are queued together, the connections rarely change database
+            pulled.sort(key=lambda log: log['database'])
+            for batch in group_by_database(pulled, batch_size):
+                await queue.put(batch)
+        # Only once every log is queued, after a failure the workers are cancelled and nothing drains the queue
+        for _ in range(max_concurrency):
+            await queue.put(None)
+
+    async def feed_timed():
+        iterator = iter(logs)
+        sessions = {}
+        tasks = []
+        # Logs handed to the sessions and not replayed yet, the feeder waits when the target falls behind the pace
+        queued = asyncio.Semaphore(max_concurrency * 2)
+        try:
+            while True:
+                pulled = await loop.run_in_executor(None, next_logs, iterator, max_concurrency)
+                if not pulled:
+                    break
+                for log in pulled:
+                    due = schedule.due(record_time(log['time']))
+                    delay = schedule.delay(due)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    session = sessions.get(log['connection_id'])
+                    if session is None:
+                        session = sessions[log['connection_id']] = asyncio.Queue()
+                        tasks.append(asyncio.ensure_future(replay_session(session, queued)))
+                    await queued.acquire()
+                    session.put_nowait((log, due))
+        finally:
+            for session in sessions.values():
+                session.put_nowait(None)
+            await asyncio.gather(*tasks)
+
+    async def replay_session(session, queued):
+        # The queries of one recorded connection are replayed in order, one at a time
+        while True:
+            item = await session.get()
+            if item is None:
+                return
+            log, due = item
+            schedule.started(due)
+            try:
+                await replay([log])
+            finally:
+                queued.release()
+
+    async def worker():
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            await replay(batch)
+
+    # check a batch of logs and record their results
+    async def replay(batch):
+        if validate_mode in EXECUTING_MODES:
+            results = [await runner.process_log(log=batch[0], pool=pool, controller=controller,
+                                                validate_mode=validate_mode, latencies=state.latency, limiter=limiter)]
+            if baseline_pool is not None and results[0]['code'] == CODE_SUCCESS:
+                await runner.replay_on_baseline(results[0], baseline_pool, validate_mode, state.latency)
+            digest = results[0].pop('digest', None)
+            if compare_pools and digest is not None:
+                state.diff_query.extend(await runner.compare_on_endpoints(results[0], digest, compare_pools))
+        else:
+            results = await runner.process_batch(batch=batch, pool=pool, controller=controller,
+                                                 validate_mode=validate_mode, limiter=limiter)
+        for result in results:
+            state.replay_count = state.replay_count + 1
+            if result['code'] in (CODE_SUCCESS, CODE_WARNING, CODE_ERROR):
+                # A query only failing when prepared still runs on the target
+                succeeded = result['code'] != CODE_ERROR
+                state.replay_policy.record(result['sql_hash'], succeeded=succeeded)
+                if state.verdicts is not None:
+                    state.verdicts.record(result['sql_hash'], succeeded=succeeded, message=result['message'])
+            if result['code'] != CODE_SUCCESS:
+                failed_results.append(result)
+
+        # Close the idle connections once the controller has lowered the limit, a warm pool is
+        # kept while the limit is still growing
+        if not controller.slow_start and pool.size > controller.limit and pool.freesize > 0:
+            await pool.clear()
+
+    async with contextlib.AsyncExitStack() as leases:
+        # One pool per endpoint, each query goes to the endpoint with the fewest queries in flight
+        router = EndpointRouter(endpoints or [db_config['host']])
+        pool = RoutedPool({endpoint: await leases.enter_async_context(
+                               lease_pool(dict(db_config, host=endpoint), max_concurrency))
+                           for endpoint in router.endpoints},
+                          router, is_unhealthy=is_transient_error)
+        baseline_pool = None
+        if baseline_db_config is not None:
+            baseline_pool = await leases.enter_async_context(lease_pool(baseline_db_config, max_concurrency))
+        compare_pools = {endpoint: await leases.enter_async_context(lease_pool(config, max_concurrency))
+                         for endpoint, config in (compare_db_configs or {}).items()}
+        refresher = asyncio.ensure_future(refresh_rate()) if limiter is not None else None
+        try:
+            if state.verdicts is not None:
+                state.verdicts.set_version(await get_server_version(pool))
+            if schedule is not None:
+                await feed_timed()
+            else:
+                tasks = [asyncio.ensure_future(feed())] + [asyncio.ensure_future(worker()) for _ in range(max_concurrency)]
+                try:
+                    await asyncio.gather(*tasks)
+                finally:
+                    # The event loop outlives the subtask, nothing of it may keep running after a failure
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            if refresher is not None:
+                refresher.cancel()
+
+    log(controller.limit, key='final concurrency')
+    log(pool.switch_count, key='database switch count')
+    if len(router.endpoints) > 1:
+        log(router.sent, key='queries by endpoint')
+        log(router.ejections, key='ejections by endpoint')
+    if limiter is not None:
+        log(limiter.rate, key='final qps share')
+    if validate_mode == EXECUTE_PREPARED:
+        # Counted on every open connection of the agent, they may have been prepared by earlier subtasks
+        log(sum(cache.prepare_count for cache in runner.statement_caches.values()), key='prepared statement count')
+    return failed_results
+
+# lease the pool of an endpoint and session settings from the agent's resources for the time of the block
+@contextlib.asynccontextmanager
+async def lease_pool(db_config, maxsize):
+    key = (tuple(sorted(db_config.items(), key=lambda item: item[0])), maxsize)
+    pool = resources.lease_pool(key, lambda: AffinityPool(lambda: connect(db_config), maxsize=maxsize))
+    try:
+        yield pool
+    except BaseException:
+        # Connections may have been left in the middle of a query, they are not handed to the next subtask
+        pool.close()
+        raise
+    finally:
+        resources.return_pool(key, pool)
+
+# open a connection with the cached credentials, they are read again once if the server refuses them
+async def connect(db_config):
+    loop = asyncio.get_running_loop()
+    # The init_command of aiomysql only takes one statement, the session is set up once the connection is open
+    db_config = dict(db_config)
+    init_statements = db_config.pop('init_statements', ())
+    credentials = await loop.run_in_executor(None, resources.secret)
+    try:
+        db_connection = await aiomysql.connect(user=credentials['username'], password=credentials['password'], **db_config)
+    except aiomysql.OperationalError as e:
+        if not e.args or e.args[0] != ACCESS_DENIED_ERROR:
+            raise
+        # The password was rotated since the credentials were cached
+        log(e, key='connect')
+        resources.invalidate_secret(credentials)
+        credentials = await loop.run_in_executor(None, resources.secret)
+        db_connection = await aiomysql.connect(user=credentials['username'], password=credentials['password'], **db_config)
+    try:
+        async with db_connection.cursor() as cursor:
+            for statement in init_statements:
+                await cursor.execute(statement)
+    except BaseException:
+        # A connection without its session settings could change the target, it is never handed out
+        db_connection.close()
+        raise
+    return db_connection
 
 def execute_query_print(database, query, pool):
     result = {
@@ -286,40 +661,48 @@ def execute_query_print(database, query, pool):
     }
     return result
 
-# execute sql query
-async def execute_query(database, query, pool):
-    result = {
-        'code': 0,
-        'message': ''
-    }
+# get the version of the target, Aurora includes its own version in it
+async def get_server_version(pool):
     async with pool.acquire() as db_connection:
-        try:
-            await db_connection.select_db(database)
-            async with db_connection.cursor() as cursor:
-                await cursor.execute(query)
-        except Exception as e:
-            # Handle any errors that occurred during query execution
-            result['code'] = 2;
-            result['message'] = str(e)
-            traceback.print_exc()
-        
-    return result
+        async with db_connection.cursor() as cursor:
+            await cursor.execute('SELECT VERSION()')
+            row = await cursor.fetchone()
+    return row[0]
+
+# get the queries per second of a task left to each of its subtasks In-progress
+def get_qps_share(task_id, max_qps):
+    # The DynamoDB resource imports boto3.dynamodb, get it before the conditions are built
+    table = get_table(subtask_dynamodb_name)
+    in_progress = 0
+    query = dict(
+        KeyConditionExpression=boto3.dynamodb.conditions.Key('task_id').eq(task_id),
+        FilterExpression=boto3.dynamodb.conditions.Attr('status').eq('In-progress'),
+        Select='COUNT'
+    )
+    response = table.query(**query)
+    in_progress = in_progress + response['Count']
+    while 'LastEvaluatedKey' in response:
+        response = table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **query)
+        in_progress = in_progress + response['Count']
+    # This subtask is In-progress, it is counted even if the read lags behind
+    return max_qps / max(1, in_progress)
 
 # update subtask status
-def update_subtask_status(task_id, s3_object_key, status, condition_status, total_count=0, error_count=0, warning_count=0):
+def update_subtask_status(task_id, s3_object_key, status, condition_status, total_count=0, error_count=0, warning_count=0, timeout_count=0):
     try:
-        response = subtask_table.update_item(
+        response = get_table(subtask_dynamodb_name).update_item(
             Key={
                 'task_id': task_id,
                 's3_object_key': s3_object_key
             },
-            UpdateExpression="set #status = :s, #tc = :tc, #ec = :ec, #wc = :wc, #ut = :ut",
+            UpdateExpression="set #status = :s, #tc = :tc, #ec = :ec, #wc = :wc, #toc = :toc, #ut = :ut",
             ConditionExpression = "#status = :condition",
             ExpressionAttributeNames={
                 '#status': 'status',
                 '#tc': 'total_count',
                 '#ec': 'error_count',
                 '#wc': 'warning_count',
+                '#toc': 'timeout_count',
                 '#ut': 'update_time'
             },
             ExpressionAttributeValues={
@@ -327,6 +710,7 @@ def update_subtask_status(task_id, s3_object_key, status, condition_status, tota
                 ':tc': total_count,
                 ':ec': error_count,
                 ':wc': warning_count,
+                ':toc': timeout_count,
                 ':ut': datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
                 ':condition': condition_status
             },
@@ -340,115 +724,153 @@ def update_subtask_status(task_id, s3_object_key, status, condition_status, tota
 
 
 # insert sql sample
-def insert_sql_sample(task_id):
-    global sample_query
+def insert_sql_sample(task_id, state):
+    # One update per fingerprint, sent in parallel, each thread has its own DynamoDB table
+    list(sample_writers.map(lambda log: add_sql_sample(task_id, state, log), state.sample_query))
 
+# add the counters of a subtask to the item of a fingerprint
+def add_sql_sample(task_id, state, log):
     try:
-        with sql_sample_table.batch_writer() as batch:
-            for log in sample_query:
-                batch.put_item(Item={
-                    'task_id': task_id,
-                    'sql_hash': log['sql_hash'],
-                    'sql_mask': log['sql_mask'],
-                    'sql_sample': log['query'],
-                    'database': log['database']
-                })
+        write_sql_sample(get_table(sql_sample_dynamodb_name), task_id, state, log)
     except ClientError as e:
         print(f"Error inserting sql samples: {e.response['Error']['Message']}")
 
-# mask sql query
-def mask_sql(query):
-    # Remove escaped characters
-    query = query = re.sub(r"\\\0", "", query)
-    query = query = re.sub(r"\\\'", "", query)
-    query = query = re.sub(r'\\\"', "", query)
-    query = query = re.sub(r"\\\b", "", query)
-    query = query = re.sub(r"\\\n", "", query)
-    query = query = re.sub(r"\\\r", "", query)
-    query = query = re.sub(r"\\\t", "", query)
-    query = query = re.sub(r"\\\Z", "", query)
-    query = query = re.sub(r"\\\\", "", query)
-    query = query = re.sub(r"\\\%", "", query)
-    query = query = re.sub(r"\\\_", "", query)
-
-    # Remove -- style comments
-    query = re.sub(r'--.*?(\n|$)', '\n', query)
-    
-    # Remove # style comments
-    query = re.sub(r'#.*?(\n|$)', '\n', query)
-    
-    # Remove /* */ style comments
-    query = re.sub(r'/\*[\s\S]*?\*/', '', query)
-    
-    # Remove extra whitespace
-    query = re.sub(r'\s+', ' ', query).strip()
-
-    # Mask string value
-    query = re.sub(r"'[^']*'", "''", query)
+# get the stored verdict of a fingerprint on a target
+def get_verdict(sql_hash, target):
+    response = get_table(verdict_dynamodb_name).get_item(Key={'sql_hash': sql_hash, 'target': target})
+    return response.get('Item', {}).get('verdict')
 
-    # Mask digit value
-    # Replace all matches with '1'
-    query = re.sub(r'\b\d+(\.\d+)?\b', '1', query)
-
-    return query
+# save the verdicts of a subtask
+def save_verdicts(task_id, verdicts):
+    table = get_table(verdict_dynamodb_name)
+    update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+    for sql_hash, (verdict, message) in verdicts.results.items():
+        try:
+            # A pass must not hide the failure of the same fingerprint in another subtask of the task
+            table.put_item(
+                Item={
+                    'sql_hash': sql_hash,
+                    'target': verdicts.target,
+                    'verdict': verdict,
+                    'message': message,
+                    'task_id': task_id,
+                    'update_time': update_time
+                },
+                ConditionExpression="attribute_not_exists(#task) or #task <> :task or #verdict = :pass",
+                ExpressionAttributeNames={
+                    '#task': 'task_id',
+                    '#verdict': 'verdict'
+                },
+                ExpressionAttributeValues={
+                    ':task': task_id,
+                    ':pass': PASS
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != "ConditionalCheckFailedException":
+                print(f"Error saving verdicts: {e.response['Error']['Message']}")
 
 # export to report
 def export_report(bucket_name, report_type, prefix, data):
     file_key = f'{prefix}{report_type}.csv'
     # Initialize S3 client
     fieldnames = data[0].keys()
-    s3_client = boto3.client('s3')
-    try:
-        response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-        existing_content = response['Body'].read().decode('utf-8')
-        csv_buffer = io.StringIO(existing_content)
-        csv_buffer.seek(0, io.SEEK_END)
-    except s3_client.exceptions.NoSuchKey:
-        csv_buffer = io.StringIO()
-        # Write the header
-        fieldnames = data[0].keys()
+    s3_client = get_s3_client()
+    with report_lock:
+        try:
+            response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
+            existing_content = response['Body'].read().decode('utf-8')
+            csv_buffer = io.StringIO(existing_content)
+            csv_buffer.seek(0, io.SEEK_END)
+        except s3_client.exceptions.NoSuchKey:
+            csv_buffer = io.StringIO()
+            # Write the header
+            fieldnames = data[0].keys()
+            writer = csv.DictWriter(csv_buffer, fieldnames=fieldnames)
+            writer.writeheader()
+
+        # Append the new rows
         writer = csv.DictWriter(csv_buffer, fieldnames=fieldnames)
-        writer.writeheader()
+        for row in data:
+            writer.writerow(row)
 
-    # Append the new rows
-    writer = csv.DictWriter(csv_buffer, fieldnames=fieldnames)
-    for row in data:
-        writer.writerow(row)
+        csv_buffer.seek(0)
 
-    csv_buffer.seek(0)
+        # Upload the updated content to S3
+        s3_client.put_object(Bucket=bucket_name, Key=file_key, Body=csv_buffer.getvalue())
 
-    # Upload the updated content to S3
-    s3_client.put_object(Bucket=bucket_name, Key=file_key, Body=csv_buffer.getvalue())
+# process one received message and delete it from the queue afterwards
+def handle_message(message):
+    receive_count = int(message.get('Attributes', {}).get('ApproximateReceiveCount', 1))
+    heartbeat = VisibilityHeartbeat(sqs, queue_url, message['ReceiptHandle'], visibility_timeout).start()
+    try:
+        process_message(message['Body'], final_attempt=receive_count >= max_receive_count)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        traceback.print_exc()
+
+        if receive_count < max_receive_count:
+            # Make the message visible again right away so the subtask is retried
+            heartbeat.release()
+            return
+    finally:
+        heartbeat.stop()
+
+    try:
+        # Delete the message from the queue after processing
+        response = sqs.delete_message(
+            QueueUrl=queue_url,
+            ReceiptHandle=message['ReceiptHandle']
+        )
+
+        print(response)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        traceback.print_exc()
 
 # start from get message from sqs
 def receive_messages():
+    # Each free slot allows one more subtask in flight, replaying or prefetched
+    slots = threading.Semaphore(max_inflight_subtasks + prefetch_subtasks)
+    executor = ThreadPoolExecutor(max_workers=max_inflight_subtasks + prefetch_subtasks, thread_name_prefix='subtask')
+
+    def run(message):
+        try:
+            handle_message(message)
+        finally:
+            slots.release()
+
     while True:
+        # Wait for a free slot, then take every other free slot for one batch receive
+        slots.acquire()
+        free_slots = 1
+        while free_slots < 10 and slots.acquire(blocking=False):
+            free_slots = free_slots + 1
+
+        messages = []
         try:
             # Receive message from SQS queue
             response = sqs.receive_message(
                 QueueUrl=queue_url,
-                MaxNumberOfMessages=1,  # Adjust as needed
-                WaitTimeSeconds=1,  # Long polling
-                VisibilityTimeout=3600
+                MaxNumberOfMessages=free_slots,
+                WaitTimeSeconds=20,  # Long polling
+                VisibilityTimeout=visibility_timeout,
+                AttributeNames=['ApproximateReceiveCount']
             )
 
             messages = response.get('Messages', [])
-            if messages:
-                for message in messages:
-                    # Print the message body
-                    process_message(message['Body'])
-                    
-                    # Delete the message from the queue after processing
-                    response = sqs.delete_message(
-                        QueueUrl=queue_url,
-                        ReceiptHandle=message['ReceiptHandle']
-                    )
-
-                    print(response)
+            for message in messages:
+                executor.submit(run, message)
 
         except Exception as e:
             print(f"An error occurred: {e}")
             traceback.print_exc()
+        finally:
+            # Give back the slots no message was received for
+            for _ in range(free_slots - len(messages)):
+                slots.release()
 
 if __name__ == "__main__":
+    start_parse_pool()
+    resources.start()
     receive_messages()
\ No newline at end of file
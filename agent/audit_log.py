@@ -0,0 +1,199 @@
+import codecs
+import traceback
+
+from sql_normalizer import mask_sql, sql_fingerprint
+from static_analyzer import analyze
+
+# An Aurora MySQL audit record exported from CloudWatch Logs looks like
+#   <export timestamp> <timestamp>,serverhost,username,host,connectionid,queryid,operation,database,'object',retcode
+# Only the quoted object (the query text) may contain commas, so the line is
+# split on the first eight commas and the retcode is cut from the end.
+_FIELD_COUNT = 9
+_TIME = 0
+_USER = 2
+_HOST = 3
+_CONNECTION_ID = 4
+_OPERATION = 6
+_DATABASE = 7
+_OBJECT = 8
+
+_QUERY_OPERATION = b'QUERY'
+_QUERY_MARKER = b',QUERY,'
+_ADMIN_USER = b'rdsadmin'
+
+
+def decode_record(line):
+    """
+    Decode one raw audit log line into a log dict.
+
+    Lines of other operations and lines of the rdsadmin user are rejected
+    before the query text is decoded.
+
+    Args:
+      line: One line of the decompressed audit log, as bytes.
+
+    Returns:
+      A dict with time, database, query, user, src_ip and connection_id, or None when the line
+      is not a query to check.
+
+    Raises:
+      ValueError: The line is not a well formed audit record.
+    """
+    if _QUERY_MARKER not in line:
+        return None
+
+    fields = line.split(b',', _FIELD_COUNT - 1)
+    if len(fields) < _FIELD_COUNT:
+        raise ValueError('audit record has less than 9 fields')
+    if fields[_OPERATION] != _QUERY_OPERATION or fields[_USER] == _ADMIN_USER:
+        return None
+
+    query, separator, _ = fields[_OBJECT].rstrip(b'\r\n').rpartition(b',')
+    if not separator or len(query) < 2 or query[:1] != b"'" or query[-1:] != b"'":
+        raise ValueError('audit record query is not quoted')
+
+    # Undo the escaping of the quoted query in one step
+    query = query[1:-1]
+    if b'\\' in query:
+        query = codecs.escape_decode(query)[0]
+
+    return {
+        'time': fields[_TIME].decode('utf-8'),
+        'database': fields[_DATABASE].decode('utf-8'),
+        'query': query.decode('utf-8'),
+        'user': fields[_USER].decode('utf-8'),
+        'src_ip': fields[_HOST].decode('utf-8'),
+        'connection_id': fields[_CONNECTION_ID].decode('utf-8')
+    }
+
+
+def record_time(time_field):
+    """
+    Get the time of an audit record in seconds since the epoch.
+
+    Args:
+      time_field: The time of a decoded record, its last word is the timestamp in microseconds.
+    """
+    return int(time_field.rsplit(' ', 1)[-1]) / 1000000
+
+
+def read_chunks(stream, chunk_size):
+    """
+    Read a binary stream in chunks of roughly chunk_size bytes that end on a line boundary.
+
+    Args:
+      stream: Binary file object of the decompressed audit log.
+      chunk_size: Number of bytes to read at a time.
+    """
+    remainder = b''
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        data = remainder + data
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            remainder = data
+            continue
+        remainder = data[end:]
+        yield data[:end]
+    if remainder:
+        yield remainder
+
+
+def parse_chunk(data, replay_statements, normalizer_version=1):
+    """
+    Decode, mask and fingerprint every query of a chunk of audit log lines.
+
+    Runs in a parse worker process. The full log dict is only sent back for
+    the first occurrence of each fingerprint within the chunk and for the
+    lines that may be replayed, every other line only carries its hash, so the
+    caller can count occurrences in the original line order. The first
+    occurrence of each fingerprint is also checked by the static analyzer.
+
+    Args:
+      data: Decompressed audit log lines, as bytes.
+      replay_statements: Tuple of lowercase statement keywords that are replayed
+        against the target database, empty when nothing is replayed.
+      normalizer_version: Fingerprint version, see sql_normalizer.mask_sql.
+
+    Returns:
+      A tuple of the number of lines and a list of (sql_hash, log or None, replayable, findings).
+    """
+    lines = data.split(b'\n')
+    if not lines[-1]:
+        lines.pop()
+    entries = []
+    seen = set()
+    for line in lines:
+        try:
+            log = decode_record(line)
+            if log is None:
+                continue
+            log['sql_mask'] = mask_sql(log['query'], normalizer_version)
+            log['sql_hash'] = sql_fingerprint(log['sql_mask'])
+
+            replayable = bool(replay_statements) and log['sql_mask'].lower().startswith(replay_statements)
+            if log['sql_hash'] not in seen:
+                seen.add(log['sql_hash'])
+                entries.append((log['sql_hash'], log, replayable, analyze(log['query'])))
+            elif replayable:
+                entries.append((log['sql_hash'], log, replayable, None))
+            else:
+                entries.append((log['sql_hash'], None, False, None))
+        except Exception as e:
+            print(line)
+            print(f"An error occurred in parse_chunk for above line : {e}")
+            traceback.print_exc()
+
+    return len(lines), entries
+
+
+def select_logs(state, chunks, check_percent, claim, report_findings):
+    """
+    Merge the parsed chunks of a file in line order and pick the replay candidates.
+
+    This is a generator, the chunks are merged as the replay candidates are
+    consumed, the line count and the samples are complete once it is
+    exhausted. They are the same as the ones of a serial parse of the file.
+
+    Args:
+      state: The subtask state collecting the line count and the samples, its
+        replay policy picks the logs to replay among the sampled ones.
+      chunks: The parsed chunks of the file, as returned by parse_chunk.
+      check_percent: Share of the occurrences of a query to replay, from 1 to 10.
+      claim: Function of a log telling whether this subtask owns its fingerprint,
+        only the owner of a fingerprint replays it within the task. It is only
+        called once the fingerprint is a replay candidate.
+      report_findings: Function of the state, the first log of a fingerprint
+        and its static analyzer findings, called when there are findings.
+
+    Yields:
+      The logs to replay against the target database.
+    """
+    task_count = state.sql_count
+
+    for line_count, entries in chunks:
+        state.total_count = state.total_count + line_count
+
+        # Merge in line order to keep the first seen sample and the counters of a serial run
+        for sql_hash, log, replayable, findings in entries:
+            if sql_hash in task_count:
+                task_count[sql_hash] = task_count[sql_hash] + 1
+            else:
+                task_count[sql_hash] = 1
+                state.sample_query.append(log)
+                if findings:
+                    report_findings(state, log, findings)
+
+            if not replayable or task_count[sql_hash] % 10 >= check_percent:
+                continue
+            if sql_hash not in state.owned:
+                state.owned[sql_hash] = claim(log)
+            if not state.owned[sql_hash] or sql_hash in state.static_errors:
+                # Queries the static analyzer rejects are reported without a round trip to the target
+                state.replay_policy.skip(sql_hash)
+            elif state.verdicts is not None and state.verdicts.is_known_pass(sql_hash):
+                state.replay_policy.skip(sql_hash)
+            elif state.replay_policy.should_replay(log):
+                yield log
@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+# Outcome of one replayed query, as seen by the concurrency controller
+SUCCESS = 'success'
+TIMEOUT = 'timeout'
+OVERLOAD = 'overload'
+
+# Window average latency above baseline * LATENCY_TOLERANCE counts as congestion
+LATENCY_TOLERANCE = 2.0
+
+# Window timeout rate above which the limit is decreased
+TIMEOUT_RATE_THRESHOLD = 0.05
+
+# Multiplicative decrease applied on congestion
+DECREASE_FACTOR = 0.5
+
+# Minimum number of completed queries before the limit is adjusted
+MIN_WINDOW_SIZE = 10
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller for the number of queries in flight against the target cluster.
+
+    The limit starts low and doubles every window (slow start) until the first
+    sign of congestion, then grows by one per window. It is halved when the
+    target reports too many connections, when the timeout rate of a window
+    is too high or when the average latency of a window moves far above the
+    lowest average latency observed. A window lasts as many completed queries
+    as the current limit.
+    """
+
+    def __init__(self, max_limit, initial_limit=4, min_limit=1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = min(min_limit, self.max_limit)
+        self.limit = max(self.min_limit, min(initial_limit, self.max_limit))
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+        self._slow_start = True
+        self._baseline_latency = None
+        self._reset_window()
+
+    @property
+    def slow_start(self):
+        """True until the first sign of congestion, the limit only grows meanwhile."""
+        return self._slow_start
+
+    def _reset_window(self):
+        self._window_count = 0
+        self._window_latency = 0.0
+        self._window_timeouts = 0
+        self._window_overloaded = False
+
+    async def acquire(self):
+        """Wait until one more query may be sent to the target."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight = self.in_flight + 1
+        return time.monotonic()
+
+    async def release(self, started, outcome=SUCCESS):
+        """
+        Record the outcome of a query started at ``started`` (returned by acquire).
+
+        Args:
+          started: Monotonic time the query was started.
+          outcome: SUCCESS, TIMEOUT or OVERLOAD.
+        """
+        async with self._condition:
+            self.in_flight = self.in_flight - 1
+            self._record(time.monotonic() - started, outcome)
+            self._condition.notify_all()
+
+    def _record(self, latency, outcome):
+        self._window_count = self._window_count + 1
+        if outcome == OVERLOAD:
+            # Back off at once, at most once per window
+            if not self._window_overloaded:
+                self._decrease()
+            self._window_overloaded = True
+        else:
+            self._window_latency = self._window_latency + latency
+            if outcome == TIMEOUT:
+                self._window_timeouts = self._window_timeouts + 1
+
+        if self._window_count < max(self.limit, MIN_WINDOW_SIZE):
+            return
+
+        if not self._window_overloaded:
+            average_latency = self._window_latency / self._window_count
+            timeout_rate = self._window_timeouts / self._window_count
+            if self._baseline_latency is None or average_latency < self._baseline_latency:
+                self._baseline_latency = average_latency
+
+            if timeout_rate > TIMEOUT_RATE_THRESHOLD or average_latency > self._baseline_latency * LATENCY_TOLERANCE:
+                self._decrease()
+            elif self._slow_start:
+                self.limit = min(self.max_limit, self.limit * 2)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1)
+
+        self._reset_window()
+
+    def _decrease(self):
+        self._slow_start = False
+        self.limit = max(self.min_limit, int(self.limit * DECREASE_FACTOR))
@@ -0,0 +1,114 @@
+import contextlib
+import time
+
+# Consecutive connection problems after which an endpoint is ejected
+EJECT_AFTER_FAILURES = 3
+
+# Seconds an ejected endpoint gets no new query, it is then tried again
+EJECT_COOLDOWN = 30
+
+
+class EndpointRouter:
+    """
+    Least outstanding requests routing over equivalent endpoints.
+
+    Each query goes to the endpoint with the fewest queries in flight. An
+    endpoint that fails ``eject_after`` times in a row with a connection
+    problem is ejected for ``cooldown`` seconds, then gets queries again and
+    is ejected again at the first failure until one succeeds. When every
+    endpoint is ejected, the one coming back first is used.
+    """
+
+    def __init__(self, endpoints, eject_after=EJECT_AFTER_FAILURES, cooldown=EJECT_COOLDOWN, clock=time.monotonic):
+        self.endpoints = list(endpoints)
+        self.eject_after = eject_after
+        self.cooldown = cooldown
+        self.outstanding = {endpoint: 0 for endpoint in self.endpoints}
+        self.sent = {endpoint: 0 for endpoint in self.endpoints}
+        self.ejections = {endpoint: 0 for endpoint in self.endpoints}
+        self._failures = {endpoint: 0 for endpoint in self.endpoints}
+        self._ejected_until = {endpoint: 0.0 for endpoint in self.endpoints}
+        self._clock = clock
+
+    def choose(self):
+        """Get the endpoint of the next query."""
+        now = self._clock()
+        available = [endpoint for endpoint in self.endpoints if self._ejected_until[endpoint] <= now]
+        if not available:
+            return min(self.endpoints, key=lambda endpoint: self._ejected_until[endpoint])
+        return min(available, key=lambda endpoint: self.outstanding[endpoint])
+
+    def started(self, endpoint):
+        """Record a query sent to an endpoint."""
+        self.outstanding[endpoint] = self.outstanding[endpoint] + 1
+        self.sent[endpoint] = self.sent[endpoint] + 1
+
+    def finished(self, endpoint, healthy=True):
+        """Record the end of a query, unhealthy when it hit a connection problem."""
+        self.outstanding[endpoint] = self.outstanding[endpoint] - 1
+        if healthy:
+            self._failures[endpoint] = 0
+            return
+        self._failures[endpoint] = self._failures[endpoint] + 1
+        if self._failures[endpoint] >= self.eject_after and self._ejected_until[endpoint] <= self._clock():
+            self._ejected_until[endpoint] = self._clock() + self.cooldown
+            self.ejections[endpoint] = self.ejections[endpoint] + 1
+            # Back from the cooldown, a single failure ejects it again
+            self._failures[endpoint] = self.eject_after - 1
+
+    def is_ejected(self, endpoint):
+        """Tell whether an endpoint gets no new query for now."""
+        return self._ejected_until[endpoint] > self._clock()
+
+
+class RoutedPool:
+    """
+    Connection pools of equivalent endpoints used as one, through an EndpointRouter.
+    """
+
+    def __init__(self, pools, router, is_unhealthy):
+        """
+        Args:
+          pools: Pool of each endpoint, with an acquire(database) context manager.
+          router: EndpointRouter of the same endpoints.
+          is_unhealthy: Function telling whether an exception raised while a
+            connection was in use is a connection problem of the endpoint.
+        """
+        self.pools = pools
+        self.router = router
+        self._is_unhealthy = is_unhealthy
+
+    @property
+    def size(self):
+        return sum(pool.size for pool in self.pools.values())
+
+    @property
+    def freesize(self):
+        return sum(pool.freesize for pool in self.pools.values())
+
+    @property
+    def switch_count(self):
+        return sum(pool.switch_count for pool in self.pools.values())
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, database=None):
+        """Get a connection of the chosen endpoint for the time of the block."""
+        endpoint = self.router.choose()
+        self.router.started(endpoint)
+        healthy = True
+        try:
+            async with self.pools[endpoint].acquire(database) as connection:
+                yield connection
+        except BaseException as e:
+            healthy = not self._is_unhealthy(e)
+            raise
+        finally:
+            self.router.finished(endpoint, healthy)
+
+    async def clear(self):
+        for pool in self.pools.values():
+            await pool.clear()
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
@@ -0,0 +1,102 @@
+import math
+
+# Quantiles reported for each fingerprint
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Relative error of a quantile estimate
+RELATIVE_ACCURACY = 0.01
+
+# Latencies below this many seconds all fall in the lowest bucket
+MIN_LATENCY = 1e-6
+
+
+class QuantileSketch:
+    """
+    Streaming quantile estimate of latencies, in logarithmic buckets.
+
+    A latency is counted in the bucket i such that gamma ** (i - 1) < latency
+    <= gamma ** i, so every quantile is known within RELATIVE_ACCURACY of its
+    value, whatever the number of latencies added. The memory is bounded by the
+    range of the latencies, not by their number.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets = {}
+        self.count = 0
+
+    def add(self, latency):
+        """Add a latency in seconds."""
+        index = math.ceil(math.log(max(latency, MIN_LATENCY)) / self._log_gamma)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count = self.count + 1
+
+    def quantile(self, q):
+        """Estimate the q quantile (0 <= q <= 1) in seconds, None when nothing was added."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self._buckets):
+            seen = seen + self._buckets[index]
+            if seen > rank:
+                break
+        # The middle of the bucket, relative to its bounds
+        return 2 * self._gamma ** index / (self._gamma + 1)
+
+
+class LatencyReport:
+    """
+    Latency quantiles of each fingerprint on the target, and on the baseline when there is one.
+
+    A fingerprint is flagged as a regression when its p95 on the target is
+    more than ``regression_percent`` percent above its p95 on the baseline.
+    """
+
+    def __init__(self, regression_percent=50):
+        self.regression_percent = regression_percent
+        self._target = {}
+        self._baseline = {}
+
+    def record(self, sql_hash, latency, baseline=False):
+        """Record the latency in seconds of a successful replay."""
+        sketches = self._baseline if baseline else self._target
+        sketch = sketches.get(sql_hash)
+        if sketch is None:
+            sketch = sketches[sql_hash] = QuantileSketch()
+        sketch.add(latency)
+
+    def rows(self, masks):
+        """
+        Build the report rows, one per fingerprint replayed on the target.
+
+        Args:
+          masks: Fingerprint text of each sql_hash.
+
+        Returns:
+          A list of dicts, the latencies are in milliseconds.
+        """
+        rows = []
+        for sql_hash, sketch in self._target.items():
+            row = {'sql_hash': sql_hash, 'sql_mask': masks.get(sql_hash, ''), 'count': sketch.count}
+            row.update(_quantile_columns('', sketch))
+            baseline = self._baseline.get(sql_hash)
+            row['baseline_count'] = baseline.count if baseline is not None else 0
+            row.update(_quantile_columns('baseline_', baseline))
+            row['regression'] = self._is_regression(sketch, baseline)
+            rows.append(row)
+        return rows
+
+    def _is_regression(self, sketch, baseline):
+        if baseline is None:
+            return False
+        return sketch.quantile(0.95) > baseline.quantile(0.95) * (1 + self.regression_percent / 100)
+
+
+def _quantile_columns(prefix, sketch):
+    columns = {}
+    for q in QUANTILES:
+        value = sketch.quantile(q) if sketch is not None else None
+        columns[f'{prefix}p{round(q * 100)}_ms'] = '' if value is None else round(value * 1000, 3)
+    return columns
@@ -0,0 +1,74 @@
+import time
+
+from latency import QuantileSketch
+
+
+class ReplaySchedule:
+    """
+    Time of each replayed query, at the pace the queries were recorded.
+
+    The first query is due right away. A query recorded t seconds after it is
+    due t / speed seconds after it. The lag of a query is how late it started
+    compared to when it was due, because the target or the pool could not
+    keep up.
+    """
+
+    def __init__(self, speed, clock=time.monotonic):
+        """
+        Args:
+          speed: How many times faster than recorded the queries are replayed.
+          clock: Function returning the current time in seconds.
+        """
+        self.speed = speed
+        self.count = 0
+        self.lag = QuantileSketch()
+        self.max_lag = 0.0
+        self._clock = clock
+        self._origin = None
+        self._last_due = None
+        self._last_start = None
+
+    def due(self, recorded):
+        """Get the clock time a query recorded at ``recorded`` (seconds) is due."""
+        if self._origin is None:
+            self._origin = (recorded, self._clock())
+        return self._origin[1] + (recorded - self._origin[0]) / self.speed
+
+    def delay(self, due):
+        """Seconds to wait before a query due at ``due`` is sent, 0 when it is late."""
+        return max(0.0, due - self._clock())
+
+    def started(self, due):
+        """Record that a query due at ``due`` was sent."""
+        now = self._clock()
+        lag = max(0.0, now - due)
+        self.lag.add(lag)
+        self.max_lag = max(self.max_lag, lag)
+        self.count = self.count + 1
+        self._last_due = due if self._last_due is None else max(self._last_due, due)
+        self._last_start = now
+
+    def summary(self):
+        """Intended and achieved query rates (per second) and lag quantiles (ms) of the queries sent."""
+        summary = {
+            'speed': self.speed,
+            'count': self.count,
+            'intended_qps': _rate(self.count, self._span(self._last_due)),
+            'achieved_qps': _rate(self.count, self._span(self._last_start)),
+        }
+        for q in (0.5, 0.95, 0.99):
+            value = self.lag.quantile(q)
+            summary[f'lag_p{round(q * 100)}_ms'] = '' if value is None else round(value * 1000, 3)
+        summary['max_lag_ms'] = round(self.max_lag * 1000, 3)
+        return summary
+
+    def _span(self, end):
+        if self._origin is None or end is None:
+            return 0.0
+        return end - self._origin[1]
+
+
+def _rate(count, span):
+    if span <= 0:
+        return ''
+    return round(count / span, 3)
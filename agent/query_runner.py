@@ -0,0 +1,374 @@
+import asyncio
+import random
+import time
+import traceback
+import weakref
+
+import aiomysql
+
+from concurrency import OVERLOAD, SUCCESS, TIMEOUT
+from row_digest import RowDigest
+from sql_normalizer import parameterize_sql
+from statement_cache import StatementCache
+from validation import (COMPARE, EXECUTE, EXECUTE_PREPARED, batch_statements, batch_text, checked_count,
+                        execute_statement, is_single_statement, prepare_statement, validation_statements)
+
+# Result code of a replayed query
+CODE_SUCCESS = 0
+CODE_WARNING = 1
+CODE_ERROR = 2
+CODE_UNAVAILABLE = 3 # the target could not be reached, it says nothing about the query
+CODE_TIMEOUT = 4 # the query ran longer than query_timeout, reported apart from the errors
+
+# MySQL error codes of connection problems, the queries failing with them are retried
+TRANSIENT_ERROR_CODES = {
+    1040, # ER_CON_COUNT_ERROR, too many connections
+    1053, # ER_SERVER_SHUTDOWN
+    1203, # ER_TOO_MANY_USER_CONNECTIONS
+    2003, # CR_CONN_HOST_ERROR
+    2006, # CR_SERVER_GONE_ERROR
+    2013, # CR_SERVER_LOST
+}
+
+# MySQL error codes of a query stopped by max_execution_time
+TIMEOUT_ERROR_CODES = {
+    1907, # ER_QUERY_TIMEOUT before MySQL 5.7.8
+    3024, # ER_QUERY_TIMEOUT
+}
+
+# Outcome of a query as seen by the concurrency controller
+QUERY_OUTCOMES = {
+    CODE_UNAVAILABLE: OVERLOAD,
+    CODE_TIMEOUT: TIMEOUT
+}
+
+# Number of times a query that hit a connection problem is retried, with an exponential backoff between the attempts
+MAX_QUERY_RETRIES = 3
+RETRY_BASE_BACKOFF = 0.5
+RETRY_MAX_BACKOFF = 8
+
+# Seconds a replayed query may run on the target, the agent gives up on the connection after the grace period
+QUERY_TIMEOUT = 60
+QUERY_TIMEOUT_GRACE = 5
+
+# Number of statements kept prepared on each connection by the execute_prepared mode
+PREPARED_STATEMENT_CACHE_SIZE = 64
+
+# Number of rows read at a time into the digest of a result set by the compare mode
+DIGEST_FETCH_SIZE = 1000
+
+
+def is_timeout_error(e):
+    """Tell a query stopped by max_execution_time from an incompatible query."""
+    return isinstance(e, aiomysql.MySQLError) and bool(e.args) and e.args[0] in TIMEOUT_ERROR_CODES
+
+
+def is_transient_error(e):
+    """Tell a connection problem from an incompatible query."""
+    if isinstance(e, aiomysql.OperationalError) and e.args:
+        return e.args[0] in TRANSIENT_ERROR_CODES
+    return isinstance(e, (ConnectionError, asyncio.TimeoutError))
+
+
+def error_result(e):
+    """Return the result of a query that raised an error."""
+    result = {
+        'code': CODE_ERROR,
+        'message': str(e)
+    }
+    if is_timeout_error(e):
+        result['code'] = CODE_TIMEOUT
+    elif is_transient_error(e):
+        # The target is overloaded or unreachable, the caller retries the query
+        result['code'] = CODE_UNAVAILABLE
+    else:
+        # Handle any errors that occurred during query execution
+        traceback.print_exception(type(e), e, e.__traceback__)
+    return result
+
+
+def batch_outcome(results):
+    """Return the outcome of a batch for the concurrency controller, the worst outcome of its queries."""
+    outcomes = {QUERY_OUTCOMES.get(result['code'], SUCCESS) for result in results}
+    for outcome in (OVERLOAD, TIMEOUT):
+        if outcome in outcomes:
+            return outcome
+    return SUCCESS
+
+
+class QueryRunner:
+    """
+    Check the replayed queries on the connections of a pool.
+
+    A pool has an ``acquire(database)`` method giving a connection already on
+    the database for the time of an ``async with`` block, like AffinityPool. A
+    query is executed, or only parsed by the server depending on the validate
+    mode, and gets a result dict with a code and a message. Queries that hit a
+    connection problem are retried with an exponential backoff, the others are
+    never run twice.
+
+    The statements prepared by the execute_prepared mode are kept with their
+    connection in ``statement_caches`` from one subtask to the next.
+    """
+
+    def __init__(self, query_timeout=QUERY_TIMEOUT, query_timeout_grace=QUERY_TIMEOUT_GRACE,
+                 max_retries=MAX_QUERY_RETRIES, retry_base_backoff=RETRY_BASE_BACKOFF,
+                 retry_max_backoff=RETRY_MAX_BACKOFF, prepared_statement_cache_size=PREPARED_STATEMENT_CACHE_SIZE,
+                 digest_fetch_size=DIGEST_FETCH_SIZE):
+        """
+        Args:
+          query_timeout: Seconds a query may run on the target, the server stops it afterwards.
+          query_timeout_grace: Seconds the agent waits past query_timeout before it gives up on the connection.
+          max_retries: Number of times a query that hit a connection problem is retried.
+          retry_base_backoff: Seconds of the backoff before the first retry, it doubles at each retry.
+          retry_max_backoff: Maximum seconds of the backoff.
+          prepared_statement_cache_size: Number of statements kept prepared on each connection.
+          digest_fetch_size: Number of rows read at a time into the digest of a result set.
+        """
+        self.query_timeout = query_timeout
+        self.query_timeout_grace = query_timeout_grace
+        self.max_retries = max_retries
+        self.retry_base_backoff = retry_base_backoff
+        self.retry_max_backoff = retry_max_backoff
+        self.prepared_statement_cache_size = prepared_statement_cache_size
+        self.digest_fetch_size = digest_fetch_size
+        self.statement_caches = weakref.WeakKeyDictionary()
+
+    async def _backoff(self, attempt):
+        # Exponential backoff with jitter before a query that hit a connection problem is retried
+        backoff = min(self.retry_max_backoff, self.retry_base_backoff * 2 ** (attempt - 1))
+        await asyncio.sleep(random.uniform(backoff / 2, backoff))
+
+    async def process_log(self, log, pool, controller, validate_mode=EXECUTE, latencies=None, limiter=None):
+        """
+        Check one log, retried while it hits connection problems.
+
+        The message and the code of the result are set on the log, with the
+        digest of its rows in compare mode, which the caller takes out before
+        the log is reported.
+        """
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                await self._backoff(attempt)
+
+            if limiter is not None:
+                await limiter.acquire()
+            started = await controller.acquire()
+            result = await self.execute_query(database=log['database'], query=log['query'], pool=pool,
+                                              validate_mode=validate_mode)
+            await controller.release(started, QUERY_OUTCOMES.get(result['code'], SUCCESS))
+
+            if result['code'] != CODE_UNAVAILABLE:
+                break
+
+        log['message']=result['message']
+        log['code']=result['code']
+        if latencies is not None and result['code'] == CODE_SUCCESS:
+            latencies.record(log['sql_hash'], result['latency'])
+        if 'digest' in result:
+            # Taken out by the caller before the log is reported
+            log['digest'] = result['digest']
+
+        return log
+
+    async def process_batch(self, batch, pool, controller, validate_mode, limiter=None):
+        """Check a batch of logs of the same database, only the queries that hit a connection problem are retried."""
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                await self._backoff(attempt)
+
+            if limiter is not None:
+                # Each query of the batch counts against the limit
+                await limiter.acquire(len(pending))
+            started = await controller.acquire()
+            results = await self.execute_batch(database=pending[0]['database'], queries=[log['query'] for log in pending],
+                                               pool=pool, validate_mode=validate_mode)
+            await controller.release(started, batch_outcome(results))
+
+            retried = []
+            for log, result in zip(pending, results):
+                log['message']=result['message']
+                log['code']=result['code']
+                if result['code'] == CODE_UNAVAILABLE:
+                    retried.append(log)
+            pending = retried
+            if not pending:
+                break
+
+        return batch
+
+    async def compare_on_endpoints(self, log, digest, compare_pools):
+        """Run a query that succeeded on the target on the compare clusters, one difference per cluster whose rows differ."""
+        results = await asyncio.gather(*[self.execute_query(database=log['database'], query=log['query'],
+                                                            pool=compare_pool, validate_mode=COMPARE)
+                                         for compare_pool in compare_pools.values()])
+        diffs = []
+        for endpoint, result in zip(compare_pools, results):
+            if result['code'] == CODE_SUCCESS and result['digest'] != digest:
+                message = (f'{endpoint} returned different rows ({result["digest"].split(":")[0]} rows, '
+                           f'the target returned {digest.split(":")[0]})')
+            elif result['code'] == CODE_ERROR:
+                message = f'{endpoint} failed: {result["message"]}'
+            else:
+                # Nothing is known about the rows of an unavailable cluster or a query that timed out
+                continue
+            diffs.append(dict(log, message=message, code=CODE_WARNING))
+        return diffs
+
+    async def replay_on_baseline(self, log, baseline_pool, validate_mode, latencies):
+        """Run a query that succeeded on the target on the baseline cluster, only its latency is kept."""
+        result = await self.execute_query(database=log['database'], query=log['query'], pool=baseline_pool,
+                                          validate_mode=validate_mode)
+        if result['code'] == CODE_SUCCESS:
+            latencies.record(log['sql_hash'], result['latency'], baseline=True)
+
+    async def execute_query(self, database, query, pool, validate_mode=EXECUTE):
+        """Execute a query, or only have it parsed by the server depending on the validate mode."""
+        result = {
+            'code': CODE_SUCCESS,
+            'message': ''
+        }
+        try:
+            async with pool.acquire(database) as db_connection:
+                started = time.monotonic()
+                try:
+                    if validate_mode == EXECUTE_PREPARED:
+                        statements = self.statement_caches.setdefault(
+                            db_connection, StatementCache(self.prepared_statement_cache_size))
+                        warning = await asyncio.wait_for(self.run_prepared(db_connection, database, query, statements),
+                                                         timeout=self.query_timeout + self.query_timeout_grace)
+                    else:
+                        warning = None
+                        digest = await asyncio.wait_for(self.run_statements(db_connection, query, validate_mode),
+                                                        timeout=self.query_timeout + self.query_timeout_grace)
+                        if digest is not None:
+                            result['digest'] = digest
+                    # Round trip time of the query, the rows are read by the time it completes
+                    result['latency'] = time.monotonic() - started
+                    if warning:
+                        result['code'] = CODE_WARNING
+                        result['message'] = warning
+                except asyncio.TimeoutError:
+                    # The server did not stop the query, the connection is closed so the pool drops it
+                    db_connection.close()
+                    result['code'] = CODE_TIMEOUT
+                    result['message'] = f'The query did not finish within {self.query_timeout} seconds'
+        except Exception as e:
+            result = error_result(e)
+
+        return result
+
+    async def execute_batch(self, database, queries, pool, validate_mode):
+        """Check several queries of a database in multi-statement round trips, one result per query."""
+        results = [None] * len(queries)
+        start = 0
+        try:
+            async with pool.acquire(database) as db_connection:
+                while start < len(queries):
+                    statements, owners = batch_statements(queries[start:], validate_mode, db_connection.escape)
+                    completed = []
+                    try:
+                        await asyncio.wait_for(self.run_batch(db_connection, statements, completed),
+                                               timeout=self.query_timeout + self.query_timeout_grace)
+                        error = None
+                    except Exception as e:
+                        error = e
+
+                    # The server stops a batch at its first failing statement, the queries before it passed
+                    failed = checked_count(owners, len(completed), len(queries) - start)
+                    for i in range(start, start + failed):
+                        results[i] = {'code': CODE_SUCCESS, 'message': ''}
+                    if error is None or start + failed == len(queries):
+                        # Without an error, the queries the server returned no result for were not
+                        # checked, they are left unavailable and retried by the caller
+                        break
+
+                    if isinstance(error, asyncio.TimeoutError):
+                        # The server did not answer, the connection is closed so the pool drops it
+                        db_connection.close()
+                        result = {'code': CODE_TIMEOUT,
+                                  'message': f'The batch did not finish within {self.query_timeout} seconds'}
+                    elif is_transient_error(error):
+                        # Raised out of the acquire block like in execute_query, so the router of the
+                        # endpoints counts the connection problem
+                        raise error
+                    else:
+                        result = error_result(error)
+                    results[start + failed] = result
+                    start = start + failed + 1
+                    if db_connection.closed:
+                        # The connection is gone, the rest of the batch is retried by the caller
+                        break
+        except Exception as e:
+            # No connection could be opened or switched to the database, or it was lost in the middle of
+            # the batch, every query left gets the error and is retried by the caller when it is transient
+            error = error_result(e)
+            results = [result or dict(error) for result in results]
+
+        unavailable = {'code': CODE_UNAVAILABLE, 'message': 'The batch stopped before the query was checked'}
+        return [result or dict(unavailable) for result in results]
+
+    async def run_statements(self, db_connection, query, validate_mode):
+        """
+        Run the statements checking one query on a connection already on its database.
+
+        The rows are discarded when the cursor is closed, unless the digest of
+        the result set is returned in compare mode.
+        """
+        async with db_connection.cursor() as cursor:
+            for statement in validation_statements(query, validate_mode, db_connection.escape):
+                await cursor.execute(statement)
+            if validate_mode == COMPARE:
+                # The rows are streamed into the digest of the result set, they are never held
+                digest = RowDigest()
+                rows = await cursor.fetchmany(self.digest_fetch_size)
+                while rows:
+                    for row in rows:
+                        digest.add(row)
+                    rows = await cursor.fetchmany(self.digest_fetch_size)
+                return digest.hexdigest()
+        return None
+
+    async def run_prepared(self, db_connection, database, query, statements):
+        """Run a query through a statement prepared once per connection, tell when it only fails when prepared."""
+        query = query.rstrip().rstrip(';')
+        template, literals = parameterize_sql(query)
+        key = (database, template)
+        async with db_connection.cursor() as cursor:
+            entry = statements.get(key)
+            if entry is None:
+                name = statements.next_name()
+                error = None
+                try:
+                    await cursor.execute(prepare_statement(name, template, db_connection.escape))
+                except aiomysql.MySQLError as e:
+                    if is_transient_error(e) or is_timeout_error(e):
+                        raise
+                    name, error = None, e
+                evicted = statements.add(key, name, error)
+                if evicted is not None:
+                    await cursor.execute(f'DEALLOCATE PREPARE {evicted}')
+            else:
+                name, error = entry
+
+            if name is None:
+                # The server refused the template, the query itself tells whether it is incompatible
+                if not is_single_statement(query):
+                    raise error
+                await cursor.execute(query)
+                return f'The query only fails when prepared: {error}'
+
+            await cursor.execute(execute_statement(name, literals))
+            if literals:
+                # The first result is the one of setting the literals
+                await cursor.nextset()
+        return None
+
+    async def run_batch(self, db_connection, statements, completed):
+        """Run a multi-statement batch, each statement whose result was read is appended to completed."""
+        async with db_connection.cursor(aiomysql.Cursor) as cursor:
+            await cursor.execute(batch_text(statements))
+            completed.append(statements[0])
+            while await cursor.nextset():
+                completed.append(statements[len(completed)])
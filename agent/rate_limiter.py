@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the queries sent per second.
+
+    The bucket holds at most one second of tokens, so a quiet period lets at
+    most ``rate`` queries through at once. Queries wait in the order they
+    asked. A batch may ask for more tokens than the bucket holds, it is let
+    through once the bucket is full and the tokens it borrowed are paid back
+    before the next query.
+    """
+
+    def __init__(self, rate, clock=time.monotonic):
+        """
+        Args:
+          rate: Queries per second.
+          clock: Function returning the current time in seconds.
+        """
+        self._clock = clock
+        self.rate = max(rate, 0.001)
+        self._tokens = self.rate
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate):
+        """Change the number of queries per second, the tokens already in the bucket are kept."""
+        self._refill()
+        self.rate = max(rate, 0.001)
+        self._tokens = min(self._tokens, self.rate)
+
+    async def acquire(self, tokens=1):
+        """Wait until ``tokens`` queries may be sent."""
+        async with self._lock:
+            while True:
+                self._refill()
+                needed = min(tokens, self.rate)
+                if self._tokens >= needed:
+                    self._tokens = self._tokens - tokens
+                    return
+                await asyncio.sleep((needed - self._tokens) / self.rate)
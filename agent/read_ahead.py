@@ -0,0 +1,89 @@
+import queue
+import threading
+
+# Seconds between two checks of the stop flag by a producer waiting for room
+_POLL_INTERVAL = 0.5
+
+_END = object()
+
+
+class ReadAhead:
+    """
+    Iterate over items produced by a background thread ahead of the consumer.
+
+    The thread starts producing as soon as ``start`` is called, before
+    anything is consumed, and stays at most ``size`` items ahead. An exception
+    raised by the producer is raised again by the consumer once it reaches
+    it. ``close`` stops the producer, whether or not everything was consumed.
+    """
+
+    def __init__(self, produce, size, name='read-ahead'):
+        """
+        Args:
+          produce: Function returning the iterable to read ahead, it is called
+            in the background thread so the resources it opens belong to it.
+          size: Maximum number of items produced and not consumed yet.
+          name: Name of the background thread.
+        """
+        self._produce = produce
+        self._items = queue.Queue(maxsize=max(1, size))
+        self._stopped = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            iterator = iter(self._produce())
+            try:
+                for item in iterator:
+                    if not self._put((item, None)):
+                        return
+            finally:
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+        except BaseException as e:
+            self._put((_END, e))
+            return
+        self._put((_END, None))
+
+    def _put(self, entry):
+        # Wait for room, unless the consumer went away
+        while not self._stopped.is_set():
+            try:
+                self._items.put(entry, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        item, error = self._items.get()
+        if item is _END:
+            self._done = True
+            if error is not None:
+                raise error
+            raise StopIteration
+        return item
+
+    def close(self):
+        """Stop the producer and wait for it to release what it opened."""
+        self._done = True
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
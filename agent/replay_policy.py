@@ -0,0 +1,61 @@
+import threading
+
+
+class ReplayPolicy:
+    """
+    Decide which sampled logs of a fingerprint are worth replaying.
+
+    Queries with the same fingerprint only differ by their literals and almost
+    never differ in compatibility, so a fingerprint is replayed for at most
+    ``max_variants`` distinct query texts, and no more once its last
+    ``stop_after_successes`` replays all succeeded. A limit of 0 turns that
+    rule off. The logs left out are counted per fingerprint.
+
+    ``should_replay`` is called by the thread reading the audit log and
+    ``record`` by the replay workers, both may run at the same time.
+    """
+
+    def __init__(self, max_variants=0, stop_after_successes=0):
+        self.max_variants = max_variants
+        self.stop_after_successes = stop_after_successes
+        self.replayed = {}
+        self.skipped = {}
+        self._variants = {}
+        self._successes = {}
+        self._lock = threading.Lock()
+
+    def should_replay(self, log):
+        """Tell whether a sampled log is replayed, and count it as replayed or skipped."""
+        sql_hash = log['sql_hash']
+        with self._lock:
+            if self._is_exhausted(sql_hash, log['query']):
+                self.skipped[sql_hash] = self.skipped.get(sql_hash, 0) + 1
+                return False
+            self.replayed[sql_hash] = self.replayed.get(sql_hash, 0) + 1
+            return True
+
+    def skip(self, sql_hash):
+        """Count a sampled log left out for another reason."""
+        with self._lock:
+            self.skipped[sql_hash] = self.skipped.get(sql_hash, 0) + 1
+
+    def _is_exhausted(self, sql_hash, query):
+        if self.stop_after_successes and self._successes.get(sql_hash, 0) >= self.stop_after_successes:
+            return True
+        if self.max_variants:
+            variants = self._variants.setdefault(sql_hash, set())
+            variant = hash(query)
+            if variant in variants or len(variants) >= self.max_variants:
+                return True
+            variants.add(variant)
+        return False
+
+    def record(self, sql_hash, succeeded):
+        """Record whether a replayed log of the fingerprint ran without a compatibility error."""
+        if not self.stop_after_successes:
+            return
+        with self._lock:
+            if succeeded:
+                self._successes[sql_hash] = self._successes.get(sql_hash, 0) + 1
+            else:
+                self._successes[sql_hash] = 0
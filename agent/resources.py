@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Seconds the credentials read from Secrets Manager are used before they are read again
+SECRET_TTL = 300
+
+# Seconds a connection pool may stay unused between subtasks before it is closed
+POOL_IDLE_TIMEOUT = 600
+
+# Seconds between two checks for unused pools, while no subtask leases or returns one
+SWEEP_INTERVAL = 60
+
+
+class ResourceManager:
+    """
+    Resources the agent keeps from one subtask to the next.
+
+    An event loop runs in a background thread for the life of the agent and
+    the subtasks run their replay on it, so the connections they open outlive
+    them. A subtask leases the connection pools it needs by key (the endpoint
+    and the session settings) and gives them back with their idle connections
+    still open, the next subtask with the same key starts on a warm pool. A
+    pool nobody leased for ``pool_idle_timeout`` seconds is closed.
+
+    Clients are made once by name and the secret is read again every
+    ``secret_ttl`` seconds, or as soon as it is invalidated because the
+    credentials were refused after a rotation.
+    """
+
+    def __init__(self, load_secret, make_client, secret_ttl=SECRET_TTL, pool_idle_timeout=POOL_IDLE_TIMEOUT,
+                 io_workers=None, sweep_interval=SWEEP_INTERVAL, clock=time.monotonic):
+        """
+        Args:
+          load_secret: Function reading the credentials.
+          make_client: Function making the client of a name.
+          secret_ttl: Seconds the credentials are cached.
+          pool_idle_timeout: Seconds an unused pool is kept open.
+          io_workers: Number of threads of the event loop's default executor,
+            which runs the blocking calls, asyncio's default when None.
+          sweep_interval: Seconds between two checks for unused pools.
+          clock: Function returning the current time in seconds.
+        """
+        self.secret_ttl = secret_ttl
+        self.pool_idle_timeout = pool_idle_timeout
+        self.io_workers = io_workers
+        self.sweep_interval = sweep_interval
+        self.secret_loads = 0
+        self._load_secret = load_secret
+        self._make_client = make_client
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Apart from _lock, loading the secret may need a client
+        self._secret_lock = threading.Lock()
+        self._clients = {}
+        self._secret = None
+        self._secret_expires = 0.0
+        # Pools given back and not leased again, by key, with the time they were given back
+        self._idle_pools = {}
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        """Start the event loop thread."""
+        self._loop = asyncio.new_event_loop()
+        if self.io_workers is not None:
+            self._loop.set_default_executor(ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix='replay-io'))
+        self._thread = threading.Thread(target=self._loop.run_forever, name='replay-loop', daemon=True)
+        self._thread.start()
+        # An agent without subtasks left still closes its unused pools
+        self._loop.call_soon_threadsafe(self._sweep)
+        return self
+
+    def _sweep(self):
+        self._close_expired_pools()
+        self._loop.call_later(self.sweep_interval, self._sweep)
+
+    def run(self, coroutine):
+        """Run a coroutine on the event loop and wait for its result, from any other thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def client(self, name):
+        """Get the client of a name, made at the first call."""
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = self._make_client(name)
+            return self._clients[name]
+
+    def secret(self):
+        """Get the credentials, read again once they are older than secret_ttl."""
+        with self._secret_lock:
+            if self._secret is None or self._clock() >= self._secret_expires:
+                self._secret = self._load_secret()
+                self._secret_expires = self._clock() + self.secret_ttl
+                self.secret_loads = self.secret_loads + 1
+            return self._secret
+
+    def invalidate_secret(self, secret):
+        """
+        Read the credentials again at the next call of secret.
+
+        Args:
+          secret: Credentials that were refused, nothing changes when they
+            were already replaced, so many connections refused at once only
+            read the secret once.
+        """
+        with self._secret_lock:
+            if self._secret is secret:
+                self._secret = None
+
+    def lease_pool(self, key, create):
+        """
+        Get the idle pool of a key, else a new pool made by ``create``. Only call it on the event loop.
+        """
+        self._close_expired_pools()
+        pools = self._idle_pools.get(key)
+        if pools:
+            pool, _ = pools.pop()
+            return pool
+        return create()
+
+    def return_pool(self, key, pool):
+        """Give back a leased pool, it is kept with its idle connections unless it was closed."""
+        if not pool.closed:
+            self._idle_pools.setdefault(key, []).append((pool, self._clock()))
+        self._close_expired_pools()
+
+    def _close_expired_pools(self):
+        now = self._clock()
+        for key in list(self._idle_pools):
+            kept = []
+            for pool, returned in self._idle_pools[key]:
+                if now - returned >= self.pool_idle_timeout:
+                    pool.close()
+                else:
+                    kept.append((pool, returned))
+            if kept:
+                self._idle_pools[key] = kept
+            else:
+                del self._idle_pools[key]
+
+    def close(self):
+        """Close the idle pools and stop the event loop."""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._close_pools)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def _close_pools(self):
+        for pools in self._idle_pools.values():
+            for pool, _ in pools:
+                pool.close()
+        self._idle_pools.clear()
@@ -0,0 +1,44 @@
+from hashlib import blake2b
+
+_MODULUS = 2 ** 128
+
+
+class RowDigest:
+    """
+    Order insensitive digest of a result set, fed one row at a time.
+
+    Each row is hashed and the hashes are added modulo 2 ** 128, so two result
+    sets with the same rows in any order, duplicates included, have the same
+    digest. Only the sum and the row count are kept, never the rows.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._sum = 0
+
+    def add(self, row):
+        """Add a row, a sequence of column values as returned by the driver."""
+        row_hash = blake2b(_encode(row), digest_size=16).digest()
+        self._sum = (self._sum + int.from_bytes(row_hash, 'big')) % _MODULUS
+        self.count = self.count + 1
+
+    def hexdigest(self):
+        """Digest of the rows added so far, it includes the row count."""
+        return f'{self.count}:{self._sum:032x}'
+
+
+def _encode(row):
+    # Each value is tagged with its type and length so that ('ab', 'c') and ('a', 'bc') differ
+    parts = []
+    for value in row:
+        if value is None:
+            parts.append(b'n')
+            continue
+        if isinstance(value, bytes):
+            tag, data = b'b', value
+        elif isinstance(value, str):
+            tag, data = b's', value.encode('utf-8')
+        else:
+            tag, data = b'v', repr(value).encode('utf-8')
+        parts.append(tag + len(data).to_bytes(4, 'big') + data)
+    return b''.join(parts)
@@ -0,0 +1,139 @@
+import contextlib
+import gzip
+import io
+import queue
+import threading
+
+# Size of each ranged read from the GetObject body
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Number of downloaded chunks that may wait for the parser
+DEFAULT_MAX_CHUNKS = 8
+
+# Number of times a failed read is resumed with a ranged request
+DEFAULT_MAX_RETRIES = 3
+
+
+class S3StreamReader(io.RawIOBase):
+    """
+    Raw, read-only stream over the body of an S3 GetObject response.
+
+    A background thread reads the body in fixed size chunks and hands them to
+    the consumer through a bounded queue, so the download keeps going while the
+    caller decompresses and parses, and at most ``max_chunks`` chunks are held
+    in memory at any time. When a read fails and ``reopen`` is given, it is
+    called with the offset reached so far and must return a new body starting
+    at that offset.
+    """
+
+    def __init__(self, body, chunk_size=DEFAULT_CHUNK_SIZE, max_chunks=DEFAULT_MAX_CHUNKS,
+                 reopen=None, max_retries=DEFAULT_MAX_RETRIES):
+        super().__init__()
+        self._body = body
+        self._reopen = reopen
+        self._max_retries = max_retries
+        self._offset = 0
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._stopped = threading.Event()
+        self._buffer = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._download, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # Block while the queue is full, but give up once the reader is closed
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _read_chunk(self):
+        retries = 0
+        while True:
+            try:
+                return self._body.read(self._chunk_size)
+            except Exception:
+                # The connection may be dropped while the parser holds the download back,
+                # continue from the current offset with a new ranged request
+                if self._reopen is None or retries >= self._max_retries:
+                    raise
+                retries = retries + 1
+                try:
+                    self._body.close()
+                except Exception:
+                    pass
+                self._body = self._reopen(self._offset)
+
+    def _download(self):
+        try:
+            while not self._stopped.is_set():
+                chunk = self._read_chunk()
+                if not chunk:
+                    break
+                self._offset = self._offset + len(chunk)
+                self._put(chunk)
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._buffer:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+                return 0
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            self._buffer = memoryview(item)
+
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            try:
+                self._body.close()
+            except Exception:
+                pass
+        super().close()
+
+
+@contextlib.contextmanager
+def open_gzip_object(s3_client, bucket_name, file_key,
+                     chunk_size=DEFAULT_CHUNK_SIZE, max_chunks=DEFAULT_MAX_CHUNKS):
+    """
+    Open a gzip compressed S3 object as a binary file of decompressed data.
+
+    The object is streamed from S3 and decompressed as it arrives, nothing is
+    written to disk. A dropped connection is resumed from the last byte read.
+
+    Args:
+      s3_client: boto3 S3 client.
+      bucket_name: The name of the S3 bucket.
+      file_key: The key of the .gz object within the bucket.
+    """
+    response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
+
+    def reopen(offset):
+        return s3_client.get_object(Bucket=bucket_name, Key=file_key, Range=f'bytes={offset}-',
+                                    IfMatch=response['ETag'])['Body']
+
+    raw = S3StreamReader(response['Body'], chunk_size=chunk_size, max_chunks=max_chunks, reopen=reopen)
+    try:
+        with gzip.GzipFile(fileobj=io.BufferedReader(raw, buffer_size=chunk_size), mode='rb') as gz_file:
+            yield gz_file
+    finally:
+        raw.close()
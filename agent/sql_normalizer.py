@@ -0,0 +1,291 @@
+import re
+from hashlib import blake2b
+
+# All the tokens that are rewritten while masking a query, matched in a single
+# scan. Anything that is not matched (keywords, identifiers, operators and
+# single spaces) is copied through unchanged. The leading lookahead lists every
+# character a token can start with, it lets the regex engine skip ahead to the
+# next candidate instead of trying each alternative at every position. A space
+# only starts a token before more whitespace or a comment, the single spaces
+# between words are skipped too.
+_TOKEN = re.compile(r"""
+    (?=\ [\s\#\-/]|(?!\ )[\s\d\-\#/\\'"xXbBnN])
+    (?:
+      (?P<space>(?!\ (?![\s\#]|--|/\*))(?:\s|--[^\n]*|\#[^\n]*|/\*.*?\*/)+)
+    | (?P<escape>\\(?:[\0'"\n\r\t%\\]|(?=\w)|\Z))
+    | (?P<string>'[^'\\]*(?:\\.[^'\\]*)*')
+    | (?P<dstring>"[^"\\]*(?:\\.[^"\\]*)*")
+    | (?P<hex>\b(?:0x[0-9a-fA-F]+|0b[01]+)\b|\b[xX]'[0-9a-fA-F]*'|\b[bB]'[01]*')
+    | (?P<negative>-\s*\b\d+(?:\.\d+)?\b)
+    | (?P<number>\b\d+(?:\.\d+)?\b)
+    | (?P<null>\b[nN][uU][lL][lL]\b)
+    )
+""", re.VERBOSE | re.DOTALL)
+
+_BLOCK_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+
+# Characters and keywords after which a '-' is a sign rather than a subtraction
+_UNARY_PRECEDING_CHARS = frozenset('(,=<>+-*/%!|&^~')
+_UNARY_PRECEDING_KEYWORDS = frozenset([
+    'ALL', 'AND', 'ANY', 'BETWEEN', 'BY', 'CASE', 'DEFAULT', 'DISTINCT', 'DIV', 'ELSE',
+    'HAVING', 'IN', 'INTERVAL', 'IS', 'LIKE', 'LIMIT', 'MOD', 'NOT', 'OFFSET', 'ON', 'OR',
+    'RETURN', 'SELECT', 'SET', 'THEN', 'VALUE', 'VALUES', 'WHEN', 'WHERE', 'XOR',
+])
+
+# NULL stays visible after these keywords (IS NULL, IS NOT NULL, NOT NULL)
+_NULL_PRECEDING_KEYWORDS = frozenset(['IS', 'NOT'])
+
+# Literals after these keywords are kept by parameterize_sql, a parameter would
+# change the query (ORDER BY 1) or is not allowed there (DATE '2024-01-01', AS 'total')
+_INLINE_LITERAL_KEYWORDS = frozenset(['AS', 'BY', 'DATE', 'TIME', 'TIMESTAMP'])
+
+_NUMBER = re.compile(r'\d+(?:\.\d+)?$')
+
+# The length, precision or scale of a type, CHAR(20) or DECIMAL(10, 2), is never a parameter. It is
+# matched on the text right before a number.
+_TYPE_ARGUMENTS = re.compile(r'''
+    \b(?:BIGINT|BINARY|BIT|CHAR|CHARACTER|DATETIME|DEC|DECIMAL|DOUBLE|FIXED|FLOAT|INT|INTEGER|MEDIUMINT|NCHAR
+         |NUMERIC|NVARCHAR|REAL|SMALLINT|TIME|TIMESTAMP|TINYINT|VARBINARY|VARCHAR|YEAR)
+    \s*\(\s*(?:\d+\s*,\s*)?$
+''', re.VERBOSE | re.IGNORECASE)
+_TYPE_ARGUMENTS_WINDOW = 64
+
+# Strings only separated by whitespace or comments are concatenated by the server, 'a' 'b' is 'ab'
+_SEPARATED_STRINGS = re.compile(r'[\'"]\s+[\'"]|[\'"]\s*(?:--|\#|/\*)')
+_BLANK = re.compile(r'(?:\s|--[^\n]*|\#[^\n]*|/\*.*?\*/)+', re.DOTALL)
+
+# Fingerprint versions. Version 1 is the original masking, version 2 also
+# collapses literal lists and repeated VALUES rows, uppercases keywords and
+# drops backticks, so queries that only differ by the length of a list or the
+# number of inserted rows share a fingerprint.
+NORMALIZER_VERSIONS = (1, 2)
+
+# Keywords written in upper case by version 2
+_KEYWORDS = frozenset([
+    'ALL', 'ALTER', 'AND', 'AS', 'ASC', 'BETWEEN', 'BY', 'CALL', 'CASE', 'CREATE', 'CROSS',
+    'DELETE', 'DESC', 'DISTINCT', 'DROP', 'DUPLICATE', 'ELSE', 'END', 'EXISTS', 'FOR', 'FORCE',
+    'FROM', 'FULL', 'GROUP', 'HAVING', 'IGNORE', 'IN', 'INDEX', 'INNER', 'INSERT', 'INTERVAL',
+    'INTO', 'IS', 'JOIN', 'KEY', 'LEFT', 'LIKE', 'LIMIT', 'LOCK', 'MODE', 'NATURAL', 'NOT',
+    'NULL', 'OFFSET', 'ON', 'OR', 'ORDER', 'OUTER', 'REGEXP', 'REPLACE', 'RIGHT', 'ROLLUP',
+    'SELECT', 'SET', 'SHARE', 'STRAIGHT_JOIN', 'TABLE', 'THEN', 'UNION', 'UPDATE', 'USE',
+    'USING', 'VALUE', 'VALUES', 'WHEN', 'WHERE', 'WITH', 'XOR',
+])
+
+# Split on the words, they end up at the odd indexes
+_WORDS = re.compile(r'(\b[A-Za-z_][A-Za-z0-9_]*\b)')
+_OPEN_SPACING = re.compile(r'\(\s+')
+_CLOSE_SPACING = re.compile(r'\s+\)')
+_COMMA_SPACING = re.compile(r'\s*,\s*')
+_IN_LIST = re.compile(r"\bIN\s*\((?:1|'')(?:, (?:1|''))*\)")
+_VALUES_ROWS = re.compile(r'\b(VALUES?)\s*(\((?:[^()]|\([^()]*\))*\))(?:, \2)*')
+_LITERAL_ROW = r"\((?:1|'')(?:, (?:1|''))*\)"
+_LITERAL_ROWS = re.compile(rf'\b(VALUES?) ({_LITERAL_ROW}(?:, {_LITERAL_ROW})+)')
+
+
+def _previous_word(query, pos):
+    """Return the character and the word (upper case) right before pos, skipping whitespace."""
+    i = pos - 1
+    while i >= 0 and query[i].isspace():
+        i -= 1
+    if i < 0:
+        return '', ''
+    end = i + 1
+    while i >= 0 and (query[i].isalnum() or query[i] == '_'):
+        i -= 1
+    return query[end - 1], query[i + 1:end].upper()
+
+
+def _space(match):
+    text = match.group()
+    # /* */ comments are dropped without leaving a separator behind
+    if '/*' in text and not _BLOCK_COMMENT.sub('', text):
+        return ''
+    return ' '
+
+
+def _negative(match):
+    char, word = _previous_word(match.string, match.start())
+    if _is_unary(char, word):
+        return '1'
+    # A subtraction, only the number is masked
+    return '-1' if match.group()[1].isdigit() else '- 1'
+
+
+def _null(match):
+    _, word = _previous_word(match.string, match.start())
+    if word in _NULL_PRECEDING_KEYWORDS:
+        return match.group()
+    return '1'
+
+
+# Replacement for each group of _TOKEN, either a constant or a function of the match
+_REPLACEMENTS = (None, _space, '', "''", "''", '1', _negative, '1', _null)
+
+
+def _replace(match):
+    replacement = _REPLACEMENTS[match.lastindex]
+    if replacement.__class__ is str:
+        return replacement
+    return replacement(match)
+
+
+def _upper_keywords(sql_mask):
+    # One split and a loop over the words, a replacement function would be called for every word
+    parts = _WORDS.split(sql_mask)
+    for i in range(1, len(parts), 2):
+        upper = parts[i].upper()
+        if upper in _KEYWORDS:
+            parts[i] = upper
+    return ''.join(parts)
+
+
+def _literal_rows(match):
+    rows = [row[1:-1].split(', ') for row in re.findall(_LITERAL_ROW, match.group(2))]
+    if len({len(row) for row in rows}) > 1:
+        return match.group()
+    # A column keeps its masked literal when every row agrees, a column mixing strings and numbers or NULL is 1
+    columns = [values[0] if len(set(values)) == 1 else '1' for values in zip(*rows)]
+    return f'{match.group(1)} ({", ".join(columns)})'
+
+
+def _canonical(sql_mask):
+    """Rewrite a version 1 masked query into its version 2 form."""
+    sql_mask = _upper_keywords(sql_mask.replace('`', ''))
+    # Every whitespace character of a version 1 mask is a space, the patterns needing one are skipped without it.
+    # The spaces inside parentheses are removed before the ones around commas, like in a single scan.
+    if '( ' in sql_mask:
+        sql_mask = _OPEN_SPACING.sub('(', sql_mask)
+    if ' )' in sql_mask:
+        sql_mask = _CLOSE_SPACING.sub(')', sql_mask)
+    if ',' in sql_mask:
+        sql_mask = _COMMA_SPACING.sub(', ', sql_mask)
+    # The keywords are upper case by now, the patterns starting with one are skipped when it is missing
+    if 'IN (' in sql_mask or 'IN(' in sql_mask:
+        sql_mask = _IN_LIST.sub('IN (...)', sql_mask)
+    if 'VALUE' in sql_mask:
+        # Rows of literals only are merged into one, whatever the literals of each row, other rows only when identical
+        sql_mask = _LITERAL_ROWS.sub(_literal_rows, sql_mask)
+        sql_mask = _VALUES_ROWS.sub(r'\1 \2', sql_mask)
+    return sql_mask
+
+
+def mask_sql(query, version=1):
+    """
+    Mask a SQL query into its fingerprint text in a single scan.
+
+    Comments are removed, whitespace is collapsed and every literal is masked:
+    quoted strings become '' and numbers, hex/bit literals, negative numbers and
+    NULL values become 1. Queries without double quoted strings, hex/bit
+    literals, negative numbers or NULL are masked exactly like the former
+    regular expression chain, so their fingerprints do not change.
+
+    Args:
+      query: The SQL text taken from the audit log.
+      version: Fingerprint version, one of NORMALIZER_VERSIONS. Version 2 also
+        turns IN lists of literals into IN (...), merges the VALUES rows of
+        literals and keeps one row of other repeated VALUES rows, uppercases keywords, removes backticks and the spaces
+        inside parentheses and around commas.
+
+    Returns:
+      The masked SQL text.
+    """
+    sql_mask = _TOKEN.sub(_replace, query).strip()
+    if version == 1:
+        return sql_mask
+    if version == 2:
+        return _canonical(sql_mask)
+    raise ValueError(f'unknown normalizer version {version!r}')
+
+
+def _is_unary(char, word):
+    return not char or char in _UNARY_PRECEDING_CHARS or word in _UNARY_PRECEDING_KEYWORDS
+
+
+def _concatenated_strings(query):
+    """Return the start of the strings of query concatenated with another one by whitespace or comments."""
+    concatenated = set()
+    run = []
+    separated = False
+    run_end = -1
+    for match in _TOKEN.finditer(query):
+        if match.lastgroup not in ('string', 'dstring'):
+            continue
+        start = match.start()
+        if run and start != run_end and _BLANK.fullmatch(query, run_end, start):
+            separated = True
+        elif start != run_end:
+            if separated:
+                concatenated.update(run)
+            run = []
+            separated = False
+        run.append(start)
+        run_end = match.end()
+    if separated:
+        concatenated.update(run)
+    return concatenated
+
+
+def parameterize_sql(query):
+    """
+    Turn a query into a template with ? placeholders and the literals they stand for.
+
+    The literals are the ones masked by mask_sql, except the ones the server
+    does not take as parameters, which stay in the template: NULL after IS or
+    NOT, literals after a charset introducer (_utf8mb4'a', N'a'), the literals
+    after AS, BY, DATE, TIME and TIMESTAMP, the arguments of a type (CHAR(20),
+    DECIMAL(10, 2)), the parts of a number written .5 or 1.5e3 and strings
+    concatenated by whitespace ('a' 'b'). Comments and whitespace are kept.
+    The server may still refuse a template for a literal in another place it
+    does not take a parameter, the caller then runs the query itself.
+
+    Args:
+      query: The SQL text taken from the audit log.
+
+    Returns:
+      A tuple of the template and the list of the literal texts, in order.
+    """
+    literals = []
+    # End of the last parameter, a string right after it is the rest of 'it''s'
+    parameter_end = [-1]
+    inline_strings = _concatenated_strings(query) if _SEPARATED_STRINGS.search(query) else ()
+
+    def parameter(match):
+        kind = match.lastgroup
+        text = match.group()
+        if kind in ('space', 'escape'):
+            return text
+        start = match.start()
+        if kind in ('string', 'dstring'):
+            if start in inline_strings:
+                return text
+            if start == parameter_end[0]:
+                literals[-1] = literals[-1] + text
+                parameter_end[0] = match.end()
+                return ''
+        if start > 0 and (query[start - 1].isalnum() or query[start - 1] in '_.'):
+            return text
+        if kind in ('number', 'negative') and query.startswith('.', match.end()):
+            # The integer part of 1.5e3, the number pattern stops before an exponent
+            return text
+        if kind == 'number' and _TYPE_ARGUMENTS.search(query, max(0, start - _TYPE_ARGUMENTS_WINDOW), start):
+            return text
+        char, word = _previous_word(query, start)
+        if word in _INLINE_LITERAL_KEYWORDS or (kind == 'null' and word in _NULL_PRECEDING_KEYWORDS):
+            return text
+        if kind == 'negative':
+            number = _NUMBER.search(text).group()
+            if not _is_unary(char, word):
+                # A subtraction, only the number is a parameter
+                literals.append(number)
+                return text[:-len(number)] + '?'
+            text = '-' + number
+        literals.append(text)
+        parameter_end[0] = match.end()
+        return '?'
+
+    return _TOKEN.sub(parameter, query), literals
+
+
+def sql_fingerprint(sql_mask):
+    """Return the hash used to identify all queries sharing the same masked text."""
+    return blake2b(sql_mask.encode('utf-8')).hexdigest()
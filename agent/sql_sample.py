@@ -0,0 +1,99 @@
+# Attributes of the item of a fingerprint claimed by one subtask of the task, the first one to claim it
+OWNER = 'owner' # the subtask replaying the fingerprint
+FINDINGS_REPORTER = 'findings_reporter' # the subtask reporting the static analyzer findings of the fingerprint
+
+# Update expression writing the sample of a fingerprint, the first subtask of the task to write it wins
+SAMPLE_UPDATE_EXPRESSION = ("set #mask = if_not_exists(#mask, :mask), "
+                            "#sample = if_not_exists(#sample, :sample), #db = if_not_exists(#db, :db)")
+
+
+def sample_update_attributes(log):
+    """Return the names and values of SAMPLE_UPDATE_EXPRESSION for the first log of a fingerprint."""
+    names = {
+        '#mask': 'sql_mask',
+        '#sample': 'sql_sample',
+        '#db': 'database'
+    }
+    values = {
+        ':mask': log['sql_mask'],
+        ':sample': log['query'],
+        ':db': log['database']
+    }
+    return names, values
+
+
+def claim_sql_sample(table, task_id, s3_object_key, log, attribute=OWNER):
+    """
+    Claim a fingerprint for a subtask, the sample is written along if it is missing.
+
+    The owner of a fingerprint is claimed when the fingerprint becomes a replay
+    candidate, only the owner replays it within the task. The findings reporter
+    is claimed apart, when the static analyzer finds something the first time
+    the fingerprint is seen, so a subtask that only reports the findings never
+    keeps another one from replaying the fingerprint.
+
+    Args:
+      table: The DynamoDB table of the samples.
+      task_id: The task of the subtask.
+      s3_object_key: The audit log object of the subtask, it identifies it within the task.
+      log: A log of the fingerprint.
+      attribute: OWNER or FINDINGS_REPORTER.
+
+    Returns:
+      True when the subtask holds the claim, whether it just made it or made it in an earlier attempt.
+    """
+    names, values = sample_update_attributes(log)
+    names['#claim'] = attribute
+    values[':claim'] = s3_object_key
+    response = table.update_item(
+        Key={
+            'task_id': task_id,
+            'sql_hash': log['sql_hash']
+        },
+        UpdateExpression=SAMPLE_UPDATE_EXPRESSION + ", #claim = if_not_exists(#claim, :claim)",
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues='ALL_NEW'
+    )
+    return response['Attributes'][attribute] == s3_object_key
+
+
+def write_sql_sample(table, task_id, state, log):
+    """
+    Add the counters of a subtask to the item of a fingerprint.
+
+    The sample is written along unless the subtask already claimed the
+    fingerprint, nothing is claimed here.
+
+    Args:
+      table: The DynamoDB table of the samples.
+      task_id: The task of the subtask.
+      state: The state of the subtask, with its counters and claims.
+      log: The first log of the fingerprint.
+    """
+    sql_hash = log['sql_hash']
+    update_expression = "add #oc :oc, #rc :rc, #sc :sc"
+    names, values = {}, {}
+    if sql_hash not in state.owned and sql_hash not in state.findings_owned:
+        # A claim wrote the sample already
+        names, values = sample_update_attributes(log)
+        update_expression = SAMPLE_UPDATE_EXPRESSION + " " + update_expression
+    names.update({
+        '#oc': 'occurrence_count',
+        '#rc': 'replay_count',
+        '#sc': 'replay_skipped_count'
+    })
+    values.update({
+        ':oc': state.sql_count.get(sql_hash, 0),
+        ':rc': state.replay_policy.replayed.get(sql_hash, 0),
+        ':sc': state.replay_policy.skipped.get(sql_hash, 0)
+    })
+    table.update_item(
+        Key={
+            'task_id': task_id,
+            'sql_hash': sql_hash
+        },
+        UpdateExpression=update_expression,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
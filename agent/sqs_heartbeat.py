@@ -0,0 +1,61 @@
+import threading
+import traceback
+
+
+class VisibilityHeartbeat:
+    """
+    Keep a received SQS message invisible while its subtask is processed.
+
+    A background thread extends the visibility timeout of the message every
+    ``interval`` seconds, so a long subtask is never redelivered to another
+    worker, while a worker that dies only holds the message for one
+    ``visibility_timeout``.
+    """
+
+    def __init__(self, sqs_client, queue_url, receipt_handle, visibility_timeout, interval=None):
+        self._sqs = sqs_client
+        self._queue_url = queue_url
+        self._receipt_handle = receipt_handle
+        self._visibility_timeout = visibility_timeout
+        self._interval = interval if interval is not None else visibility_timeout / 3
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _change_visibility(self, visibility_timeout):
+        self._sqs.change_message_visibility(
+            QueueUrl=self._queue_url,
+            ReceiptHandle=self._receipt_handle,
+            VisibilityTimeout=visibility_timeout
+        )
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self._change_visibility(self._visibility_timeout)
+            except Exception as e:
+                print(f"An error occurred while extending message visibility: {e}")
+                traceback.print_exc()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def release(self):
+        """Stop the heartbeat and make the message visible again right away."""
+        self.stop()
+        try:
+            self._change_visibility(0)
+        except Exception as e:
+            print(f"An error occurred while releasing the message: {e}")
+            traceback.print_exc()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
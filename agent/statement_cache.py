@@ -0,0 +1,44 @@
+import collections
+
+_NAME_PREFIX = 'queries_check_s'
+
+
+class StatementCache:
+    """
+    Statements prepared on one connection, the least recently used is dropped first.
+
+    A statement is identified by the database and the template it was prepared
+    from. A template the server refused to prepare is kept with its error so it
+    is not sent again.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.prepare_count = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        """Get the (name, error) of a statement, or None when it was never prepared."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def next_name(self):
+        """Name for the next statement to prepare."""
+        self.prepare_count = self.prepare_count + 1
+        return f'{_NAME_PREFIX}{self.prepare_count}'
+
+    def add(self, key, name, error=None):
+        """
+        Keep a statement once it was prepared, or the error that refused it.
+
+        Returns:
+          The name of the statement dropped to make room, it must be deallocated, or None.
+        """
+        self._entries[key] = (name, error)
+        self._entries.move_to_end(key)
+        if len(self._entries) <= self.capacity:
+            return None
+        _, (evicted, _) = self._entries.popitem(last=False)
+        return evicted
@@ -0,0 +1,235 @@
+import re
+
+# Severity of a finding. An error is a query MySQL 8.0 rejects, it is reported
+# without being replayed. A warning is a query that still runs but may behave
+# differently.
+ERROR = 'error'
+WARNING = 'warning'
+
+# Tokens of a query, comments and whitespace are dropped, literals and quoted
+# identifiers are kept whole so the words inside them are never matched
+_TOKEN = re.compile(r"""
+      (?P<space>\s+|--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    | (?P<quoted>`(?:[^`]|``)*`)
+    | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    | (?P<variable>@@(?:(?:global|session|local)\.)?[\w$]+|@[\w$.]+)
+    | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+    | (?P<word>[A-Za-z_$][\w$]*)
+    | (?P<symbol>.)
+""", re.VERBOSE | re.DOTALL)
+
+_WORD = 'word'
+_SYMBOL = 'symbol'
+_VARIABLE = 'variable'
+_NUMBER = 'number'
+
+# Words that became reserved in MySQL 8.0, they can no longer be used as unquoted identifiers
+_NEW_RESERVED_WORDS = frozenset([
+    'ARRAY', 'CUBE', 'CUME_DIST', 'DENSE_RANK', 'EMPTY', 'EXCEPT', 'FIRST_VALUE', 'FUNCTION',
+    'GROUPING', 'GROUPS', 'INTERSECT', 'JSON_TABLE', 'LAG', 'LAST_VALUE', 'LATERAL', 'LEAD',
+    'MEMBER', 'NTH_VALUE', 'NTILE', 'OF', 'OVER', 'PERCENT_RANK', 'RANK', 'RECURSIVE', 'ROW',
+    'ROWS', 'ROW_NUMBER', 'SYSTEM', 'WINDOW',
+])
+
+# Words after which FUNCTION is the keyword itself, the statements on a function and GRANT ... ON FUNCTION
+_FUNCTION_STATEMENTS = frozenset(['ALTER', 'CREATE', 'DROP', 'ON', 'SHOW'])
+
+# Words after which a name followed by ( is a table, an index or a constraint, not a function call
+_NAME_BEFORE_PARENTHESIS = frozenset([
+    'CONSTRAINT', 'EXISTS', 'FROM', 'INDEX', 'INTO', 'JOIN', 'KEY', 'REFERENCES', 'TABLE', 'TABLES', 'UPDATE',
+])
+
+# Words starting a window frame after ROWS or GROUPS
+_FRAME_START = frozenset(['BETWEEN', 'CURRENT', 'UNBOUNDED'])
+
+# Functions removed in MySQL 8.0
+_REMOVED_FUNCTIONS = frozenset([
+    'AREA', 'ASBINARY', 'ASTEXT', 'ASWKB', 'ASWKT', 'BUFFER', 'CENTROID', 'CONTAINS', 'CROSSES',
+    'DECODE', 'DES_DECRYPT', 'DES_ENCRYPT', 'DIMENSION', 'DISJOINT', 'ENCODE', 'ENCRYPT',
+    'ENDPOINT', 'ENVELOPE', 'EQUALS', 'EXTERIORRING', 'GEOMCOLLFROMTEXT', 'GEOMCOLLFROMWKB',
+    'GEOMETRYCOLLECTIONFROMTEXT', 'GEOMETRYFROMTEXT', 'GEOMETRYN', 'GEOMETRYTYPE',
+    'GEOMFROMTEXT', 'GEOMFROMWKB', 'GLENGTH', 'INTERIORRINGN', 'INTERSECTS', 'ISCLOSED',
+    'ISEMPTY', 'ISSIMPLE', 'LINEFROMTEXT', 'LINEFROMWKB', 'LINESTRINGFROMTEXT', 'MLINEFROMTEXT',
+    'MPOINTFROMTEXT', 'MPOLYFROMTEXT', 'NUMGEOMETRIES', 'NUMINTERIORRINGS', 'NUMPOINTS',
+    'OLD_PASSWORD', 'OVERLAPS', 'PASSWORD', 'POINTFROMTEXT', 'POINTFROMWKB', 'POINTN',
+    'POLYFROMTEXT', 'POLYFROMWKB', 'POLYGONFROMTEXT', 'SRID', 'STARTPOINT', 'TOUCHES', 'WITHIN',
+    'X', 'Y',
+])
+
+# System variables removed in MySQL 8.0
+_REMOVED_VARIABLES = frozenset([
+    'date_format', 'datetime_format', 'have_crypt', 'ignore_builtin_innodb', 'ignore_db_dirs',
+    'innodb_file_format', 'innodb_file_format_check', 'innodb_file_format_max',
+    'innodb_large_prefix', 'innodb_locks_unsafe_for_binlog', 'innodb_support_xa',
+    'log_warnings', 'max_tmp_tables', 'metadata_locks_cache_size',
+    'metadata_locks_hash_instances', 'multi_range_count', 'old_passwords',
+    'query_cache_limit', 'query_cache_min_res_unit', 'query_cache_size', 'query_cache_type',
+    'query_cache_wlock_invalidate', 'secure_auth', 'show_compatibility_56', 'sync_frm',
+    'time_format', 'tx_isolation', 'tx_read_only',
+])
+
+_SET_SCOPES = frozenset(['GLOBAL', 'SESSION', 'LOCAL', 'PERSIST', 'PERSIST_ONLY'])
+
+# Words that end the GROUP BY clause of a query block
+_GROUP_BY_END = frozenset([
+    'FOR', 'HAVING', 'INTO', 'LIMIT', 'LOCK', 'ORDER', 'PROCEDURE', 'UNION', 'WINDOW',
+])
+
+
+def _tokenize(query):
+    """Return the (kind, text) tokens of a query, words are in upper case."""
+    tokens = []
+    for match in _TOKEN.finditer(query):
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+        text = match.group()
+        tokens.append((kind, text.upper() if kind == _WORD else text))
+    return tokens
+
+
+def _text(tokens, i):
+    if 0 <= i < len(tokens):
+        return tokens[i][1]
+    return ''
+
+
+def _first_word(tokens):
+    for kind, text in tokens:
+        if kind == _WORD:
+            return text
+        if text != '(':
+            return ''
+    return ''
+
+
+def _reserved_words(tokens):
+    words = []
+    for i, (kind, text) in enumerate(tokens):
+        if kind != _WORD or text not in _NEW_RESERVED_WORDS or text in words:
+            continue
+        # t.rank is allowed, rank( is a function or a window function
+        if _text(tokens, i - 1) == '.' or _text(tokens, i + 1) == '(':
+            continue
+        if text == 'FUNCTION' and _text(tokens, i - 1) in _FUNCTION_STATEMENTS:
+            continue
+        if _is_keyword(tokens, i, text):
+            continue
+        words.append(text)
+    for word in words:
+        yield ERROR, 'reserved-word', f'{word} is a reserved word in MySQL 8.0, quote it with backticks'
+
+
+def _is_keyword(tokens, i, word):
+    # The reserved word is used as the keyword it became, not as an identifier
+    previous, following = _text(tokens, i - 1), _text(tokens, i + 1)
+    if word in ('ROWS', 'GROUPS'):
+        # IGNORE 1 ROWS, ROWS BETWEEN ... of a window frame
+        return (i > 0 and tokens[i - 1][0] == _NUMBER) or following in _FRAME_START
+    if word == 'ROW':
+        # FOR EACH ROW of a trigger, CURRENT ROW of a window frame
+        return previous in ('EACH', 'CURRENT')
+    if word == 'RECURSIVE':
+        return previous == 'WITH'
+    if word == 'MEMBER':
+        return following == 'OF'
+    if word == 'OF':
+        # FOR UPDATE OF t, FOR SHARE OF t
+        return previous in ('UPDATE', 'SHARE')
+    if word == 'OVER':
+        # OVER w, a named window
+        return i + 1 < len(tokens) and tokens[i + 1][0] == _WORD
+    if word == 'EMPTY':
+        # NULL ON EMPTY of JSON_TABLE
+        return previous == 'ON'
+    return False
+
+
+def _removed_functions(tokens):
+    functions = []
+    for i, (kind, text) in enumerate(tokens):
+        if kind == _WORD and text in _REMOVED_FUNCTIONS and text not in functions \
+                and _text(tokens, i + 1) == '(' and _text(tokens, i - 1) != '.' \
+                and _text(tokens, i - 1) not in _NAME_BEFORE_PARENTHESIS:
+            functions.append(text)
+    for function in functions:
+        yield ERROR, 'removed-function', f'{function}() is removed in MySQL 8.0'
+
+
+def _removed_variables(tokens):
+    variables = []
+    is_set = _first_word(tokens) == 'SET'
+    for i, (kind, text) in enumerate(tokens):
+        if kind == _VARIABLE and text.startswith('@@'):
+            name = text[2:].rsplit('.', 1)[-1].lower()
+        elif is_set and kind == _WORD and _text(tokens, i + 1) in ('=', ':') \
+                and (_text(tokens, i - 1) in _SET_SCOPES or _text(tokens, i - 1) in ('SET', ',')):
+            name = text.lower()
+        else:
+            continue
+        if name in _REMOVED_VARIABLES and name not in variables:
+            variables.append(name)
+    for name in variables:
+        yield ERROR, 'removed-variable', f'The {name} system variable is removed in MySQL 8.0'
+
+
+def _group_by(tokens):
+    depth = 0
+    grouping = set()
+    ordered = False
+    top_level_group_by = False
+    sorted_group_by = False
+    for i, (kind, text) in enumerate(tokens):
+        if kind == _SYMBOL:
+            if text == '(':
+                depth = depth + 1
+            elif text == ')':
+                grouping.discard(depth)
+                depth = depth - 1
+            elif text == ';':
+                grouping.discard(depth)
+            continue
+        if kind != _WORD:
+            continue
+        if text == 'BY' and _text(tokens, i - 1) == 'GROUP':
+            grouping.add(depth)
+            top_level_group_by = top_level_group_by or depth == 0
+        elif text == 'BY' and _text(tokens, i - 1) == 'ORDER' and depth == 0:
+            ordered = True
+        elif text in _GROUP_BY_END:
+            grouping.discard(depth)
+        elif text in ('ASC', 'DESC') and depth in grouping:
+            sorted_group_by = True
+
+    if sorted_group_by:
+        yield ERROR, 'group-by-sort', 'GROUP BY ... ASC/DESC is removed in MySQL 8.0, use ORDER BY'
+    elif top_level_group_by and not ordered and _first_word(tokens) in ('SELECT', 'WITH'):
+        yield WARNING, 'group-by-implicit-sort', 'GROUP BY no longer sorts the result in MySQL 8.0, add ORDER BY if the order matters'
+
+
+def _query_cache(tokens):
+    words = {text for kind, text in tokens if kind == _WORD}
+    if 'SQL_CACHE' in words:
+        yield ERROR, 'sql-cache', 'SQL_CACHE is removed in MySQL 8.0'
+    if 'SQL_NO_CACHE' in words:
+        yield WARNING, 'sql-cache', 'SQL_NO_CACHE is deprecated and has no effect in MySQL 8.0'
+
+
+_RULES = (_reserved_words, _removed_functions, _removed_variables, _group_by, _query_cache)
+
+
+def analyze(query):
+    """
+    Check a query for MySQL 8.0 incompatibilities that show in its text.
+
+    Args:
+      query: The SQL text taken from the audit log.
+
+    Returns:
+      A list of (severity, rule, message) findings, empty when nothing was found.
+    """
+    tokens = _tokenize(query)
+    findings = []
+    for rule in _RULES:
+        findings.extend(rule(tokens))
+    return findings
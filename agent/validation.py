@@ -0,0 +1,198 @@
+# How a sampled query is checked against the target cluster
+#   execute: run the query, only SELECT statements are replayed
+#   execute_prepared: prepare the query once per connection with its literals
+#     as parameters and execute it with them, only SELECT statements are replayed
+#   compare: run the query on the target and on the compare endpoints, and
+#     compare digests of their result rows, only SELECT statements are replayed
+#   explain: EXPLAIN the query, the server parses and plans it without running it
+#   prepare: PREPARE and DEALLOCATE the query, the server only parses it
+EXECUTE = 'execute'
+EXECUTE_PREPARED = 'execute_prepared'
+COMPARE = 'compare'
+EXPLAIN = 'explain'
+PREPARE = 'prepare'
+VALIDATE_MODES = (EXECUTE, EXECUTE_PREPARED, COMPARE, EXPLAIN, PREPARE)
+
+# Modes that run the queries, one query at a time in a read only session
+EXECUTING_MODES = (EXECUTE, EXECUTE_PREPARED, COMPARE)
+
+# Statements that are never written by the non-executing modes, so DML can be checked safely
+_DML_STATEMENTS = ('select', 'insert', 'update', 'delete', 'replace')
+
+_REPLAYABLE_STATEMENTS = {
+    EXECUTE: ('select',),
+    EXECUTE_PREPARED: ('select',),
+    COMPARE: ('select',),
+    EXPLAIN: _DML_STATEMENTS,
+    PREPARE: _DML_STATEMENTS,
+}
+
+_PREPARED_NAME = 'queries_check_stmt'
+_PARAMETER_NAME = '@queries_check_p'
+
+
+def replayable_statements(validate_mode):
+    """
+    Get the statements that may be replayed in a validate mode.
+
+    Args:
+      validate_mode: One of VALIDATE_MODES.
+
+    Returns:
+      A tuple of lowercase statement keywords, to match the start of a masked query.
+
+    Raises:
+      ValueError: The validate mode is unknown.
+    """
+    if validate_mode not in _REPLAYABLE_STATEMENTS:
+        raise ValueError(f'unknown validate mode {validate_mode!r}, expected one of {", ".join(VALIDATE_MODES)}')
+    return _REPLAYABLE_STATEMENTS[validate_mode]
+
+
+def validation_statements(query, validate_mode, escape):
+    """
+    Build the statements that check one query in a validate mode.
+
+    Args:
+      query: The query text from the audit log.
+      validate_mode: One of VALIDATE_MODES.
+      escape: Function quoting a string as an SQL literal, like the escape method of a connection.
+
+    Returns:
+      A list of statements to run in order on the same connection.
+    """
+    if validate_mode == EXPLAIN:
+        return [f'EXPLAIN {query}']
+    if validate_mode == PREPARE:
+        return [f'PREPARE {_PREPARED_NAME} FROM {escape(query)}',
+                f'DEALLOCATE PREPARE {_PREPARED_NAME}']
+    return [query]
+
+
+def is_single_statement(query):
+    """Tell whether a query holds no ';', so running it can never run a second statement."""
+    return ';' not in query
+
+
+def prepare_statement(name, template, escape):
+    """Build the statement preparing a template with ? placeholders under a name."""
+    return f'PREPARE {name} FROM {escape(template)}'
+
+
+def execute_statement(name, literals):
+    """
+    Build the statement executing a prepared statement with the literals of a query.
+
+    The literals are set in user variables first, so the statement holds two
+    statements and needs a connection accepting several statements when there
+    are literals.
+
+    Args:
+      name: Name of the prepared statement.
+      literals: SQL texts of the literals, as returned by parameterize_sql.
+    """
+    if not literals:
+        return f'EXECUTE {name}'
+    parameters = [f'{_PARAMETER_NAME}{i}' for i in range(1, len(literals) + 1)]
+    assignments = ', '.join(f'{parameter} = {literal}' for parameter, literal in zip(parameters, literals))
+    return f'SET {assignments}; EXECUTE {name} USING {", ".join(parameters)}'
+
+
+def batch_statements(queries, validate_mode, escape):
+    """
+    Build one multi-statement batch checking several queries of a database.
+
+    The batch is run on a connection already on the database and checks the
+    queries in order, so it costs a single round trip. A query that holds a ';' is checked with
+    PREPARE, the server then parses its text as one statement and nothing it
+    holds after the ';' can run.
+
+    Args:
+      queries: Query texts from the audit log, not in execute mode.
+      validate_mode: EXPLAIN or PREPARE.
+      escape: Function quoting a string as an SQL literal.
+
+    Returns:
+      A tuple of the list of statements and the list of the index of the query
+      each statement checks.
+    """
+    statements = []
+    owners = []
+    for i, query in enumerate(queries):
+        query = query.rstrip().rstrip(';')
+        mode = validate_mode if is_single_statement(query) else PREPARE
+        for statement in validation_statements(query, mode, escape):
+            statements.append(statement)
+            owners.append(i)
+    return statements, owners
+
+
+def batch_text(statements):
+    """
+    Join the statements of a batch into the text sent in one round trip.
+
+    Each statement ends with a line break before its ';', so a query ending
+    with a -- or # comment cannot comment out the separator and the
+    statements after it.
+    """
+    return '\n;\n'.join(statements)
+
+
+def checked_count(owners, completed, query_count):
+    """
+    Count the queries at the start of a batch whose statements all ran.
+
+    Args:
+      owners: Index of the query each statement checks, as returned by batch_statements.
+      completed: Number of statements the server returned a result for.
+      query_count: Number of queries in the batch.
+    """
+    if completed < len(owners):
+        return owners[completed]
+    return query_count
+
+
+def group_by_database(logs, batch_size):
+    """
+    Split logs into batches of at most batch_size logs of the same database.
+
+    Args:
+      logs: The logs to replay.
+      batch_size: Maximum number of logs in a batch.
+
+    Returns:
+      A list of lists of logs, in the order each database was first seen.
+    """
+    batches = []
+    pending = {}
+    for log in logs:
+        batch = pending.setdefault(log['database'], [])
+        batch.append(log)
+        if len(batch) >= batch_size:
+            batches.append(batch)
+            del pending[log['database']]
+    batches.extend(pending.values())
+    return batches
+
+
+def session_init_statements(validate_mode, query_timeout):
+    """
+    Build the statements run once on each new replay connection, in order.
+
+    The server stops a SELECT after query_timeout seconds, and in the executing
+    modes the session refuses any write, so a replayed query can never change the
+    target. SET TRANSACTION READ ONLY is used rather than the transaction_read_only
+    variable, which only exists from MySQL 5.7.20, and it may not share a SET
+    statement with other variables.
+
+    Args:
+      validate_mode: One of VALIDATE_MODES.
+      query_timeout: Seconds a query may run on the target.
+
+    Returns:
+      A tuple of statements, it may be part of the key of a connection pool.
+    """
+    statements = (f'SET SESSION max_execution_time = {int(query_timeout * 1000)}',)
+    if validate_mode in EXECUTING_MODES:
+        statements = statements + ('SET SESSION TRANSACTION READ ONLY',)
+    return statements
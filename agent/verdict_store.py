@@ -0,0 +1,49 @@
+PASS = 'pass'
+FAIL = 'fail'
+
+
+class VerdictStore:
+    """
+    Last replay verdict of each fingerprint on one target, kept across tasks.
+
+    A target is the endpoint, the server version and the validate mode, a
+    fingerprint that passed on the same target is not replayed again unless
+    ``revalidate`` is set. Stored verdicts are looked up once per fingerprint,
+    the verdicts of a subtask are collected in ``results`` and saved by the
+    caller when the subtask is done.
+    """
+
+    def __init__(self, lookup, endpoint, validate_mode, revalidate=False):
+        """
+        Args:
+          lookup: Function of (sql_hash, target) returning the stored verdict, or None.
+          endpoint: Endpoint of the target cluster.
+          validate_mode: Validate mode of the task.
+          revalidate: Replay the fingerprints that already passed.
+        """
+        self._lookup = lookup
+        self.endpoint = endpoint
+        self.validate_mode = validate_mode
+        self.revalidate = revalidate
+        self.target = None
+        self.results = {}
+        self._known_pass = {}
+
+    def set_version(self, version):
+        """Set the server version of the target, verdicts are only looked up once it is known."""
+        self.target = f'{self.endpoint}#{version}#{self.validate_mode}'
+
+    def is_known_pass(self, sql_hash):
+        """Tell whether the fingerprint already passed on the target."""
+        if self.revalidate or self.target is None:
+            return False
+        if sql_hash not in self._known_pass:
+            self._known_pass[sql_hash] = self._lookup(sql_hash, self.target) == PASS
+        return self._known_pass[sql_hash]
+
+    def record(self, sql_hash, succeeded, message=''):
+        """Record the result of a replay, a fingerprint fails when any of its replays failed."""
+        verdict = self.results.get(sql_hash)
+        if verdict is not None and verdict[0] == FAIL:
+            return
+        self.results[sql_hash] = (PASS, '') if succeeded else (FAIL, message)
@@ -80,6 +80,7 @@ class QueriesCompatibilityCheckStack(Stack):
             'check_task_table_name': '{}-aurora-check-task'.format(stack_input.env_name),
             'check_subtask_table_name': '{}-aurora-check-subtask'.format(stack_input.env_name),
             'check_sql_example_table_name': '{}-aurora-check-sql-sample'.format(stack_input.env_name),
+            'check_verdict_table_name': '{}-aurora-check-verdict'.format(stack_input.env_name),
             'check_task_table_gsi_name': 'in-progress-time-index'
         }
 
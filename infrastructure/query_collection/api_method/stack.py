@@ -48,7 +48,21 @@ class ApiMethod(Construct):
                     "start_time": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING),
                     "end_time": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING),
                     "validate_cluster_endpoint": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING),
-                    "rerun": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.BOOLEAN)
+                    "rerun": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.BOOLEAN),
+                    "max_concurrency": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.INTEGER, maximum=200, minimum=1),
+                    "validate_mode": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING, enum=["execute", "execute_prepared", "compare", "explain", "prepare"]),
+                    "max_replay_variants": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.INTEGER, minimum=0),
+                    "stop_after_successes": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.INTEGER, minimum=0),
+                    "revalidate": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.BOOLEAN),
+                    "normalizer_version": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.INTEGER, enum=[1, 2]),
+                    "baseline_cluster_endpoint": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING),
+                    "latency_regression_percent": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.INTEGER, minimum=0),
+                    "compare_cluster_endpoints": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.ARRAY,
+                                                                           items=aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING)),
+                    "replay_speed": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.INTEGER, minimum=0),
+                    "max_qps": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.INTEGER, minimum=0),
+                    "validate_cluster_endpoints": aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.ARRAY,
+                                                                            items=aws_apigateway.JsonSchema(type=aws_apigateway.JsonSchemaType.STRING))
                 },
                 required=["check_percent", "cluster_identifier", "start_time", "end_time", "validate_cluster_endpoint", "rerun"]
             )
@@ -39,6 +39,11 @@ subtask_table_name = os.environ.get("CHECK_SUBTASK_TABLE_NAME")
 subtask_table = dynamodb.Table(subtask_table_name)
 
 
+def to_csv_item(task_id, item):
+    return [task_id, item['sql_sample'].replace("\"", ""), item['sql_mask'].replace("\"", ""), item['sql_hash'],
+            int(item.get('occurrence_count', 0)), int(item.get('replay_count', 0)), int(item.get('replay_skipped_count', 0))]
+
+
 def get_sample_items(task_id):
     csv_items = []
 
@@ -48,8 +53,7 @@ def get_sample_items(task_id):
 
     items = response['Items']
     for item in items:
-        csv_item = [task_id, item['sql_sample'].replace("\"", ""), item['sql_mask'].replace("\"", ""), item['sql_hash']]
-        csv_items.append(csv_item)
+        csv_items.append(to_csv_item(task_id, item))
 
     while 'LastEvaluatedKey' in response:
         response = sql_sample_table.query(
@@ -58,8 +62,7 @@ def get_sample_items(task_id):
         )
         items = response['Items']
         for item in items:
-            csv_item = [task_id, item['sql_sample'].replace("\"", ""), item['sql_mask'].replace("\"", ""), item['sql_hash']]
-            csv_items.append(csv_item)
+            csv_items.append(to_csv_item(task_id, item))
 
     return csv_items
 
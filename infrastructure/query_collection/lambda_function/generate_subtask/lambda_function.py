@@ -64,6 +64,10 @@ def lambda_handler(event, context):
     cluster_identifier = event['cluster_identifier']
     validate_cluster_endpoint = event['validate_cluster_endpoint']
     check_percent = event['check_percent']
+    max_concurrency = event.get('max_concurrency', 20)
+    validate_mode = event.get('validate_mode', 'execute')
+    max_replay_variants = event.get('max_replay_variants', 0)
+    stop_after_successes = event.get('stop_after_successes', 0)
 
     prefix = 'audit-log/'+ task_id + '_' + cluster_identifier + '/'
 
@@ -90,6 +94,7 @@ def lambda_handler(event, context):
                         'total_count': 0,
                         'error_count': 0,
                         'warning_count': 0,
+                        'timeout_count': 0,
                         'create_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
                         'status': 'Created',
                         'update_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
@@ -107,6 +112,18 @@ def lambda_handler(event, context):
                         'validate_cluster_endpoint': validate_cluster_endpoint,
                         'check_percent': int(check_percent),
                         'rerun': event['rerun'],
+                        'max_concurrency': int(max_concurrency),
+                        'validate_mode': validate_mode,
+                        'max_replay_variants': int(max_replay_variants),
+                        'stop_after_successes': int(stop_after_successes),
+                        'revalidate': event.get('revalidate', False),
+                        'normalizer_version': int(event.get('normalizer_version', 1)),
+                        'baseline_cluster_endpoint': event.get('baseline_cluster_endpoint', ''),
+                        'latency_regression_percent': int(event.get('latency_regression_percent', 50)),
+                        'compare_cluster_endpoints': event.get('compare_cluster_endpoints', []),
+                        'replay_speed': int(event.get('replay_speed', 0)),
+                        'max_qps': int(event.get('max_qps', 0)),
+                        'validate_cluster_endpoints': event.get('validate_cluster_endpoints', []),
                         's3_bucket': s3_bucket,
                         's3_object_key': s3_object_key
                     }
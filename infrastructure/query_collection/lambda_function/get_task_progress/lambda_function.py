@@ -79,6 +79,19 @@ def get_task_info(task_id: str):
             return_dict["check_percent"] = get_value_from_dict(item, "check_percent", int)
             return_dict["rerun"] = get_value_from_dict(item, "rerun", str)
             return_dict["validate_cluster_endpoint"] = get_value_from_dict(item, "validate_cluster_endpoint", str)
+            return_dict["max_concurrency"] = get_value_from_dict(item, "max_concurrency", int)
+            return_dict["validate_mode"] = get_value_from_dict(item, "validate_mode", str)
+            return_dict["max_replay_variants"] = get_value_from_dict(item, "max_replay_variants", int)
+            return_dict["stop_after_successes"] = get_value_from_dict(item, "stop_after_successes", int)
+            return_dict["revalidate"] = get_value_from_dict(item, "revalidate", str)
+            return_dict["normalizer_version"] = get_value_from_dict(item, "normalizer_version", int)
+            return_dict["baseline_cluster_endpoint"] = get_value_from_dict(item, "baseline_cluster_endpoint", str)
+            return_dict["latency_regression_percent"] = get_value_from_dict(item, "latency_regression_percent", int)
+            # Kept as a JSON string in the task item
+            return_dict["compare_cluster_endpoints"] = json.loads(get_value_from_dict(item, "compare_cluster_endpoints", str) or "[]")
+            return_dict["replay_speed"] = get_value_from_dict(item, "replay_speed", int)
+            return_dict["max_qps"] = get_value_from_dict(item, "max_qps", int)
+            return_dict["validate_cluster_endpoints"] = json.loads(get_value_from_dict(item, "validate_cluster_endpoints", str) or "[]")
             return_dict["created_time"] = get_value_from_dict(item, "created_time", str)
             return_dict["status"] = get_value_from_dict(item, "status", str)
             return_dict["update_time"] = get_value_from_dict(item, "update_time", str)
@@ -87,10 +100,15 @@ def get_task_info(task_id: str):
             return_dict["total_count"] = get_value_from_dict(item, "total_count", int)
             return_dict["error_count"] = get_value_from_dict(item, "error_count", int)
             return_dict["warning_count"] = get_value_from_dict(item, "warning_count", int)
+            return_dict["timeout_count"] = get_value_from_dict(item, "timeout_count", int)
 
             if return_dict["status"] == Task.COMPLETED.value or return_dict["status"] == Task.STOPPED.value:
                 return_dict["error_report"] = "s3://" + BUCKET_NAME + "/report/" + task_id + "_" +item["cluster_identifier"] +"/error.csv"
                 return_dict["warning_report"] = "s3://" + BUCKET_NAME + "/report/" + task_id + "_" +item["cluster_identifier"] +"/warning.csv"
+                return_dict["timeout_report"] = "s3://" + BUCKET_NAME + "/report/" + task_id + "_" +item["cluster_identifier"] +"/timeout.csv"
+                return_dict["latency_report"] = "s3://" + BUCKET_NAME + "/report/" + task_id + "_" +item["cluster_identifier"] +"/latency.csv"
+                return_dict["diff_report"] = "s3://" + BUCKET_NAME + "/report/" + task_id + "_" +item["cluster_identifier"] +"/diff.csv"
+                return_dict["pace_report"] = "s3://" + BUCKET_NAME + "/report/" + task_id + "_" +item["cluster_identifier"] +"/pace.csv"
                 return_dict["sample_sql_report"] = "s3://" + BUCKET_NAME + "/report/" + task_id + "_" +item["cluster_identifier"] +"/sample_sql.csv"
         else:
             return_dict["message"] = "The task_id is not in DynamoDB table, or no cluster_identifier in task item."
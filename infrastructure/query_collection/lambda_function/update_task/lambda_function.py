@@ -36,22 +36,33 @@ class SubTask(Enum):
     FAILED = 'Failed'
 
 
-def update_task_status(task_id, new_status):
+# subtask statuses after which a subtask is never processed again
+FINAL_SUBTASK_STATUSES = (SubTask.COMPLETED.value, SubTask.FAILED.value)
+
+
+def update_task_status(task_id, new_status, error_message=None):
+    update_expression = "SET #status = :new_status, #ut = :ut"  # Update expression to set new status
+    attribute_names = {
+        '#status': 'status',  # Use a placeholder for the attribute name
+        '#ut': 'update_time'
+    }
+    attribute_values = {
+        ':new_status': new_status,  # New value for the status attribute
+        ':ut': datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+    }
+    if error_message:
+        update_expression = update_expression + ", #em = :em"
+        attribute_names['#em'] = 'error_message'
+        attribute_values[':em'] = error_message
     try:
         # Update the item with the specified task_id
         response = task_table.update_item(
             Key={
                 'task_id': task_id  # Specify the primary key (partition key)
             },
-            UpdateExpression="SET #status = :new_status, #ut = :ut",  # Update expression to set new status
-            ExpressionAttributeNames={
-                '#status': 'status',  # Use a placeholder for the attribute name
-                '#ut': 'update_time'
-            },
-            ExpressionAttributeValues={
-                ':new_status': new_status,  # New value for the status attribute
-                ':ut': datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-            },
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames=attribute_names,
+            ExpressionAttributeValues=attribute_values,
             ReturnValues="UPDATED_NEW"  # Return the updated attributes
         )
 
@@ -74,6 +85,7 @@ def lambda_handler(event, context):
         total_count = int(subtask_item['total_count']['N'])
         error_count = int(subtask_item['error_count']['N'])
         warning_count = int(subtask_item['warning_count']['N'])
+        timeout_count = int(subtask_item.get('timeout_count', {'N': '0'})['N'])
         try:
             response = task_table.update_item(
                 Key={
@@ -81,12 +93,14 @@ def lambda_handler(event, context):
                 },
                 UpdateExpression="SET total_count = if_not_exists(total_count, :start) + :inc_total, "
                                  "error_count = if_not_exists(error_count, :start) + :inc_error, "
-                                 "warning_count = if_not_exists(warning_count, :start) + :inc_warning, update_time = :ut",
+                                 "warning_count = if_not_exists(warning_count, :start) + :inc_warning, "
+                                 "timeout_count = if_not_exists(timeout_count, :start) + :inc_timeout, update_time = :ut",
 
                 ExpressionAttributeValues={
                     ':inc_total': total_count,
                     ':inc_error': error_count,
                     ':inc_warning': warning_count,
+                    ':inc_timeout': timeout_count,
                     ':start': 0,  # This will initialize the field if it does not exist
                     ':ut': datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
                 },
@@ -98,25 +112,39 @@ def lambda_handler(event, context):
             response = subtask_table.query(
                 KeyConditionExpression=boto3.dynamodb.conditions.Key('task_id').eq(task_id)
             )
+            subtasks = response.get('Items', [])
+            while 'LastEvaluatedKey' in response:
+                response = subtask_table.query(
+                    KeyConditionExpression=boto3.dynamodb.conditions.Key('task_id').eq(task_id),
+                    ExclusiveStartKey=response['LastEvaluatedKey']
+                )
+                subtasks.extend(response.get('Items', []))
 
             # Check if any subtasks were found
-            if 'Items' not in response or not response['Items']:
+            if not subtasks:
                 logger.info(f"No subtasks found for task_id: {task_id}")
                 return
 
-            # Check the status of all subtasks
+            # Check the status of all subtasks, a subtask out of attempts is Failed and never processed again
             all_completed = True
-            for subtask in response['Items']:
+            failed_keys = []
+            for subtask in subtasks:
                 status = subtask.get('status')
                 logger.info(
                     f"Subtask ID: {subtask['task_id']}, Status: {status}")  # Assuming there's a 'subtask_id' attribute
-                if status != SubTask.COMPLETED.value:
+                if status not in FINAL_SUBTASK_STATUSES:
                     all_completed = False
                     break
+                if status == SubTask.FAILED.value:
+                    failed_keys.append(subtask['s3_object_key'])
 
-            # If all subtasks are completed, update the task status
+            # If all subtasks are completed or failed, update the task status, the reports cover the completed ones
             if all_completed:
-                update_task_status(task_id, Task.COMPLETED.value)
+                error_message = None
+                if failed_keys:
+                    # Only the first keys are listed, the item size is limited
+                    error_message = f"{len(failed_keys)} log file(s) could not be checked: {', '.join(failed_keys[:10])}"
+                update_task_status(task_id, Task.COMPLETED.value, error_message)
 
         except ClientError as e:
             logger.error('Error updating task item:')
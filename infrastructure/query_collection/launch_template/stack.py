@@ -33,6 +33,7 @@ class LaunchTemplate(Construct):
         sqs.grant_consume_messages(self.agent_role)
         dynamodb_tables.subtask_table.grant_read_write_data(self.agent_role)
         dynamodb_tables.sql_example_table.grant_read_write_data(self.agent_role)
+        dynamodb_tables.verdict_table.grant_read_write_data(self.agent_role)
         secret.grant_read(self.agent_role)
 
         # user data
@@ -46,6 +47,7 @@ class LaunchTemplate(Construct):
         user_data.add_commands('echo "queue_url={}" >> /home/ec2-user/agent/config.conf'.format(sqs.queue_url))
         user_data.add_commands('echo "subtask_dynamodb_name={}" >> /home/ec2-user/agent/config.conf'.format(dynamodb_tables.subtask_table.table_name))
         user_data.add_commands('echo "sql_sample_dynamodb_name={}" >> /home/ec2-user/agent/config.conf'.format(dynamodb_tables.sql_example_table.table_name))
+        user_data.add_commands('echo "verdict_dynamodb_name={}" >> /home/ec2-user/agent/config.conf'.format(dynamodb_tables.verdict_table.table_name))
         user_data.add_commands('echo "secret_name={}" >> /home/ec2-user/agent/config.conf'.format(secret.secret_name))
         user_data.add_commands('sh setup.sh')
         user_data.add_commands('echo "user-data script end>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>"')
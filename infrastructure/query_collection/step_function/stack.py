@@ -73,8 +73,35 @@ class StepFunctions(Construct):
         create_function_definition = '''
             {
               "Comment": "A description of my state machine",
-              "StartAt": "prepare_task",
+              "StartAt": "set_defaults",
               "States": {
+                "set_defaults": {
+                  "Type": "Pass",
+                  "Result": {
+                    "max_concurrency": 20,
+                    "validate_mode": "execute",
+                    "max_replay_variants": 10,
+                    "stop_after_successes": 3,
+                    "revalidate": false,
+                    "normalizer_version": 1,
+                    "baseline_cluster_endpoint": "",
+                    "latency_regression_percent": 50,
+                    "compare_cluster_endpoints": [],
+                    "replay_speed": 0,
+                    "max_qps": 0,
+                    "validate_cluster_endpoints": []
+                  },
+                  "ResultPath": "$.defaults",
+                  "Next": "apply_defaults"
+                },
+                "apply_defaults": {
+                  "Type": "Pass",
+                  "Parameters": {
+                    "input.$": "States.JsonMerge($.defaults, $$.Execution.Input, false)"
+                  },
+                  "OutputPath": "$.input",
+                  "Next": "prepare_task"
+                },
                 "prepare_task": {
                   "Type": "Task",
                   "Resource": "arn:aws:states:::lambda:invoke",
@@ -146,6 +173,42 @@ class StepFunctions(Construct):
                       },
                       "rerun": {
                         "BOOL.$": "$.rerun"
+                      },
+                      "max_concurrency": {
+                        "N.$": "States.JsonToString($.max_concurrency)"
+                      },
+                      "validate_mode": {
+                        "S.$": "$.validate_mode"
+                      },
+                      "max_replay_variants": {
+                        "N.$": "States.JsonToString($.max_replay_variants)"
+                      },
+                      "stop_after_successes": {
+                        "N.$": "States.JsonToString($.stop_after_successes)"
+                      },
+                      "revalidate": {
+                        "BOOL.$": "$.revalidate"
+                      },
+                      "normalizer_version": {
+                        "N.$": "States.JsonToString($.normalizer_version)"
+                      },
+                      "baseline_cluster_endpoint": {
+                        "S.$": "$.baseline_cluster_endpoint"
+                      },
+                      "latency_regression_percent": {
+                        "N.$": "States.JsonToString($.latency_regression_percent)"
+                      },
+                      "compare_cluster_endpoints": {
+                        "S.$": "States.JsonToString($.compare_cluster_endpoints)"
+                      },
+                      "replay_speed": {
+                        "N.$": "States.JsonToString($.replay_speed)"
+                      },
+                      "max_qps": {
+                        "N.$": "States.JsonToString($.max_qps)"
+                      },
+                      "validate_cluster_endpoints": {
+                        "S.$": "States.JsonToString($.validate_cluster_endpoints)"
                       }
                     }
                   },
@@ -241,6 +304,18 @@ class StepFunctions(Construct):
                       "validate_cluster_endpoint.$": "$.validate_cluster_endpoint",
                       "check_percent.$": "$.check_percent",
                       "rerun.$": "$.rerun",
+                      "max_concurrency.$": "$.max_concurrency",
+                      "validate_mode.$": "$.validate_mode",
+                      "max_replay_variants.$": "$.max_replay_variants",
+                      "stop_after_successes.$": "$.stop_after_successes",
+                      "revalidate.$": "$.revalidate",
+                      "normalizer_version.$": "$.normalizer_version",
+                      "baseline_cluster_endpoint.$": "$.baseline_cluster_endpoint",
+                      "latency_regression_percent.$": "$.latency_regression_percent",
+                      "compare_cluster_endpoints.$": "$.compare_cluster_endpoints",
+                      "replay_speed.$": "$.replay_speed",
+                      "max_qps.$": "$.max_qps",
+                      "validate_cluster_endpoints.$": "$.validate_cluster_endpoints",
                       "s3_bucket.$": "$.prepare_task.export_bucket"
                     }
                   },
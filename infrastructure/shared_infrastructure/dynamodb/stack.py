@@ -14,6 +14,7 @@ class DynamoDBTables(Construct):
         task_table = params['check_task_table_name']
         subtask_table = params['check_subtask_table_name']
         sql_example_table = params['check_sql_example_table_name']
+        verdict_table = params['check_verdict_table_name']
         task_table_gsi = params['check_task_table_gsi_name']
 
         # Check task table
@@ -72,7 +73,7 @@ class DynamoDBTables(Construct):
             starting_position=aws_lambda.StartingPosition.LATEST,
             filters=[aws_lambda.FilterCriteria.filter(
                 {
-                    "dynamodb": {"NewImage": {"status": {"S": ["Completed"]}}},
+                    "dynamodb": {"NewImage": {"status": {"S": ["Completed", "Failed"]}}},
                     "eventName": aws_lambda.FilterRule.is_equal("MODIFY")
                 }
             )]
@@ -103,3 +104,14 @@ class DynamoDBTables(Construct):
             stream=dynamodb.StreamViewType.NEW_IMAGE,
             point_in_time_recovery=True
         )
+
+        # Check verdict table, last result of each SQL template on a target, shared by the tasks
+        self.verdict_table = dynamodb.Table(
+            self, "check_verdict_table",
+            table_name=verdict_table,
+            partition_key=dynamodb.Attribute(name="sql_hash", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="target", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED,
+            point_in_time_recovery=True
+        )
@@ -0,0 +1,29 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# The agent is deployed as a plain directory of scripts, make its modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'agent'))
+
+
+class Clock:
+    """Clock of the tests, time only moves when ``now`` is set."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a new event loop, closed once it completes."""
+    return asyncio.run
@@ -0,0 +1,132 @@
+import asyncio
+
+from affinity_pool import AffinityPool
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.database = None
+        self.closed = False
+
+    async def select_db(self, database):
+        if database == 'missing':
+            raise RuntimeError('Unknown database')
+        self.database = database
+
+    def close(self):
+        self.closed = True
+
+    async def ensure_closed(self):
+        self.closed = True
+
+
+def new_pool(maxsize):
+    opened = []
+
+    async def connect():
+        opened.append(FakeConnection(len(opened)))
+        return opened[-1]
+
+    return AffinityPool(connect, maxsize), opened
+
+
+def test_a_connection_keeps_its_database(run):
+    async def scenario():
+        pool, opened = new_pool(maxsize=2)
+        for database in ['a', 'a', 'a']:
+            async with pool.acquire('a') as connection:
+                assert connection.database == database
+        return pool, opened
+
+    pool, opened = run(scenario())
+
+    assert len(opened) == 1
+    assert pool.switch_count == 1
+
+
+def test_queries_of_another_database_get_a_new_connection_while_the_pool_is_not_full(run):
+    async def scenario():
+        pool, opened = new_pool(maxsize=2)
+        for database in ['a', 'b', 'a', 'b']:
+            async with pool.acquire(database) as connection:
+                assert connection.database == database
+        return pool, opened
+
+    pool, opened = run(scenario())
+
+    assert len(opened) == 2
+    assert pool.switch_count == 2
+
+
+def test_a_full_pool_switches_the_least_recently_used_connection(run):
+    async def scenario():
+        pool, opened = new_pool(maxsize=2)
+        async with pool.acquire('a'):
+            pass
+        async with pool.acquire('b'):
+            pass
+        async with pool.acquire('c') as connection:
+            switched = connection.number
+        return pool, opened, switched
+
+    pool, opened, switched = run(scenario())
+
+    assert len(opened) == 2
+    assert switched == 0
+    assert pool.size == 2
+
+
+def test_a_failed_switch_keeps_the_connection_on_its_database(run):
+    async def scenario():
+        pool, _ = new_pool(maxsize=1)
+        async with pool.acquire('a'):
+            pass
+        try:
+            async with pool.acquire('missing'):
+                pass
+        except RuntimeError:
+            pass
+        async with pool.acquire('a') as connection:
+            return pool, connection.database
+
+    pool, database = run(scenario())
+
+    assert database == 'a'
+    assert pool.switch_count == 1
+
+
+def test_closed_connections_leave_the_pool(run):
+    async def scenario():
+        pool, opened = new_pool(maxsize=2)
+        async with pool.acquire('a') as connection:
+            connection.close()
+        async with pool.acquire('b'):
+            pass
+        await pool.clear()
+        return pool, opened
+
+    pool, opened = run(scenario())
+
+    assert pool.size == 0
+    assert pool.freesize == 0
+    assert all(connection.closed for connection in opened)
+
+
+def test_acquire_waits_for_a_free_connection(run):
+    async def scenario():
+        pool, opened = new_pool(maxsize=1)
+        order = []
+
+        async def use(database):
+            async with pool.acquire(database):
+                order.append(database)
+                await asyncio.sleep(0)
+
+        await asyncio.gather(use('a'), use('b'), use('a'))
+        return order, opened
+
+    order, opened = run(scenario())
+
+    assert order == ['a', 'b', 'a']
+    assert len(opened) == 1
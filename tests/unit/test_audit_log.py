@@ -0,0 +1,138 @@
+import io
+
+import pytest
+
+from audit_log import decode_record, parse_chunk, read_chunks, record_time, select_logs
+from replay_policy import ReplayPolicy
+
+PREFIX = b'2024-10-09T00:00:00.000Z 1728432000123456,ip-10-0-0-1,app,10.0.1.15,1201,88231,'
+
+
+def test_decode_query_record():
+    line = PREFIX + b"QUERY,shop,'select * from orders where id = 1',0\n"
+
+    assert decode_record(line) == {
+        'time': '2024-10-09T00:00:00.000Z 1728432000123456',
+        'database': 'shop',
+        'query': 'select * from orders where id = 1',
+        'user': 'app',
+        'src_ip': '10.0.1.15',
+        'connection_id': '1201'
+    }
+
+
+def test_record_time_is_read_from_the_microsecond_timestamp():
+    assert record_time('2024-10-09T00:00:00.000Z 1728432000123456') == pytest.approx(1728432000.123456)
+
+
+def test_commas_in_literals_are_kept():
+    line = PREFIX + b"QUERY,shop,'insert into t values (\\'a,b\\',\\'c, d\\')',0\n"
+
+    assert decode_record(line)['query'] == "insert into t values ('a,b','c, d')"
+
+
+def test_escapes_are_decoded():
+    line = PREFIX + "QUERY,shop,'select \\'caf\u00e9\\'\\nfrom t where p = \\'C:\\\\\\\\tmp\\'',0\n".encode('utf-8')
+
+    assert decode_record(line)['query'] == "select 'caf\u00e9'\nfrom t where p = 'C:\\\\tmp'"
+
+
+@pytest.mark.parametrize('line', [
+    PREFIX + b"CONNECT,shop,,0\n",
+    PREFIX + b"READ,shop,orders,0\n",
+    b"2024-10-09T00:00:00.000Z 1728432000123456,ip-10-0-0-1,rdsadmin,localhost,5,9,QUERY,mysql,'SELECT 1',0\n",
+])
+def test_other_records_are_skipped(line):
+    assert decode_record(line) is None
+
+
+def test_malformed_record_raises():
+    with pytest.raises(ValueError):
+        decode_record(b"1728432000123456,ip-10-0-0-1,app,10.0.1.15,QUERY,shop\n")
+
+
+class State:
+    def __init__(self):
+        self.total_count = 0
+        self.sql_count = {}
+        self.sample_query = []
+        self.owned = {}
+        self.static_errors = set()
+        self.replay_policy = ReplayPolicy()
+        self.verdicts = None
+
+
+def merge(results, check_percent, claim=lambda log: True):
+    state = State()
+    reported = []
+    logs = list(select_logs(state, results, check_percent, claim,
+                            report_findings=lambda state, log, findings: reported.append(log['sql_hash'])))
+    return state.total_count, state.sql_count, state.sample_query, logs, reported
+
+
+def test_chunked_parse_matches_serial_parse():
+    lines = []
+    for i in range(300):
+        lines.append(PREFIX + f"QUERY,shop,'select * from t{i % 7} where id = {i}',0\n".encode('utf-8'))
+        lines.append(PREFIX + f"QUERY,shop,'update t{i % 3} set v = {i}',0\n".encode('utf-8'))
+        lines.append(PREFIX + b"CONNECT,shop,,0\n")
+    data = b''.join(lines)
+
+    serial = merge([parse_chunk(data, replay_statements=('select',))], check_percent=3)
+    chunked = merge([parse_chunk(chunk, replay_statements=('select',)) for chunk in read_chunks(io.BytesIO(data), 1000)], check_percent=3)
+
+    assert chunked == serial
+    assert serial[0] == 900
+    assert len(serial[2]) == 10
+    # The occurrences n of a select fingerprint with n % 10 < 3 are replayed, the updates never are
+    selects = [sample['sql_hash'] for sample in serial[2] if sample['query'].startswith('select')]
+    assert len(serial[3]) == sum(1 for sql_hash in selects for n in range(1, serial[1][sql_hash] + 1) if n % 10 < 3)
+    assert all(log['query'].startswith('select') for log in serial[3])
+
+
+def test_fingerprints_of_other_subtasks_are_not_replayed():
+    data = b''.join(PREFIX + f"QUERY,shop,'select * from t{i % 2} where id = {i}',0\n".encode('utf-8')
+                    for i in range(20))
+    claimed = []
+
+    def claim(log):
+        claimed.append(log['sql_hash'])
+        return log['query'].startswith('select * from t0')
+
+    total, _, _, logs, _ = merge([parse_chunk(data, replay_statements=('select',))], check_percent=10, claim=claim)
+
+    assert total == 20
+    assert {log['query'].split(' where')[0] for log in logs} == {'select * from t0'}
+    # Ownership is claimed once per fingerprint
+    assert len(claimed) == 2
+
+
+def test_findings_are_reported_once_per_fingerprint():
+    data = (PREFIX + b"QUERY,shop,'select password(\\'a\\')',0\n"
+            + PREFIX + b"QUERY,shop,'select password(\\'b\\')',0\n")
+
+    _, _, _, _, reported = merge([parse_chunk(data, replay_statements=('select',))], check_percent=10)
+
+    assert len(reported) == 1
+
+
+def test_only_listed_statements_are_replayable():
+    data = (PREFIX + b"QUERY,shop,'select 1',0\n"
+            + PREFIX + b"QUERY,shop,'update t set v = 1',0\n"
+            + PREFIX + b"QUERY,shop,'set names utf8mb4',0\n")
+
+    _, entries = parse_chunk(data, replay_statements=('select', 'update'))
+    assert [replayable for _, _, replayable, _ in entries] == [True, True, False]
+
+    _, entries = parse_chunk(data, replay_statements=())
+    assert not any(replayable for _, _, replayable, _ in entries)
+
+
+def test_first_occurrence_is_analyzed():
+    data = (PREFIX + b"QUERY,shop,'select password(\\'a\\')',0\n"
+            + PREFIX + b"QUERY,shop,'select password(\\'b\\')',0\n")
+
+    _, entries = parse_chunk(data, replay_statements=('select',))
+
+    assert [rule for _, rule, _ in entries[0][3]] == ['removed-function']
+    assert entries[1][3] is None
@@ -0,0 +1,63 @@
+import asyncio
+
+from concurrency import AdaptiveConcurrency, OVERLOAD, SUCCESS, TIMEOUT
+
+
+async def complete(controller, count, outcome=SUCCESS, latency=0.01):
+    for _ in range(count):
+        started = await controller.acquire()
+        await controller.release(started - latency, outcome)
+
+
+def test_limit_grows_up_to_the_ceiling(run):
+    async def scenario():
+        controller = AdaptiveConcurrency(max_limit=20, initial_limit=2)
+        await complete(controller, 200)
+        return controller.limit
+
+    assert run(scenario()) == 20
+
+
+def test_too_many_connections_halves_the_limit(run):
+    async def scenario():
+        controller = AdaptiveConcurrency(max_limit=64, initial_limit=32)
+        await complete(controller, 1, outcome=OVERLOAD)
+        return controller.limit
+
+    assert run(scenario()) == 16
+
+
+def test_slow_start_ends_at_the_first_congestion(run):
+    async def scenario():
+        controller = AdaptiveConcurrency(max_limit=64, initial_limit=16)
+        await complete(controller, 16)
+        growing = controller.slow_start
+        await complete(controller, 1, outcome=OVERLOAD)
+        return growing, controller.slow_start
+
+    assert run(scenario()) == (True, False)
+
+
+def test_timeouts_shrink_the_limit_and_stop_slow_start(run):
+    async def scenario():
+        controller = AdaptiveConcurrency(max_limit=64, initial_limit=16)
+        await complete(controller, 16, outcome=TIMEOUT)
+        limit_after_timeouts = controller.limit
+        await complete(controller, 10)
+        return limit_after_timeouts, controller.limit
+
+    assert run(scenario()) == (8, 9)
+
+
+def test_acquire_waits_for_a_free_slot(run):
+    async def scenario():
+        controller = AdaptiveConcurrency(max_limit=1, initial_limit=1)
+        started = await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        blocked = not waiter.done()
+        await controller.release(started)
+        await waiter
+        return blocked, controller.in_flight
+
+    assert run(scenario()) == (True, 1)
@@ -0,0 +1,89 @@
+import contextlib
+
+import pytest
+
+from endpoint_router import EndpointRouter, RoutedPool
+
+
+def test_queries_go_to_the_least_busy_endpoint():
+    router = EndpointRouter(['a', 'b', 'c'])
+    chosen = []
+    for _ in range(3):
+        chosen.append(router.choose())
+        router.started(chosen[-1])
+
+    assert sorted(chosen) == ['a', 'b', 'c']
+
+    router.finished('b')
+    assert router.choose() == 'b'
+
+
+def test_failing_endpoint_is_ejected_until_the_cooldown_ends(clock):
+    router = EndpointRouter(['a', 'b'], eject_after=2, cooldown=30, clock=clock)
+    for _ in range(2):
+        router.started('a')
+        router.finished('a', healthy=False)
+
+    assert router.is_ejected('a')
+    router.started('b')
+    router.started('b')
+    assert router.choose() == 'b'
+
+    clock.now = 31
+    assert router.choose() == 'a'
+    # One more failure after the cooldown ejects it again
+    router.started('a')
+    router.finished('a', healthy=False)
+    assert router.is_ejected('a')
+    assert router.ejections['a'] == 2
+
+
+def test_success_resets_the_failures():
+    router = EndpointRouter(['a', 'b'], eject_after=2)
+    for healthy in (False, True, False):
+        router.started('a')
+        router.finished('a', healthy=healthy)
+
+    assert not router.is_ejected('a')
+
+
+def test_an_endpoint_is_used_when_all_are_ejected(clock):
+    router = EndpointRouter(['a', 'b'], eject_after=1, cooldown=30, clock=clock)
+    router.started('a')
+    router.finished('a', healthy=False)
+    clock.now = 10
+    router.started('b')
+    router.finished('b', healthy=False)
+
+    assert router.choose() == 'a'
+
+
+class FakePool:
+    def __init__(self, name):
+        self.name = name
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, database=None):
+        yield self.name
+
+
+def test_routed_pool_records_connection_problems(run):
+    router = EndpointRouter(['a', 'b'], eject_after=1)
+    pool = RoutedPool({'a': FakePool('a'), 'b': FakePool('b')}, router,
+                      is_unhealthy=lambda e: isinstance(e, ConnectionError))
+
+    async def scenario():
+        async with pool.acquire('shop') as connection:
+            assert connection == 'a'
+        with pytest.raises(ValueError):
+            async with pool.acquire('shop'):
+                raise ValueError('incompatible query')
+        with pytest.raises(ConnectionError):
+            async with pool.acquire('shop'):
+                raise ConnectionError()
+
+    run(scenario())
+
+    assert router.is_ejected('a')
+    assert router.outstanding == {'a': 0, 'b': 0}
+    assert router.sent['a'] == 3
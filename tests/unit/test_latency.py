@@ -0,0 +1,44 @@
+import pytest
+
+from latency import LatencyReport, QuantileSketch, RELATIVE_ACCURACY
+
+
+def test_quantiles_are_within_the_relative_accuracy():
+    sketch = QuantileSketch()
+    for i in range(1, 1001):
+        sketch.add(i / 1000)
+
+    for q, expected in [(0.5, 0.5), (0.95, 0.95), (0.99, 0.99)]:
+        assert sketch.quantile(q) == pytest.approx(expected, rel=RELATIVE_ACCURACY * 1.5)
+    assert sketch.count == 1000
+
+
+def test_empty_sketch_has_no_quantile():
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_tiny_latencies_do_not_fail():
+    sketch = QuantileSketch()
+    sketch.add(0)
+
+    assert sketch.quantile(0.5) < 1e-5
+
+
+def test_slower_fingerprints_are_flagged():
+    report = LatencyReport(regression_percent=50)
+    for _ in range(20):
+        report.record('slow', 0.3)
+        report.record('slow', 0.1, baseline=True)
+        report.record('same', 0.1)
+        report.record('same', 0.09, baseline=True)
+        report.record('new', 0.2)
+
+    rows = {row['sql_hash']: row for row in report.rows({'slow': 'select 1'})}
+
+    assert rows['slow']['regression'] is True
+    assert rows['slow']['sql_mask'] == 'select 1'
+    assert rows['slow']['p95_ms'] == pytest.approx(300, rel=0.02)
+    assert rows['same']['regression'] is False
+    assert rows['new']['regression'] is False
+    assert rows['new']['baseline_count'] == 0
+    assert rows['new']['baseline_p95_ms'] == ''
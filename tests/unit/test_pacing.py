@@ -0,0 +1,43 @@
+import pytest
+
+from pacing import ReplaySchedule
+
+
+def test_queries_are_due_at_their_recorded_pace(clock):
+    clock.now = 100.0
+    schedule = ReplaySchedule(speed=5, clock=clock)
+
+    first = schedule.due(1000.0)
+    second = schedule.due(1010.0)
+
+    assert first == 100.0
+    assert second == 102.0
+    assert schedule.delay(second) == 2.0
+    clock.now = 103.0
+    assert schedule.delay(second) == 0.0
+
+
+def test_summary_compares_achieved_and_intended_rates(clock):
+    clock.now = 100.0
+    schedule = ReplaySchedule(speed=1, clock=clock)
+    for recorded in range(11):
+        due = schedule.due(1000.0 + recorded)
+        # Every query starts half a second later than due
+        clock.now = due + 0.5
+        schedule.started(due)
+
+    summary = schedule.summary()
+
+    assert summary['count'] == 11
+    assert summary['intended_qps'] == pytest.approx(1.1)
+    assert summary['achieved_qps'] == pytest.approx(11 / 10.5, abs=1e-3)
+    assert summary['lag_p50_ms'] == pytest.approx(500, rel=0.02)
+    assert summary['max_lag_ms'] == 500
+
+
+def test_summary_without_queries():
+    summary = ReplaySchedule(speed=20).summary()
+
+    assert summary['count'] == 0
+    assert summary['achieved_qps'] == ''
+    assert summary['lag_p99_ms'] == ''
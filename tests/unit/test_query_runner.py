@@ -0,0 +1,250 @@
+import contextlib
+
+import aiomysql
+
+from concurrency import AdaptiveConcurrency
+from query_runner import CODE_ERROR, CODE_SUCCESS, CODE_UNAVAILABLE, CODE_WARNING, QueryRunner
+from validation import EXECUTE, EXECUTE_PREPARED, EXPLAIN
+
+
+def server_statements(text):
+    """Split a multi-statement text like the server, on the ';' outside of quotes and comments."""
+    statements = ['']
+    quote = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote is not None:
+            statements[-1] += text[i:i + 2] if char == '\\' else char
+            i += 2 if char == '\\' else 1
+            if char == quote:
+                quote = None
+            continue
+        if char in "'\"":
+            quote = char
+        elif char == '#' or text.startswith('-- ', i):
+            # The comment runs to the end of the line
+            i = text.find('\n', i) if '\n' in text[i:] else len(text)
+            continue
+        elif char == ';':
+            statements.append('')
+            i += 1
+            continue
+        statements[-1] += char
+        i += 1
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._pending = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        return False
+
+    async def _next_result(self):
+        statement = self._pending.pop(0)
+        self.connection.statements.append(statement)
+        error = self.connection.server.fail(statement)
+        if error is not None:
+            # The server stops a batch at its first failing statement
+            self._pending = []
+            if aiomysql.OperationalError in type(error).__mro__:
+                self.connection.closed = True
+            raise error
+
+    async def execute(self, text):
+        self.connection.round_trips.append(text)
+        self._pending = server_statements(text)
+        await self._next_result()
+
+    async def nextset(self):
+        if not self._pending:
+            return None
+        await self._next_result()
+        return True
+
+    async def fetchmany(self, size):
+        return []
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+        self.round_trips = []
+        self.statements = []
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def escape(self, value):
+        return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+    def close(self):
+        self.closed = True
+
+
+class FakeServer:
+    """Server failing the statements containing a text with the error given for it."""
+
+    def __init__(self, errors=None, times=None):
+        self.errors = errors or {}
+        # Number of times each error is raised, every time when missing
+        self.times = times or {}
+
+    def fail(self, statement):
+        for text, error in self.errors.items():
+            if text in statement and self.times.get(text, 1) > 0:
+                if text in self.times:
+                    self.times[text] -= 1
+                return error
+        return None
+
+
+class FakePool:
+    def __init__(self, server):
+        self.server = server
+        self.connections = []
+        self.failures = []
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, database=None):
+        if not self.connections or self.connections[-1].closed:
+            self.connections.append(FakeConnection(self.server))
+        try:
+            yield self.connections[-1]
+        except Exception as e:
+            # The router of the endpoints counts the connection problems it sees here
+            self.failures.append(e)
+            raise
+
+    @property
+    def round_trips(self):
+        return [text for connection in self.connections for text in connection.round_trips]
+
+    @property
+    def statements(self):
+        return [statement for connection in self.connections for statement in connection.statements]
+
+
+def syntax_error(text):
+    return aiomysql.ProgrammingError(1064, f"You have an error in your SQL syntax near '{text}'")
+
+
+def lost_connection():
+    return aiomysql.OperationalError(2013, 'Lost connection to MySQL server during query')
+
+
+def logs(*queries):
+    return [{'database': 'shop', 'query': query, 'sql_hash': query} for query in queries]
+
+
+def check_batch(run, pool, queries, validate_mode=EXPLAIN):
+    runner = QueryRunner(retry_base_backoff=0)
+    return run(runner.process_batch(logs(*queries), pool, AdaptiveConcurrency(max_limit=4), validate_mode))
+
+
+def test_batch_goes_on_after_a_failing_query(run):
+    pool = FakePool(FakeServer({'from missing': syntax_error('missing')}))
+
+    batch = check_batch(run, pool, ['select 1', 'select * from missing', 'select 3'])
+
+    assert [log['code'] for log in batch] == [CODE_SUCCESS, CODE_ERROR, CODE_SUCCESS]
+    assert 'missing' in batch[1]['message']
+    # The queries after the failing one are sent again in a second round trip
+    assert len(pool.round_trips) == 2
+    assert pool.statements == ['EXPLAIN select 1', 'EXPLAIN select * from missing', 'EXPLAIN select 3']
+
+
+def test_trailing_comments_do_not_hide_the_rest_of_the_batch(run):
+    pool = FakePool(FakeServer({'from missing': syntax_error('missing')}))
+
+    batch = check_batch(run, pool, ['select 1 -- first', 'select 2 # second', 'select * from missing'])
+
+    assert [log['code'] for log in batch] == [CODE_SUCCESS, CODE_SUCCESS, CODE_ERROR]
+    assert len(pool.statements) == 3
+
+
+def test_queries_holding_a_separator_are_only_prepared(run):
+    pool = FakePool(FakeServer())
+
+    batch = check_batch(run, pool, ['select 1; drop table t', 'select 2'])
+
+    assert [log['code'] for log in batch] == [CODE_SUCCESS, CODE_SUCCESS]
+    assert pool.statements == ["PREPARE queries_check_stmt FROM 'select 1; drop table t'",
+                               'DEALLOCATE PREPARE queries_check_stmt', 'EXPLAIN select 2']
+
+
+def test_lost_connection_retries_the_unchecked_queries(run):
+    pool = FakePool(FakeServer({'select 2': lost_connection()}, times={'select 2': 1}))
+
+    batch = check_batch(run, pool, ['select 1', 'select 2', 'select 3'])
+
+    assert [log['code'] for log in batch] == [CODE_SUCCESS] * 3
+    # The router saw the connection problem, the first query was not checked again
+    assert len(pool.failures) == 1
+    assert pool.statements == ['EXPLAIN select 1', 'EXPLAIN select 2', 'EXPLAIN select 2', 'EXPLAIN select 3']
+
+
+def test_batch_left_unavailable_once_out_of_retries(run):
+    pool = FakePool(FakeServer({'select 2': lost_connection()}))
+
+    batch = check_batch(run, pool, ['select 1', 'select 2'])
+
+    assert [log['code'] for log in batch] == [CODE_SUCCESS, CODE_UNAVAILABLE]
+    assert pool.statements.count('EXPLAIN select 2') == 4
+
+
+def test_lost_connection_retries_the_query(run):
+    pool = FakePool(FakeServer({'select 1': lost_connection()}, times={'select 1': 2}))
+    runner = QueryRunner(retry_base_backoff=0)
+
+    log = run(runner.process_log(logs('select 1')[0], pool, AdaptiveConcurrency(max_limit=4), EXECUTE))
+
+    assert log['code'] == CODE_SUCCESS
+    assert pool.statements == ['select 1'] * 3
+
+
+def test_query_failing_only_when_prepared_is_a_warning(run):
+    pool = FakePool(FakeServer({'PREPARE': syntax_error('?')}))
+    runner = QueryRunner()
+
+    log = run(runner.process_log(logs("select * from t where a = 'x'")[0], pool, AdaptiveConcurrency(max_limit=4),
+                                 EXECUTE_PREPARED))
+
+    assert log['code'] == CODE_WARNING
+    assert log['message'].startswith('The query only fails when prepared')
+    assert pool.statements[-1] == "select * from t where a = 'x'"
+
+
+def test_refused_template_of_several_statements_is_an_error(run):
+    pool = FakePool(FakeServer({'PREPARE': syntax_error('?')}))
+    runner = QueryRunner()
+
+    log = run(runner.process_log(logs('select 1; select 2')[0], pool, AdaptiveConcurrency(max_limit=4),
+                                 EXECUTE_PREPARED))
+
+    assert log['code'] == CODE_ERROR
+    # The raw text is never run, nothing after its ';' may run
+    assert not any(statement.startswith('select') for statement in pool.statements)
+
+
+def test_prepared_statement_is_reused_on_the_connection(run):
+    pool = FakePool(FakeServer())
+    runner = QueryRunner()
+
+    async def scenario():
+        controller = AdaptiveConcurrency(max_limit=4)
+        for query in ('select * from t where id = 1', 'select * from t where id = 2'):
+            await runner.process_log(logs(query)[0], pool, controller, EXECUTE_PREPARED)
+
+    run(scenario())
+
+    assert [statement for statement in pool.statements if statement.startswith('PREPARE')] == [
+        "PREPARE queries_check_s1 FROM 'select * from t where id = ?'"]
+    assert pool.statements.count('EXECUTE queries_check_s1 USING @queries_check_p1') == 2
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from rate_limiter import TokenBucket
+
+
+def sent_in(run, bucket_rate, seconds):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        bucket = TokenBucket(bucket_rate, clock=loop.time)
+        started = loop.time()
+        sent = 0
+        while loop.time() - started < seconds:
+            await bucket.acquire()
+            sent = sent + 1
+        return sent
+
+    return run(scenario())
+
+
+def test_rate_is_capped_after_the_first_burst(run):
+    # One second of burst, then 100 per second
+    assert sent_in(run, 100, 0.3) == pytest.approx(130, abs=5)
+
+
+def test_batches_larger_than_the_bucket_go_through(run):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        bucket = TokenBucket(10, clock=loop.time)
+        started = loop.time()
+        await bucket.acquire(50)
+        return loop.time() - started
+
+    assert run(scenario()) < 0.05
+
+
+def test_lowering_the_rate_drops_the_extra_tokens(run):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        bucket = TokenBucket(1000, clock=loop.time)
+        bucket.set_rate(10)
+        started = loop.time()
+        for _ in range(12):
+            await bucket.acquire()
+        return loop.time() - started
+
+    assert run(scenario()) == pytest.approx(0.2, abs=0.05)
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from read_ahead import ReadAhead
+
+
+def test_items_are_produced_before_they_are_consumed():
+    produced = threading.Event()
+
+    def produce():
+        yield 1
+        produced.set()
+        yield 2
+
+    with ReadAhead(produce, size=4) as items:
+        assert produced.wait(5)
+        assert list(items) == [1, 2]
+
+
+def test_producer_stays_at_most_size_items_ahead():
+    produced = []
+
+    def produce():
+        for number in range(100):
+            produced.append(number)
+            yield number
+
+    with ReadAhead(produce, size=3) as items:
+        assert next(items) == 0
+        assert len(produced) <= 5
+
+
+def test_producer_error_is_raised_after_the_items_before_it():
+    def produce():
+        yield 1
+        raise ValueError('truncated object')
+
+    with ReadAhead(produce, size=4) as items:
+        assert next(items) == 1
+        with pytest.raises(ValueError, match='truncated object'):
+            next(items)
+        with pytest.raises(StopIteration):
+            next(items)
+
+
+def test_close_stops_the_producer_and_releases_what_it_opened():
+    released = threading.Event()
+
+    def produce():
+        try:
+            for number in range(1000):
+                yield number
+        finally:
+            released.set()
+
+    items = ReadAhead(produce, size=2).start()
+    assert next(items) == 0
+    items.close()
+
+    assert released.is_set()
+    assert list(items) == []
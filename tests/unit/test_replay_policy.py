@@ -0,0 +1,46 @@
+from replay_policy import ReplayPolicy
+
+
+def sampled(query, sql_hash='h1'):
+    return {'sql_hash': sql_hash, 'query': query}
+
+
+def test_no_limit_replays_everything():
+    policy = ReplayPolicy()
+
+    assert all(policy.should_replay(sampled('select 1')) for _ in range(5))
+    assert policy.replayed == {'h1': 5}
+    assert policy.skipped == {}
+
+
+def test_only_first_distinct_variants_are_replayed():
+    policy = ReplayPolicy(max_variants=2)
+    queries = ['select 1', 'select 1', 'select 2', 'select 3', 'select 2']
+
+    assert [policy.should_replay(sampled(query)) for query in queries] == [True, False, True, False, False]
+    assert policy.should_replay(sampled('select 3', sql_hash='h2'))
+    assert policy.replayed == {'h1': 2, 'h2': 1}
+    assert policy.skipped == {'h1': 3}
+
+
+def test_replay_stops_after_consecutive_successes():
+    policy = ReplayPolicy(stop_after_successes=2)
+
+    policy.record('h1', succeeded=True)
+    policy.record('h1', succeeded=False)
+    policy.record('h1', succeeded=True)
+    assert policy.should_replay(sampled('select 1'))
+
+    policy.record('h1', succeeded=True)
+    assert not policy.should_replay(sampled('select 2'))
+    assert policy.should_replay(sampled('select 2', sql_hash='h2'))
+    assert policy.skipped == {'h1': 1}
+
+
+def test_skip_is_counted():
+    policy = ReplayPolicy()
+
+    policy.skip('h1')
+    policy.skip('h1')
+    assert policy.skipped == {'h1': 2}
+    assert policy.replayed == {}
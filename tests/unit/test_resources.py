@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import time
+
+from resources import ResourceManager
+
+
+class FakePool:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def new_manager(clock, secret_ttl=300, pool_idle_timeout=600):
+    secrets = []
+
+    def load_secret():
+        secrets.append({'username': 'admin', 'password': f'password{len(secrets)}'})
+        return secrets[-1]
+
+    manager = ResourceManager(load_secret, make_client=lambda name: object(), secret_ttl=secret_ttl,
+                              pool_idle_timeout=pool_idle_timeout, clock=clock)
+    return manager, secrets
+
+
+def test_secret_is_cached_until_its_ttl(clock):
+    manager, secrets = new_manager(clock, secret_ttl=300)
+
+    first = manager.secret()
+    clock.now = 299
+    assert manager.secret() is first
+    clock.now = 300
+    assert manager.secret()['password'] == 'password1'
+    assert manager.secret_loads == 2
+
+
+def test_refused_secret_is_read_again_once(clock):
+    manager, secrets = new_manager(clock)
+
+    refused = manager.secret()
+    manager.invalidate_secret(refused)
+    rotated = manager.secret()
+    # Another connection refused with the same old credentials does not read the secret again
+    manager.invalidate_secret(refused)
+
+    assert manager.secret() is rotated
+    assert rotated['password'] == 'password1'
+    assert len(secrets) == 2
+
+
+def test_secret_may_be_loaded_with_a_client_of_the_manager(clock):
+    manager = None
+
+    def load_secret():
+        manager.client('secretsmanager')
+        return {'username': 'admin', 'password': 'password0'}
+
+    manager = ResourceManager(load_secret, make_client=lambda name: object(), clock=clock)
+    loaded = []
+    thread = threading.Thread(target=lambda: loaded.append(manager.secret()), daemon=True)
+    thread.start()
+    thread.join(5)
+
+    assert loaded == [{'username': 'admin', 'password': 'password0'}]
+
+
+def test_clients_are_made_once(clock):
+    manager, _ = new_manager(clock)
+
+    assert manager.client('s3') is manager.client('s3')
+    assert manager.client('s3') is not manager.client('secretsmanager')
+
+
+def test_returned_pool_is_leased_again(clock):
+    manager, _ = new_manager(clock)
+
+    pool = manager.lease_pool('writer', FakePool)
+    # A pool in use is not shared with another subtask
+    other = manager.lease_pool('writer', FakePool)
+    manager.return_pool('writer', pool)
+
+    assert other is not pool
+    assert manager.lease_pool('writer', FakePool) is pool
+    assert manager.lease_pool('reader', FakePool) is not pool
+
+
+def test_closed_pool_is_not_kept(clock):
+    manager, _ = new_manager(clock)
+
+    pool = manager.lease_pool('writer', FakePool)
+    pool.close()
+    manager.return_pool('writer', pool)
+
+    assert manager.lease_pool('writer', FakePool) is not pool
+
+
+def test_unused_pool_is_closed_after_the_idle_timeout(clock):
+    manager, _ = new_manager(clock, pool_idle_timeout=600)
+
+    pool = manager.lease_pool('writer', FakePool)
+    manager.return_pool('writer', pool)
+    clock.now = 600
+
+    assert manager.lease_pool('writer', FakePool) is not pool
+    assert pool.closed
+
+
+def test_unused_pool_is_closed_without_another_lease(clock):
+    manager = ResourceManager(load_secret=dict, make_client=lambda name: object(), pool_idle_timeout=600,
+                              sweep_interval=0.01, clock=clock)
+    manager.start()
+
+    async def lease_and_return():
+        pool = manager.lease_pool('writer', FakePool)
+        manager.return_pool('writer', pool)
+        return pool
+
+    try:
+        pool = manager.run(lease_and_return())
+        clock.now = 600
+        for _ in range(500):
+            if pool.closed:
+                break
+            time.sleep(0.01)
+        swept = pool.closed
+    finally:
+        manager.close()
+
+    assert swept
+
+
+def test_coroutines_share_one_event_loop_thread(clock):
+    manager, _ = new_manager(clock)
+    manager.start()
+
+    async def current():
+        return asyncio.get_running_loop(), threading.current_thread()
+
+    try:
+        first = manager.run(current())
+        second = manager.run(current())
+    finally:
+        manager.close()
+
+    assert first == second
+    assert first[1] is not threading.current_thread()
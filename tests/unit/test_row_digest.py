@@ -0,0 +1,28 @@
+from decimal import Decimal
+
+from row_digest import RowDigest
+
+
+def digest(rows):
+    row_digest = RowDigest()
+    for row in rows:
+        row_digest.add(row)
+    return row_digest.hexdigest()
+
+
+def test_row_order_does_not_matter():
+    rows = [(1, 'a', None), (2, 'b', Decimal('1.50')), (3, b'\x00', 2.5)]
+
+    assert digest(rows) == digest(list(reversed(rows)))
+
+
+def test_duplicates_and_values_change_the_digest():
+    assert digest([(1, 'a'), (1, 'a')]) != digest([(1, 'a')])
+    assert digest([('ab', 'c')]) != digest([('a', 'bc')])
+    assert digest([(None,)]) != digest([('None',)])
+    assert digest([(Decimal('1.5'),)]) != digest([(Decimal('1.50'),)])
+    assert digest([('a',)]) != digest([('A',)])
+
+
+def test_empty_result_set():
+    assert digest([]) == '0:' + '0' * 32
@@ -0,0 +1,69 @@
+import gzip
+import io
+
+import pytest
+
+from s3_stream import S3StreamReader, open_gzip_object
+
+
+class FakeS3Client:
+    def __init__(self, objects):
+        self.objects = objects
+
+    def get_object(self, Bucket, Key, Range='bytes=0-', IfMatch=None):
+        offset = int(Range[len('bytes='):-1])
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)][offset:]), 'ETag': '"etag"'}
+
+
+def test_reader_returns_whole_body_with_bounded_queue():
+    data = bytes(range(256)) * 1000
+    reader = S3StreamReader(io.BytesIO(data), chunk_size=1000, max_chunks=2)
+
+    assert reader.read() == data
+    reader.close()
+
+
+def test_open_gzip_object_streams_multi_member_files():
+    lines = [f'line {i}\n'.encode('utf-8') for i in range(5000)]
+    body = gzip.compress(b''.join(lines[:2500])) + gzip.compress(b''.join(lines[2500:]))
+    s3 = FakeS3Client({('bucket', 'audit-log/a.gz'): body})
+
+    with open_gzip_object(s3, 'bucket', 'audit-log/a.gz', chunk_size=512, max_chunks=2) as gz_file:
+        assert list(gz_file) == lines
+
+
+def test_reader_raises_download_errors():
+    class BrokenBody:
+        def read(self, size):
+            raise IOError('connection reset')
+
+        def close(self):
+            pass
+
+    reader = S3StreamReader(BrokenBody())
+    with pytest.raises(IOError, match='connection reset'):
+        reader.read()
+    reader.close()
+
+
+def test_reader_resumes_after_dropped_connection():
+    data = bytes(range(256)) * 100
+
+    class DroppingBody:
+        def __init__(self, data):
+            self.body = io.BytesIO(data)
+            self.reads = 0
+
+        def read(self, size):
+            self.reads += 1
+            if self.reads == 3:
+                raise IOError('connection reset')
+            return self.body.read(size)
+
+        def close(self):
+            pass
+
+    reader = S3StreamReader(DroppingBody(data), chunk_size=1000, reopen=lambda offset: io.BytesIO(data[offset:]))
+
+    assert reader.read() == data
+    reader.close()
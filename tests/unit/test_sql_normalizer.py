@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+from sql_normalizer import mask_sql, parameterize_sql, sql_fingerprint
+
+with open(os.path.join(os.path.dirname(__file__), 'data', 'sql_normalizer_golden.json'), encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+
+# Masks and hashes produced by the former regular expression chain, they must never change
+@pytest.mark.parametrize('case', GOLDEN['unchanged'], ids=lambda case: case['query'][:40])
+def test_fingerprint_is_stable(case):
+    sql_mask = mask_sql(case['query'])
+
+    assert sql_mask == case['sql_mask']
+    assert sql_fingerprint(sql_mask) == case['sql_hash']
+
+
+# Literals the regular expressions missed or mangled
+@pytest.mark.parametrize('case', GOLDEN['extended'], ids=lambda case: case['query'][:40])
+def test_extended_masking(case):
+    sql_mask = mask_sql(case['query'])
+
+    assert sql_mask == case['sql_mask']
+    assert sql_fingerprint(sql_mask) == case['sql_hash']
+
+
+def test_subtraction_is_not_masked_as_negative_number():
+    assert mask_sql('select a - 5, b-6 from t where c = -7') == 'select a - 1, b-1 from t where c = 1'
+
+
+def test_null_is_kept_in_null_predicates():
+    assert mask_sql('select * from t where a is null and b is not NULL and c = null') == \
+        'select * from t where a is null and b is not NULL and c = 1'
+
+
+@pytest.mark.parametrize('queries', [
+    ['select * from t where id in (1)', 'select * from t where id IN (1, 2, 3)', "SELECT * FROM `t` WHERE `id` in ('a','b')"],
+    ['insert into t (a, b) values (1, now())', "INSERT INTO t (a,b) VALUES (1,now()), ( 2, now() ),(3,now())"],
+    ["insert into t (a, b) values (1, NULL), (2, 'a')", "insert into t (a, b) values (3, 'b'), (4, NULL), (5, 'c')",
+     "insert into t (a, b) values (6, 'd'), (7, 'e'), (8, null), (9, -1)"],
+])
+def test_version_2_shares_fingerprint_across_list_lengths(queries):
+    assert len({mask_sql(query, version=2) for query in queries}) == 1
+    assert len({mask_sql(query) for query in queries}) == len(queries)
+
+
+def test_version_2_canonical_text():
+    assert mask_sql("select `a` from t where b not in (1, 'x') and c in (select d from u) order by a desc", version=2) == \
+        "SELECT a FROM t WHERE b NOT IN (...) AND c IN (SELECT d FROM u) ORDER BY a DESC"
+    assert mask_sql("insert into t values (1, 'a'), (2, null)", version=2) == "INSERT INTO t VALUES (1, 1)"
+    assert mask_sql("insert into t values (1, 'a'), (2, 'b')", version=2) == "INSERT INTO t VALUES (1, '')"
+
+
+def test_unknown_version_is_rejected():
+    with pytest.raises(ValueError):
+        mask_sql('select 1', version=3)
+
+
+def test_parameterized_template_holds_the_masked_literals():
+    template, literals = parameterize_sql(
+        "select * from t where a = 'it''s' and b in (1, -2, 0x1F) and c is null and d = null and e = \"q\" limit 10")
+
+    assert template == 'select * from t where a = ? and b in (?, ?, ?) and c is null and d = ? and e = ? limit ?'
+    assert literals == ["'it''s'", '1', '-2', '0x1F', 'null', '"q"', '10']
+
+
+def test_parameterized_template_keeps_literals_that_cannot_be_parameters():
+    query = "select a - 5, N'x', _utf8mb4'y' /* 7 */ from t where d > date '2024-01-01' order by 1"
+
+    template, literals = parameterize_sql(query)
+
+    assert template == "select a - ?, N'x', _utf8mb4'y' /* 7 */ from t where d > date '2024-01-01' order by 1"
+    assert literals == ['5']
+
+
+@pytest.mark.parametrize('query, template, literals', [
+    ("select sum(a) AS 'total' from t where b = 2", "select sum(a) AS 'total' from t where b = ?", ['2']),
+    ('select cast(a as decimal(10,2)) from t where b = 3', 'select cast(a as decimal(10,2)) from t where b = ?', ['3']),
+    ('create table t (a char(20), b DECIMAL( 10, 2 ))', 'create table t (a char(20), b DECIMAL( 10, 2 ))', []),
+    ("select cast(x AS CHAR(20)) from t where v = 'x'", 'select cast(x AS CHAR(20)) from t where v = ?', ["'x'"]),
+    ('select .5 from t where a = 7', 'select .5 from t where a = ?', ['7']),
+    ('select 1.5e3, -2.5E-3 from t where a = 7', 'select 1.5e3, -2.5E-3 from t where a = ?', ['7']),
+    ("select 'a' 'b', 'c' from t", "select 'a' 'b', ? from t", ["'c'"]),
+    ("select 'it''s' /* c */ \"x\" from t where d = 'e'", "select 'it''s' /* c */ \"x\" from t where d = ?", ["'e'"]),
+], ids=['alias', 'cast_decimal', 'type_lengths', 'cast_char', 'leading_dot', 'exponent', 'adjacent_strings',
+        'strings_across_comment'])
+def test_parameterized_template_keeps_literals_the_server_cannot_prepare(query, template, literals):
+    assert parameterize_sql(query) == (template, literals)
@@ -0,0 +1,93 @@
+import re
+
+from audit_log import parse_chunk, select_logs
+from replay_policy import ReplayPolicy
+from sql_sample import FINDINGS_REPORTER, OWNER, claim_sql_sample, write_sql_sample
+
+PREFIX = b'2024-10-09T00:00:00.000Z 1728432000123456,ip-10-0-0-1,app,10.0.1.15,1201,88231,'
+
+
+class FakeTable:
+    """Sample table applying the if_not_exists and add clauses of the update expressions."""
+
+    def __init__(self):
+        self.items = {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                    ReturnValues='NONE'):
+        item = self.items.setdefault((Key['task_id'], Key['sql_hash']), dict(Key))
+        names, values = ExpressionAttributeNames, ExpressionAttributeValues
+        for name, value in re.findall(r'(#\w+) = if_not_exists\(\1, (:\w+)\)', UpdateExpression):
+            item.setdefault(names[name], values[value])
+        _, _, added = UpdateExpression.partition('add ')
+        for name, value in re.findall(r'(#\w+) (:\w+)', added):
+            item[names[name]] = item.get(names[name], 0) + values[value]
+        return {'Attributes': dict(item)} if ReturnValues == 'ALL_NEW' else {}
+
+
+class State:
+    def __init__(self):
+        self.total_count = 0
+        self.sql_count = {}
+        self.sample_query = []
+        self.owned = {}
+        self.findings_owned = {}
+        self.static_errors = set()
+        self.replay_policy = ReplayPolicy()
+        self.verdicts = None
+
+
+def run_subtask(table, s3_object_key, data, check_percent):
+    """Select the logs of a subtask like the agent does, then write its samples."""
+    state = State()
+
+    def claim(log, attribute=OWNER):
+        return claim_sql_sample(table, 'task', s3_object_key, log, attribute)
+
+    def report_findings(state, log, findings):
+        if log['sql_hash'] not in state.findings_owned:
+            state.findings_owned[log['sql_hash']] = claim(log, FINDINGS_REPORTER)
+
+    logs = list(select_logs(state, [parse_chunk(data, replay_statements=('select',))], check_percent, claim,
+                            report_findings))
+    for log in state.sample_query:
+        write_sql_sample(table, 'task', state, log)
+    return state, logs
+
+
+def test_reporting_findings_does_not_take_the_replay_from_another_subtask():
+    # The GROUP BY is reported as a warning, the fingerprint is only a replay candidate at its 10th occurrences
+    query = b"QUERY,shop,'select a, count(*) from t group by a',0\n"
+    table = FakeTable()
+
+    first, first_logs = run_subtask(table, 'a.gz', (PREFIX + query) * 3, check_percent=1)
+    second, second_logs = run_subtask(table, 'b.gz', (PREFIX + query) * 50, check_percent=1)
+
+    sql_hash = first.sample_query[0]['sql_hash']
+    item = table.items[('task', sql_hash)]
+    assert first_logs == []
+    assert len(second_logs) == 5
+    assert second.replay_policy.skipped == {}
+    assert item[OWNER] == 'b.gz'
+    assert item[FINDINGS_REPORTER] == 'a.gz'
+    assert second.findings_owned == {sql_hash: False}
+    assert (item['occurrence_count'], item['replay_count'], item['replay_skipped_count']) == (53, 5, 0)
+    assert item['sql_sample'] == 'select a, count(*) from t group by a'
+
+
+def test_counters_do_not_claim_the_fingerprint():
+    table = FakeTable()
+    log = {'sql_hash': 'h1', 'sql_mask': 'select 1', 'query': 'select 1', 'database': 'shop'}
+    state = State()
+    state.sql_count['h1'] = 2
+
+    write_sql_sample(table, 'task', state, log)
+    write_sql_sample(table, 'task', state, log)
+
+    assert table.items[('task', 'h1')] == {
+        'task_id': 'task', 'sql_hash': 'h1', 'sql_mask': 'select 1', 'sql_sample': 'select 1', 'database': 'shop',
+        'occurrence_count': 4, 'replay_count': 0, 'replay_skipped_count': 0
+    }
+    assert claim_sql_sample(table, 'task', 'b.gz', log)
+    assert claim_sql_sample(table, 'task', 'b.gz', log)
+    assert not claim_sql_sample(table, 'task', 'c.gz', log)
@@ -0,0 +1,32 @@
+import time
+
+from sqs_heartbeat import VisibilityHeartbeat
+
+
+class FakeSQS:
+    def __init__(self):
+        self.calls = []
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        self.calls.append(VisibilityTimeout)
+
+
+def test_heartbeat_extends_visibility_until_stopped():
+    sqs = FakeSQS()
+
+    with VisibilityHeartbeat(sqs, 'queue', 'handle', visibility_timeout=300, interval=0.01):
+        time.sleep(0.1)
+    calls = len(sqs.calls)
+    time.sleep(0.05)
+
+    assert calls >= 2
+    assert set(sqs.calls) == {300}
+    assert len(sqs.calls) == calls
+
+
+def test_release_makes_message_visible():
+    sqs = FakeSQS()
+
+    VisibilityHeartbeat(sqs, 'queue', 'handle', visibility_timeout=300).start().release()
+
+    assert sqs.calls == [0]
@@ -0,0 +1,34 @@
+from statement_cache import StatementCache
+
+
+def test_statements_get_unique_names():
+    cache = StatementCache(capacity=4)
+
+    first = cache.next_name()
+    cache.add(('db', 'select ?'), first)
+
+    assert cache.get(('db', 'select ?')) == (first, None)
+    assert cache.next_name() != first
+    assert cache.get(('other', 'select ?')) is None
+
+
+def test_least_recently_used_statement_is_evicted():
+    cache = StatementCache(capacity=2)
+    cache.add('a', 's1')
+    cache.add('b', 's2')
+    cache.get('a')
+
+    evicted = cache.add('c', 's3')
+
+    assert evicted == 's2'
+    assert cache.get('b') is None
+    assert cache.get('a') == ('s1', None)
+
+
+def test_refused_templates_are_kept_with_their_error():
+    cache = StatementCache(capacity=1)
+    error = RuntimeError('syntax')
+    cache.add('a', None, error)
+
+    assert cache.get('a') == (None, error)
+    assert cache.add('b', 's2') is None
@@ -0,0 +1,52 @@
+import pytest
+
+from static_analyzer import ERROR, WARNING, analyze
+
+
+@pytest.mark.parametrize('query, rule', [
+    ('select rank, cnt from scores', 'reserved-word'),
+    ('select * from t where system = 1', 'reserved-word'),
+    ("select password('secret')", 'removed-function'),
+    ("select ENCODE(name, 'k') from users", 'removed-function'),
+    ('select a, count(*) from t group by a desc', 'group-by-sort'),
+    ('select sql_cache * from t', 'sql-cache'),
+    ('select @@tx_isolation', 'removed-variable'),
+    ('select @@session.query_cache_type', 'removed-variable'),
+    ("set session tx_isolation = 'READ-COMMITTED'", 'removed-variable'),
+])
+def test_errors_are_found(query, rule):
+    assert [(severity, found) for severity, found, _ in analyze(query)] == [(ERROR, rule)]
+
+
+@pytest.mark.parametrize('query, rule', [
+    ('select a, count(*) from t group by a', 'group-by-implicit-sort'),
+    ('select sql_no_cache * from t order by a', 'sql-cache'),
+])
+def test_warnings_are_found(query, rule):
+    assert [(severity, found) for severity, found, _ in analyze(query)] == [(WARNING, rule)]
+
+
+@pytest.mark.parametrize('query', [
+    'select `rank`, s.system from scores s',
+    'select rank() over (order by score) from scores',
+    "select 'rank, group by a desc, password(x)' from t -- rank",
+    'select u.password(1) from t',
+    'select a, count(*) from t group by a order by a',
+    'select * from (select a from t group by a) x order by a',
+    'select a from t order by a desc',
+    'create function f() returns int return 1',
+    'update t set a = 1 where b in (select c from u group by c)',
+    'INSERT INTO area (id, name) VALUES (1, 2)',
+    "insert into password(user_id, hash) values (1, 'x')",
+    'INSERT INTO x(a) VALUES (1)',
+    'create table area (id int)',
+    'alter table t add key x (a)',
+    "LOAD DATA INFILE 'f.csv' INTO TABLE t IGNORE 1 ROWS",
+    'select sum(a) over (order by b rows between 1 preceding and current row) from t order by b',
+    'with recursive n as (select 1) select * from n',
+    'select a from t for update of t',
+    'GRANT EXECUTE ON FUNCTION db.f TO u',
+    'revoke execute on procedure db.p from u',
+])
+def test_compatible_queries_have_no_findings(query):
+    assert analyze(query) == []
@@ -0,0 +1,92 @@
+import pytest
+
+from validation import (COMPARE, EXECUTE, EXECUTE_PREPARED, EXPLAIN, PREPARE, batch_statements, batch_text,
+                        checked_count, execute_statement, group_by_database, prepare_statement,
+                        replayable_statements, session_init_statements, validation_statements)
+
+
+def escape(value):
+    return "'" + value.replace("'", "\\'") + "'"
+
+
+def test_execute_mode_runs_the_query():
+    assert validation_statements('select 1', EXECUTE, escape) == ['select 1']
+
+
+def test_explain_mode_plans_the_query():
+    assert validation_statements('delete from t where id = 1', EXPLAIN, escape) == ['EXPLAIN delete from t where id = 1']
+
+
+def test_prepare_mode_prepares_a_quoted_query():
+    assert validation_statements("update t set v = 'a'", PREPARE, escape) == [
+        "PREPARE queries_check_stmt FROM 'update t set v = \\'a\\''",
+        'DEALLOCATE PREPARE queries_check_stmt',
+    ]
+
+
+def test_dml_is_only_replayed_without_executing():
+    assert 'update' not in replayable_statements(EXECUTE)
+    assert 'update' not in replayable_statements(EXECUTE_PREPARED)
+    assert 'update' not in replayable_statements(COMPARE)
+    assert 'update' in replayable_statements(EXPLAIN)
+    assert 'update' in replayable_statements(PREPARE)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        replayable_statements('dry-run')
+
+
+def test_session_limits_execution_time_and_writes():
+    assert session_init_statements(EXECUTE, 30) == ('SET SESSION max_execution_time = 30000',
+                                                    'SET SESSION TRANSACTION READ ONLY')
+    assert session_init_statements(EXPLAIN, 1.5) == ('SET SESSION max_execution_time = 1500',)
+    assert session_init_statements(EXECUTE_PREPARED, 30)[-1] == 'SET SESSION TRANSACTION READ ONLY'
+
+
+def test_prepared_statement_is_executed_with_the_literals():
+    assert prepare_statement('s1', "select ? from t where v = ?", escape) == "PREPARE s1 FROM 'select ? from t where v = ?'"
+    assert execute_statement('s1', ['1', "'a'"]) == (
+        "SET @queries_check_p1 = 1, @queries_check_p2 = 'a'; EXECUTE s1 USING @queries_check_p1, @queries_check_p2")
+    assert execute_statement('s1', []) == 'EXECUTE s1'
+
+
+def test_batch_checks_each_query_in_order():
+    statements, owners = batch_statements(['select 1;', 'delete from t'], EXPLAIN, escape)
+
+    assert statements == ['EXPLAIN select 1', 'EXPLAIN delete from t']
+    assert owners == [0, 1]
+
+
+def test_batch_prepares_queries_holding_a_separator():
+    statements, owners = batch_statements(["select ';'", 'select 1; drop table t'], EXPLAIN, escape)
+
+    assert statements == ["PREPARE queries_check_stmt FROM 'select \\';\\''", 'DEALLOCATE PREPARE queries_check_stmt',
+                          "PREPARE queries_check_stmt FROM 'select 1; drop table t'", 'DEALLOCATE PREPARE queries_check_stmt']
+    assert owners == [0, 0, 1, 1]
+
+
+def test_trailing_comment_does_not_hide_the_next_statements():
+    statements, _ = batch_statements(['select 1 -- first', 'select 2 # second', 'select 3'], EXPLAIN, escape)
+
+    lines = batch_text(statements).split('\n')
+
+    # Every separator and statement is on a line of its own, out of reach of the comments
+    assert lines == ['EXPLAIN select 1 -- first', ';', 'EXPLAIN select 2 # second', ';', 'EXPLAIN select 3']
+
+
+def test_queries_without_a_result_are_not_checked():
+    _, owners = batch_statements(['select 1', 'select 2', 'select 3'], PREPARE, escape)
+
+    # The server answered the PREPARE and DEALLOCATE of the first query and the PREPARE of the second
+    assert checked_count(owners, 3, 3) == 1
+    assert checked_count(owners, 6, 3) == 3
+    assert checked_count(owners, 0, 3) == 0
+
+
+def test_logs_are_grouped_by_database():
+    logs = [{'database': db, 'query': str(i)} for i, db in enumerate(['a', 'b', 'a', 'a', 'b', 'a'])]
+
+    batches = group_by_database(logs, batch_size=2)
+
+    assert [[log['query'] for log in batch] for batch in batches] == [['0', '2'], ['1', '4'], ['3', '5']]
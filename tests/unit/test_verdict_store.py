@@ -0,0 +1,45 @@
+from verdict_store import FAIL, PASS, VerdictStore
+
+
+class FakeLookup:
+    def __init__(self, verdicts):
+        self.verdicts = verdicts
+        self.calls = []
+
+    def __call__(self, sql_hash, target):
+        self.calls.append((sql_hash, target))
+        return self.verdicts.get((sql_hash, target))
+
+
+def test_known_pass_is_looked_up_once_per_fingerprint():
+    lookup = FakeLookup({('h1', 'db#8.0.32#execute'): PASS, ('h2', 'db#8.0.32#execute'): FAIL})
+    store = VerdictStore(lookup, 'db', 'execute')
+    store.set_version('8.0.32')
+
+    assert store.is_known_pass('h1')
+    assert store.is_known_pass('h1')
+    assert not store.is_known_pass('h2')
+    assert not store.is_known_pass('h3')
+    assert [sql_hash for sql_hash, _ in lookup.calls] == ['h1', 'h2', 'h3']
+
+
+def test_nothing_is_skipped_without_version_or_on_revalidate():
+    lookup = FakeLookup({('h1', 'db#8.0.32#execute'): PASS})
+
+    assert not VerdictStore(lookup, 'db', 'execute').is_known_pass('h1')
+
+    store = VerdictStore(lookup, 'db', 'execute', revalidate=True)
+    store.set_version('8.0.32')
+    assert not store.is_known_pass('h1')
+    assert lookup.calls == []
+
+
+def test_a_failed_replay_fails_the_fingerprint():
+    store = VerdictStore(FakeLookup({}), 'db', 'explain')
+
+    store.record('h1', succeeded=True)
+    store.record('h1', succeeded=False, message='syntax error')
+    store.record('h1', succeeded=True)
+    store.record('h2', succeeded=True)
+
+    assert store.results == {'h1': (FAIL, 'syntax error'), 'h2': (PASS, '')}